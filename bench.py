@@ -0,0 +1,1528 @@
+# -*- coding: utf-8 -*-
+"""Offline replay harness and benchmarks for bot.py
+
+Drives the real handlers from bot.py with synthetic or recorded event streams
+against an in-process fake gateway/HTTP layer, so no Discord connection is needed.
+
+Usage:
+    python bench.py                          # run every scenario
+    python bench.py member_join message -n 2000   # run selected scenarios
+    python bench.py --events recorded.jsonl  # replay a recorded stream
+    python bench.py --json out.json --baseline old.json --tolerance 0.2
+"""
+import argparse
+import asyncio
+import contextlib
+import gc
+import hashlib
+import io
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+import discord
+from aiohttp import web
+
+# Keep the local store out of the working tree
+os.environ.setdefault('BOT_DATA_DIR', tempfile.mkdtemp(prefix='bot-bench-'))
+
+import bot as botmod
+
+# Fake HTTP layer
+class FakeHTTP:
+    """Stands in for Discord's REST API, counting calls by route"""
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = defaultdict(int)
+
+    async def call(self, route):
+        self.calls[route] += 1
+        await asyncio.sleep(self.latency)
+
+    def reset(self):
+        self.calls.clear()
+
+_ids = itertools.count(10_000_000)
+
+def next_id():
+    return next(_ids)
+
+class FakeAsset:
+    def __init__(self, path, key=None):
+        self.path = path
+        self.key = key or path
+
+    @property
+    def url(self):
+        return asset_server.base + self.path
+
+    def with_size(self, size):
+        return self
+
+    def with_static_format(self, format):
+        return self
+
+    async def read(self):
+        return avatar_png()
+
+_avatar_png = None
+
+def avatar_png():
+    """A small PNG avatar, generated once (empty without Pillow)"""
+    global _avatar_png
+    if _avatar_png is None:
+        _avatar_png = b''
+        if botmod.Image is not None:
+            output = io.BytesIO()
+            botmod.Image.new('RGB', (256, 256), (88, 101, 242)).save(output, 'PNG')
+            _avatar_png = output.getvalue()
+    return _avatar_png
+
+class AssetServer:
+    """Local stand-in for the CDN: serves avatars and files with ETags and counts what it sends"""
+
+    def __init__(self):
+        self.base = "https://cdn.example"
+        self.runner = None
+        self.latency = 0.0
+        self.requests = 0
+        self.not_modified = 0
+        self.bytes_sent = 0
+
+    async def start(self):
+        if self.runner is None:
+            app = web.Application()
+            app.router.add_get('/{path:.*}', self.handle)
+            self.runner = web.AppRunner(app, access_log=None)
+            await self.runner.setup()
+            await web.TCPSite(self.runner, '127.0.0.1', 0).start()
+            host, port = self.runner.addresses[0][:2]
+            self.base = f"http://{host}:{port}"
+        self.requests = self.not_modified = self.bytes_sent = 0
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+            self.base = "https://cdn.example"
+
+    async def handle(self, request):
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        if request.path.startswith('/avatars/'):
+            body = avatar_png()
+        else:
+            # Files are /files/<name>/<kb>, filled with bytes derived from the name
+            _, _, name, kb = request.path.split('/')
+            body = hashlib.sha256(name.encode()).digest() * (int(kb) * 32)
+        etag = '"%s"' % hashlib.sha256(body).hexdigest()[:16]
+        if request.headers.get('If-None-Match') == etag:
+            self.not_modified += 1
+            return web.Response(status=304, headers={'ETag': etag})
+        self.bytes_sent += len(body)
+        return web.Response(body=body, content_type='image/png', headers={'ETag': etag})
+
+asset_server = AssetServer()
+
+class FakePermissions:
+    def __init__(self, admin=False):
+        self.administrator = admin
+        self.manage_channels = admin
+        self.manage_messages = admin
+        self.manage_roles = admin
+        self.manage_guild = admin
+
+class FakeRole:
+    def __init__(self, guild, name, role_id=None, manage_channels=False, default=False):
+        self.guild = guild
+        self.id = role_id or next_id()
+        self.name = name
+        self.mention = f"<@&{self.id}>"
+        self.color = discord.Color.default()
+        self.mentionable = False
+        self.members = []
+        self.permissions = FakePermissions(manage_channels)
+        self.managed = False
+        self.position = 0 if default else len(guild.roles) if guild and hasattr(guild, 'roles') else 1
+        self._default = default
+
+    def __ge__(self, other):
+        return self.position >= other.position
+
+    def is_default(self):
+        return self._default
+
+    def __hash__(self):
+        return hash(self.id)
+
+class FakeMember:
+    def __init__(self, guild, user_id=None, name=None, admin=False, bot=False):
+        self.guild = guild
+        self.id = user_id or next_id()
+        self.name = name or f"user{self.id}"
+        self.display_name = self.name
+        self.global_name = None
+        self.nick = None
+        self.discriminator = "0"
+        self.mention = f"<@{self.id}>"
+        self.bot = bot
+        self.avatar = None
+        self.display_avatar = FakeAsset(f"/avatars/{self.id}.png")
+        self.default_avatar = self.display_avatar
+        self.created_at = datetime.now(timezone.utc) - timedelta(days=400)
+        self.joined_at = datetime.now(timezone.utc) - timedelta(days=30)
+        self.roles = [guild.default_role] if guild and guild.default_role else []
+        self.guild_permissions = FakePermissions(admin)
+        self.flags = discord.MemberFlags()
+        self.dms_closed = False
+
+    @property
+    def top_role(self):
+        top = max(self.roles, key=lambda role: role.position)
+        if self.bot:
+            # The bench bot outranks every role
+            top = FakeRole(None, "bot", role_id=0)
+            top.position = 1_000
+        return top
+
+    def __str__(self):
+        return self.name
+
+    def __hash__(self):
+        return hash(self.id)
+
+    async def send(self, *args, **kwargs):
+        await self.guild.http.call('send_dm')
+        if self.dms_closed:
+            raise discord.Forbidden(FakeResponse403(), {'code': 50007, 'message': 'Cannot send messages to this user'})
+        return FakeMessage(None, self.guild.me, kwargs.get('content', args[0] if args else ''))
+
+    async def create_dm(self):
+        await self.guild.http.call('create_dm')
+        return self
+
+    async def add_roles(self, *roles, reason=None, atomic=True):
+        for role in roles:
+            await self.guild.http.call('add_role')
+            if role not in self.roles:
+                self.roles.append(role)
+
+    async def remove_roles(self, *roles, reason=None, atomic=True):
+        for role in roles:
+            await self.guild.http.call('remove_role')
+            if role in self.roles:
+                self.roles.remove(role)
+
+class FakeMessage:
+    def __init__(self, channel, author, content="", embeds=None):
+        self.id = next_id()
+        self._state = botmod.bot._connection
+        self.channel = channel
+        self.guild = channel.guild if channel else None
+        self.author = author
+        self.content = content or ""
+        self.embeds = embeds or []
+        self.attachments = []
+        self.created_at = datetime.now(timezone.utc)
+        self.edited_at = None
+
+    async def edit(self, **kwargs):
+        await self.guild.http.call('edit')
+        if 'content' in kwargs:
+            self.content = kwargs['content']
+        if kwargs.get('embed') is not None:
+            self.embeds = [kwargs['embed']]
+
+    async def reply(self, content=None, **kwargs):
+        return await self.channel.send(content, **kwargs)
+
+    async def add_reaction(self, emoji):
+        await self.guild.http.call('add_reaction')
+
+    async def delete(self):
+        await self.guild.http.call('delete_message')
+        self.channel.messages.pop(self.id, None)
+
+class FakeRawMessageUpdate:
+    def __init__(self, before, after):
+        self.message_id = after.id
+        self.channel_id = after.channel.id
+        self.guild_id = after.guild.id
+        self.cached_message = before
+        self.message = after
+
+class FakePartialMessage:
+    def __init__(self, channel, message_id):
+        self.channel = channel
+        self.guild = channel.guild
+        self.id = message_id
+
+    async def edit(self, **kwargs):
+        message = self.channel.messages.get(self.id)
+        if message is None:
+            await self.guild.http.call('edit')
+            raise discord.NotFound(FakeResponse404(), "Unknown Message")
+        await message.edit(**kwargs)
+
+class FakeCategory:
+    def __init__(self, guild, category_id=None, name="Tickets"):
+        self.guild = guild
+        self.id = category_id or next_id()
+        self.name = name
+        self.channels = []
+        self.type = discord.ChannelType.category
+        self.category = None
+        self.mention = f"<#{self.id}>"
+        self.overwrites = {}
+        self.position = 0
+
+class FakeTextChannel:
+    def __init__(self, guild, channel_id=None, name="general", category=None, topic=None):
+        self.guild = guild
+        self.id = channel_id or next_id()
+        self.name = name
+        self.mention = f"<#{self.id}>"
+        self.category = category
+        self.topic = topic
+        self.type = discord.ChannelType.text
+        self.messages = {}
+
+    @property
+    def category_id(self):
+        return self.category.id if self.category else None
+
+    async def send(self, content=None, **kwargs):
+        await self.guild.http.call('send')
+        embeds = [kwargs['embed']] if kwargs.get('embed') is not None else kwargs.get('embeds')
+        message = FakeMessage(self, self.guild.me, content, embeds)
+        self.messages[message.id] = message
+        return message
+
+    async def fetch_message(self, message_id):
+        await self.guild.http.call('fetch_message')
+        try:
+            return self.messages[message_id]
+        except KeyError:
+            raise discord.NotFound(FakeResponse404(), "Unknown Message")
+
+    def get_partial_message(self, message_id):
+        return FakePartialMessage(self, message_id)
+
+    async def history(self, limit=100, before=None, after=None, oldest_first=None):
+        # Pages of 100 like the real API
+        messages = sorted(self.messages.values(), key=lambda m: m.id, reverse=not oldest_first)
+        if before is not None:
+            before_id = getattr(before, 'id', before)
+            messages = [m for m in messages if m.id < before_id]
+        if after is not None:
+            after_id = getattr(after, 'id', after)
+            messages = [m for m in messages if m.id > after_id]
+        if limit is not None:
+            messages = messages[:limit]
+        for index, message in enumerate(messages):
+            if index % 100 == 0:
+                await self.guild.http.call('history')
+            yield message
+
+    async def delete(self, reason=None):
+        await self.guild.http.call('delete_channel')
+        self.guild._remove_channel(self)
+
+    async def create_thread(self, name, type=None, invitable=True, auto_archive_duration=None, reason=None, message=None):
+        await self.guild.http.call('create_thread')
+        thread = FakeThread(self, name)
+        self.guild.threads_by_id[thread.id] = thread
+        return thread
+
+    async def set_permissions(self, target, **kwargs):
+        await self.guild.http.call('set_permissions')
+
+class FakeArchiveChannel(FakeTextChannel):
+    """Ticket channel whose history is generated page by page instead of kept in memory"""
+    def __init__(self, guild, author, message_total):
+        super().__init__(guild, name=f"ticket-{author.name}", topic=f"Ticket created by {author} ({author.id})")
+        self.author = author
+        self.message_total = message_total
+
+    async def history(self, limit=100, before=None, after=None, oldest_first=None):
+        total = self.message_total if limit is None else min(limit, self.message_total)
+        for index in range(total):
+            if index % 100 == 0:
+                await self.guild.http.call('history')
+            message = FakeMessage(self, self.author, f"Transcript line {index}: the quick brown fox jumps over the lazy dog")
+            message.id = 1_000_000 + index
+            yield message
+
+class FakeThread(FakeTextChannel):
+    """Private thread under a text channel, kept out of guild.get_channel like the real cache"""
+    def __init__(self, parent, name):
+        super().__init__(parent.guild, name=name)
+        self.parent = parent
+        self.type = discord.ChannelType.private_thread
+
+    @property
+    def category_id(self):
+        return self.parent.category_id
+
+    async def delete(self, reason=None):
+        await self.guild.http.call('delete_thread')
+        self.guild.threads_by_id.pop(self.id, None)
+
+class FakeResponse404:
+    status = 404
+    reason = "Not Found"
+
+class FakeResponse403:
+    status = 403
+    reason = "Forbidden"
+
+class FakeResponse400:
+    status = 400
+    reason = "Bad Request"
+
+CATEGORY_FULL_ERROR = {'code': 50035, 'message': 'Invalid Form Body', 'errors': {'parent_id': {'_errors': [
+    {'code': 'CHANNEL_PARENT_MAX_CHANNELS', 'message': 'Maximum number of channels in category reached (50)'}
+]}}}
+
+class FakeVoiceChannel:
+    def __init__(self, guild, name):
+        self.guild = guild
+        self.id = next_id()
+        self.name = name
+        self.mention = f"<#{self.id}>"
+        self.type = discord.ChannelType.voice
+        self.category = None
+
+class FakeVoiceState:
+    def __init__(self, channel):
+        self.channel = channel
+
+class FakeGuild:
+    """A guild with the channels bot.py expects already created"""
+    def __init__(self, http, guild_id=None, name="Bench Guild"):
+        self.http = http
+        self.id = guild_id or next_id()
+        self.name = name
+        self.default_role = None
+        self.default_role = FakeRole(self, "@everyone", role_id=self.id, default=True)
+        self.roles = [self.default_role, FakeRole(self, "Staff", manage_channels=True)]
+        self.members = {}
+        self.audit_entries = []
+        self.channels_by_id = {}
+        self.threads_by_id = {}
+        self.me = FakeMember(self, name="bench-bot", admin=True, bot=True)
+        self.members[self.me.id] = self.me
+        self.member_count = 1
+
+        for channel_id, name in [
+            (botmod.WELCOME_CHANNEL_ID, "welcome"),
+            (botmod.REVIEW_CHANNEL_ID, "reviews"),
+            (botmod.LOG_CHANNEL_ID, "logs"),
+            (botmod.TICKET_CHANNEL_ID, "tickets"),
+            (botmod.GUESS_CHANNEL_ID, "guess"),
+        ]:
+            self._add_channel(FakeTextChannel(self, channel_id, name))
+        self._add_channel(FakeCategory(self, botmod.TICKET_CATEGORY_ID, "Tickets"))
+        self.voice_channels = [FakeVoiceChannel(self, f"voice-{i}") for i in range(3)]
+
+    def _add_channel(self, channel):
+        self.channels_by_id[channel.id] = channel
+        if getattr(channel, 'category', None) is not None:
+            channel.category.channels.append(channel)
+
+    def _remove_channel(self, channel):
+        self.channels_by_id.pop(channel.id, None)
+        if getattr(channel, 'category', None) is not None and channel in channel.category.channels:
+            channel.category.channels.remove(channel)
+
+    @property
+    def channels(self):
+        return list(self.channels_by_id.values())
+
+    def get_channel(self, channel_id):
+        return self.channels_by_id.get(channel_id)
+
+    def get_channel_or_thread(self, channel_id):
+        return self.channels_by_id.get(channel_id) or self.threads_by_id.get(channel_id)
+
+    def get_member(self, user_id):
+        return self.members.get(user_id)
+
+    def get_role(self, role_id):
+        return next((r for r in self.roles if r.id == role_id), None)
+
+    async def fetch_member(self, user_id):
+        await self.http.call('fetch_member')
+        member = self.members.get(user_id)
+        if member is None:
+            raise discord.NotFound(FakeResponse404(), "Unknown Member")
+        return member
+
+    async def query_members(self, query=None, limit=5, user_ids=None, presences=False, cache=True):
+        await self.http.call('query_members')  # Gateway request, one per call
+        return [self.members[user_id] for user_id in user_ids or () if user_id in self.members][:limit]
+
+    async def audit_logs(self, limit=100, action=None, after=None):
+        """Newest first, or oldest first after an id, one request per 100 entries"""
+        entries = [e for e in self.audit_entries if action is None or e.action == action]
+        if after is not None:
+            entries = [e for e in entries if e.id > after.id]
+        else:
+            entries.reverse()
+        entries = entries[:limit]
+        for i in range(0, max(len(entries), 1), 100):
+            await self.http.call('audit_logs')
+            for entry in entries[i:i + 100]:
+                yield entry
+
+    def add_member(self, member):
+        self.members[member.id] = member
+        self.member_count = len(self.members)
+        return member
+
+    async def create_text_channel(self, name, category=None, overwrites=None, topic=None, reason=None):
+        await self.http.call('create_text_channel')
+        if category is not None and len(category.channels) >= 50:
+            raise discord.HTTPException(FakeResponse400(), CATEGORY_FULL_ERROR)
+        channel = FakeTextChannel(self, name=name, category=category, topic=topic)
+        self._add_channel(channel)
+        return channel
+
+    async def create_category(self, name, overwrites=None, position=None, reason=None):
+        await self.http.call('create_category')
+        category = FakeCategory(self, name=name)
+        category.overwrites = overwrites or {}
+        category.position = position or 0
+        self._add_channel(category)
+        return category
+
+class FakeAuditEntry:
+    def __init__(self, guild, action, target, user, reason=None):
+        self.id = discord.utils.time_snowflake(datetime.now(timezone.utc)) + next_id() % 4096
+        self.guild = guild
+        self.action = action
+        self.target = target
+        self.user = user
+        self.user_id = user.id
+        self.reason = reason
+        self.created_at = discord.utils.snowflake_time(self.id)
+
+# Fake interactions
+class FakeInteractionResponse:
+    def __init__(self, interaction):
+        self._interaction = interaction
+        self._done = False
+        self.ack_at = None
+
+    def is_done(self):
+        return self._done
+
+    async def _ack(self, route):
+        if self._done:
+            raise discord.InteractionResponded(self._interaction)
+        self._done = True
+        self.ack_at = time.perf_counter()
+        await self._interaction.guild.http.call(route)
+
+    async def send_message(self, content=None, **kwargs):
+        await self._ack('interaction_response')
+        self._interaction.replies.append(content)
+        self._interaction._original = FakeMessage(self._interaction.channel, self._interaction.guild.me, content)
+
+    async def defer(self, ephemeral=False, thinking=False):
+        await self._ack('interaction_defer')
+
+    async def edit_message(self, **kwargs):
+        await self._ack('interaction_edit')
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self._interaction = interaction
+
+    async def send(self, content=None, wait=False, **kwargs):
+        await self._interaction.guild.http.call('followup')
+        self._interaction.replies.append(content)
+        return FakeMessage(self._interaction.channel, self._interaction.guild.me, content)
+
+class FakeInteraction:
+    def __init__(self, guild, user, channel, message=None):
+        self.id = next_id()
+        self.guild = guild
+        self.guild_id = guild.id
+        self.user = user
+        self.channel = channel
+        self.message = message
+        self.client = botmod.bot
+        self.created_at = time.perf_counter()
+        self.response = FakeInteractionResponse(self)
+        self.followup = FakeFollowup(self)
+        self._original = None
+        self.replies = []
+
+    async def original_response(self):
+        await self.guild.http.call('original_response')
+        return self._original
+
+    async def edit_original_response(self, **kwargs):
+        await self.guild.http.call('edit_original_response')
+
+# Event streams
+EVENT_TYPES = ['member_join', 'message', 'message_edit', 'voice_update', 'ticket_click', 'giveaway_click']
+
+def synthetic_events(kind, count, seed=0):
+    """Generate a synthetic event stream of the given kind (or 'mixed')"""
+    rng = random.Random(seed)
+    for i in range(count):
+        event_type = rng.choice(EVENT_TYPES) if kind == 'mixed' else kind
+        yield {'type': event_type, 'user': i % max(1, count // 4), 'content': f"message number {i} " * rng.randint(1, 5)}
+
+def load_events(path):
+    """Load a recorded event stream (one JSON object per line)"""
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+class FakeGateway:
+    """Replays events into the real bot.py handlers"""
+    def __init__(self, http, concurrency=50):
+        self.http = http
+        self.guild = FakeGuild(http)
+        self.concurrency = concurrency
+        self.users = {}
+        self.voice = {}
+        self.giveaway_id = None
+        botmod.bot._connection.user = self.guild.me  # process_commands needs bot.user
+
+    def member(self, key):
+        member = self.users.get(key)
+        if member is None:
+            member = self.guild.add_member(FakeMember(self.guild, name=f"bench{key}"))
+            self.users[key] = member
+        return member
+
+    async def setup_giveaway(self):
+        channel = self.guild.get_channel(botmod.GUESS_CHANNEL_ID)
+        message = await channel.send("giveaway")
+        self.giveaway_id = f"{self.guild.id}_bench"
+        botmod.add_active_giveaway(self.giveaway_id, {
+            'prize': 'Bench Prize', 'duration': '1h', 'duration_seconds': 3600,
+            'end_time': datetime.utcnow() + timedelta(hours=1), 'winners': 1,
+            'host': self.guild.me.mention, 'participants': [],
+            'channel_id': channel.id, 'message_id': message.id
+        })
+
+    async def dispatch(self, event):
+        """Deliver one event to the matching handler"""
+        event_type = event['type']
+        member = self.member(event.get('user', 0))
+        general = self.guild.get_channel(botmod.REVIEW_CHANNEL_ID)
+
+        if event_type == 'member_join':
+            await botmod.on_member_join(member)
+        elif event_type == 'message':
+            await botmod.on_message(FakeMessage(general, member, event.get('content', '')))
+        elif event_type == 'message_edit':
+            before = FakeMessage(general, member, event.get('content', ''))
+            after = FakeMessage(general, member, event.get('content', '') + " (edited)")
+            after.edited_at = datetime.now(timezone.utc)
+            await botmod.on_raw_message_edit(FakeRawMessageUpdate(before, after))
+        elif event_type == 'voice_update':
+            before = self.voice.get(member.id)
+            after = random.choice(self.guild.voice_channels + [None])
+            self.voice[member.id] = after
+            await botmod.on_voice_state_update(member, FakeVoiceState(before), FakeVoiceState(after))
+        elif event_type == 'ticket_click':
+            view = botmod.TicketView()
+            await view.create_ticket.callback(FakeInteraction(self.guild, member, self.guild.get_channel(botmod.TICKET_CHANNEL_ID)))
+        elif event_type == 'giveaway_click':
+            view = botmod.GiveawayView(self.giveaway_id)
+            await view.enter_giveaway.callback(FakeInteraction(self.guild, member, general))
+        else:
+            raise ValueError(f"Unknown event type: {event_type}")
+
+    async def replay(self, events):
+        """Replay events concurrently, returning per-event latencies and failures"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        latency = defaultdict(botmod.LatencyHistogram)
+        errors = defaultdict(int)
+
+        async def run(event):
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    await self.dispatch(event)
+                except Exception as e:
+                    errors[event['type']] += 1
+                    if errors[event['type']] == 1:
+                        print(f"  {event['type']} failed: {e!r}", file=sys.stderr)
+                finally:
+                    latency[event['type']].record(time.perf_counter() - start)
+
+        if any(event['type'] == 'giveaway_click' for event in events):
+            await self.setup_giveaway()
+        await asyncio.gather(*(run(event) for event in events))
+        return latency, errors
+
+async def drain_outbound(timeout):
+    """Wait for the bot's outbound REST scheduler to send what it queued, return the backlog left"""
+    scheduler = botmod.outbound
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        backlog = scheduler.in_flight + sum(scheduler.queued(priority) for priority in scheduler.queues)
+        if not backlog:
+            return 0
+        await asyncio.sleep(0.01)
+    # Whatever is left stays rate limited, drop it so the next scenario starts clean
+    for priority in scheduler.queues:
+        while scheduler.queued(priority):
+            scheduler._drop_oldest(priority)
+    return backlog
+
+# Scenarios
+SCENARIOS = {}
+
+def check(result, passed, message):
+    """Record a failed expectation in a scenario's result, main() exits non-zero if there are any"""
+    if not passed:
+        result.setdefault('failures', []).append(message)
+
+def scenario(name):
+    """Register a benchmark scenario: async fn(args) -> result dict"""
+    def decorator(func):
+        SCENARIOS[name] = func
+        return func
+    return decorator
+
+async def replay_scenario(args, events):
+    http = FakeHTTP(args.rest_latency / 1000)
+    gateway = FakeGateway(http, args.concurrency)
+    events = list(events)
+    # Joins fetch avatars for welcome cards, serve them locally instead of from the internet
+    await asset_server.start()
+    start = time.perf_counter()
+    latency, errors = await gateway.replay(events)
+    elapsed = time.perf_counter() - start
+    backlog = await drain_outbound(args.drain_timeout)
+    drained = time.perf_counter() - start
+
+    combined = botmod.LatencyHistogram()
+    for histogram in latency.values():
+        for key, count in histogram.counts.items():
+            combined.counts[key] = combined.counts.get(key, 0) + count
+        combined.count += histogram.count
+        combined.total += histogram.total
+        combined.max = max(combined.max, histogram.max)
+
+    return {
+        'events': len(events),
+        'seconds': elapsed,
+        'drain_seconds': drained,
+        'throughput': len(events) / elapsed if elapsed else 0.0,
+        'p50_ms': combined.percentile(50) * 1000,
+        'p90_ms': combined.percentile(90) * 1000,
+        'p99_ms': combined.percentile(99) * 1000,
+        'max_ms': combined.max * 1000,
+        'errors': sum(errors.values()),
+        'outbound_backlog': backlog,
+        'rest_calls': dict(http.calls),
+    }
+
+def _register_replay(kind):
+    @scenario(kind)
+    async def run(args):
+        return await replay_scenario(args, synthetic_events(kind, args.n, args.seed))
+    return run
+
+for _kind in ['member_join', 'message', 'message_edit', 'voice_update', 'ticket_click', 'giveaway_click', 'mixed']:
+    _register_replay(_kind)
+
+@scenario('transcript_export')
+async def transcript_export(args):
+    """Archive one large ticket and report export throughput"""
+    http = FakeHTTP(args.rest_latency / 1000)
+    guild = FakeGuild(http)
+    author = guild.add_member(FakeMember(guild, name="archiver"))
+    channel = FakeArchiveChannel(guild, author, args.transcript_messages)
+
+    start = time.perf_counter()
+    transcript = await botmod.archive_ticket_transcript(channel, author.id)
+    elapsed = time.perf_counter() - start
+    os.remove(transcript['path'])
+
+    return {
+        'messages': transcript['messages'],
+        'seconds': elapsed,
+        'throughput': transcript['messages'] / elapsed if elapsed else 0.0,
+        'compressed_kb': transcript['bytes'] / 1024,
+        'bytes_per_msg': transcript['bytes'] / max(1, transcript['messages']),
+        'rest_calls': dict(http.calls),
+    }
+
+async def open_tickets(guild, members, latency=None):
+    """Click "Create Ticket" for all members at once, return the number of failed clicks"""
+    panel = guild.get_channel(botmod.TICKET_CHANNEL_ID)
+    errors = 0
+
+    async def open_ticket(member):
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            await botmod.TicketView().create_ticket.callback(FakeInteraction(guild, member, panel))
+        except Exception as e:
+            errors += 1
+            print(f"  ticket failed: {e!r}", file=sys.stderr)
+        if latency is not None:
+            latency.record(time.perf_counter() - start)
+
+    await asyncio.gather(*(open_ticket(member) for member in members))
+    return errors
+
+@scenario('ticket_load')
+async def ticket_load(args):
+    """Open tickets for many users at once, spilling over into overflow categories"""
+    http = FakeHTTP(args.rest_latency / 1000)
+    gateway = FakeGateway(http, args.concurrency)
+    guild = gateway.guild
+    botmod.guild_config(guild.id)['ticket_backend'] = 'channel'
+    users = [gateway.member(i) for i in range(args.tickets)]
+    latency = botmod.LatencyHistogram()
+
+    start = time.perf_counter()
+    errors = await open_tickets(guild, users, latency)
+    elapsed = time.perf_counter() - start
+
+    categories = [guild.get_channel(cid) for cid in botmod.ticket_category_pool[guild.id]]
+    tickets = [channel for category in categories for channel in category.channels]
+    owners = [await botmod.user_has_open_ticket(guild, member) for member in users]
+
+    # Close a ticket in every category, the freed slots must be reused before a new category is made
+    for category in categories:
+        await botmod.close_ticket_channel(category.channels[0], botmod._ticket_topic_owner(category.channels[0]), delay=0)
+    errors += await open_tickets(guild, [gateway.member(args.tickets + i) for i in range(len(categories))])
+    categories_after = len(botmod.ticket_category_pool[guild.id])
+    await drain_outbound(args.drain_timeout)
+
+    result = {
+        'tickets': len(tickets),
+        'seconds': elapsed,
+        'throughput': len(tickets) / elapsed if elapsed else 0.0,
+        'p50_ms': latency.percentile(50) * 1000,
+        'p99_ms': latency.percentile(99) * 1000,
+        'categories': len(categories),
+        'max_per_category': max(len(category.channels) for category in categories),
+        'owners_found': sum(1 for channel in owners if channel),
+        'categories_after_refill': categories_after,
+        'errors': errors,
+        'rest_calls': dict(http.calls),
+    }
+    check(result, errors == 0, f"{errors} ticket creations failed")
+    check(result, result['tickets'] == args.tickets, f"{result['tickets']} tickets for {args.tickets} users")
+    check(result, result['max_per_category'] <= 50, f"{result['max_per_category']} channels in one category")
+    check(result, result['owners_found'] == args.tickets, f"only {result['owners_found']} owners found their ticket")
+    check(result, categories_after == len(categories), f"refill made {categories_after - len(categories)} new categories")
+    check(result, result['p99_ms'] <= args.ticket_p99_ms, f"p99 {result['p99_ms']:.0f}ms over the {args.ticket_p99_ms:.0f}ms budget")
+    return result
+
+@scenario('ticket_backends')
+async def ticket_backends(args):
+    """Compare ticket creation latency of the channel and thread backends"""
+    result = {}
+    for backend in botmod.TICKET_BACKENDS:
+        http = FakeHTTP(args.rest_latency / 1000)
+        gateway = FakeGateway(http, args.concurrency)
+        botmod.guild_config(gateway.guild.id)['ticket_backend'] = backend
+        latency = botmod.LatencyHistogram()
+
+        start = time.perf_counter()
+        errors = await open_tickets(gateway.guild, [gateway.member(i) for i in range(args.tickets)], latency)
+        elapsed = time.perf_counter() - start
+        await drain_outbound(args.drain_timeout)
+
+        result[f'{backend}_seconds'] = elapsed
+        result[f'{backend}_p50_ms'] = latency.percentile(50) * 1000
+        result[f'{backend}_p99_ms'] = latency.percentile(99) * 1000
+        result[f'{backend}_rest_calls'] = sum(count for route, count in http.calls.items() if route != 'send')
+        result[f'{backend}_errors'] = errors
+    return result
+
+@scenario('ticket_double_click')
+async def ticket_double_click(args):
+    """Fire many simultaneous "Create Ticket" clicks from one user, exactly one ticket may come out"""
+    result = {}
+    for backend in botmod.TICKET_BACKENDS:
+        http = FakeHTTP(args.rest_latency / 1000)
+        gateway = FakeGateway(http, args.concurrency)
+        guild = gateway.guild
+        botmod.guild_config(guild.id)['ticket_backend'] = backend
+        member = gateway.member(0)
+        panel = guild.get_channel(botmod.TICKET_CHANNEL_ID)
+        interactions = [FakeInteraction(guild, member, panel) for _ in range(args.clicks)]
+
+        start = time.perf_counter()
+        await asyncio.gather(*(botmod.TicketView().create_ticket.callback(interaction) for interaction in interactions))
+        elapsed = time.perf_counter() - start
+
+        # A later click must see the ticket through the ownership index
+        late = FakeInteraction(guild, member, panel)
+        await botmod.TicketView().create_ticket.callback(late)
+        await drain_outbound(args.drain_timeout)
+
+        ticket = await botmod.user_has_open_ticket(guild, member)
+        replies = [reply for interaction in interactions for reply in interaction.replies]
+        tickets = http.calls['create_text_channel'] + http.calls['create_thread']
+        result[f'{backend}_tickets'] = tickets
+        result[f'{backend}_seconds'] = elapsed
+        result[f'{backend}_same_ticket'] = sum(1 for reply in replies if ticket and ticket.mention in reply)
+        result[f'{backend}_late_rejected'] = int(bool(late.replies) and late.replies[0].startswith("❌ You already have"))
+        rows = botmod.get_db().execute(
+            "SELECT COUNT(*) FROM ticket_events WHERE guild_id = ? AND user_id = ? AND event = 'created'", (guild.id, member.id)
+        ).fetchone()[0]
+        result[f'{backend}_ticket_rows'] = rows
+        check(result, tickets == 1, f"{backend}: {args.clicks + 1} clicks created {tickets} tickets")
+        check(result, rows == 1, f"{backend}: {rows} ticket rows recorded")
+        check(result, result[f'{backend}_same_ticket'] == len(replies), f"{backend}: some clicks were not pointed at the ticket")
+        check(result, result[f'{backend}_late_rejected'] == 1, f"{backend}: a later click was not rejected")
+    return result
+
+@scenario('giveaway_end')
+async def giveaway_end(args):
+    """End a giveaway whose winners are partly uncached, gone or unreachable by DM"""
+    http = FakeHTTP(args.rest_latency / 1000)
+    gateway = FakeGateway(http, args.concurrency)
+    guild = gateway.guild
+    await gateway.setup_giveaway()
+    giveaway = botmod.active_giveaways[gateway.giveaway_id]
+    giveaway['winners'] = 20
+    entrants = [gateway.member(i) for i in range(args.n)]
+    giveaway['participants'] = [member.id for member in entrants]
+    for member in entrants:
+        botmod.snapshot_member(member)
+
+    # A tenth closed their DMs, and a tenth left after entering (still in the snapshot)
+    for i, member in enumerate(entrants):
+        if i % 10 == 1:
+            member.dms_closed = True
+        elif i % 10 == 2:
+            del guild.members[member.id]
+
+    staff = guild.me
+    interaction = FakeInteraction(guild, staff, guild.get_channel(botmod.GUESS_CHANNEL_ID))
+    start = time.perf_counter()
+    await botmod.end_giveaway(interaction, gateway.giveaway_id, giveaway)
+    ended = time.perf_counter() - start
+    notify = [task for task in asyncio.all_tasks() if task.get_coro().__name__ == '_notify_giveaway_winners']
+    await asyncio.gather(*notify)
+    notified = time.perf_counter() - start
+    await drain_outbound(args.drain_timeout)
+
+    deliveries = botmod.completed_giveaways[gateway.giveaway_id]['deliveries']
+    statuses = defaultdict(int)
+    for status in deliveries.values():
+        statuses[status] += 1
+    return {
+        'entrants': args.n,
+        'end_ms': ended * 1000,
+        'notified_ms': notified * 1000,
+        'deliveries': dict(statuses),
+        'rest_calls': dict(http.calls),
+    }
+
+@scenario('giveaway_draw')
+async def giveaway_draw(args):
+    """Draw winners from a large entrant list, uniform, weighted and as a reroll"""
+    rng = random.Random(args.seed)
+    participants = rng.sample(range(10**17, 10**18), args.entrants)
+    weights = [5 if i % 100 == 0 else 2 if i % 10 == 0 else 1 for i in range(args.entrants)]
+    result = {'entrants': args.entrants}
+
+    def timed(name, *draw_args, **draw_kwargs):
+        start = time.perf_counter()
+        winners, _ = botmod.draw_winners(*draw_args, **draw_kwargs)
+        result[f'{name}_ms'] = (time.perf_counter() - start) * 1000
+        return winners
+
+    winners = timed('uniform', participants, 20)
+    timed('weighted', participants, 20, weights)
+    rerolled = timed('reroll', participants, 20, weights, exclude=set(winners))
+    result['reroll_overlap'] = len(set(winners) & set(rerolled))
+
+    # Weighted fairness: entrants with weight 5 should win 5/14 of single-winner draws
+    small = list(range(100))
+    small_weights = [5 if i < 10 else 1 for i in range(100)]
+    trials = 20_000
+    heavy = sum(botmod.draw_winners(small, 1, small_weights, seed=f"{args.seed}-{i}")[0][0] < 10 for i in range(trials))
+    result['heavy_share'] = heavy / trials
+    result['heavy_expected'] = 50 / 140
+    return result
+
+@scenario('role_bulk')
+async def role_bulk(args):
+    """Add a role to every member through the bulk role engine, then rejoin with sticky roles"""
+    http = FakeHTTP(args.rest_latency / 1000)
+    gateway = FakeGateway(http, args.concurrency)
+    guild = gateway.guild
+    role = FakeRole(guild, "Member")
+    guild.roles.append(role)
+    members = [gateway.member(i) for i in range(args.role_members)]
+
+    progress = []
+    job = botmod.RoleBatchJob(guild, role, members)
+    start = time.perf_counter()
+    await job.run(lambda job: progress.append(job.done + job.failed))
+    elapsed = time.perf_counter() - start
+
+    # Sticky roles survive a leave and rejoin in one member edit
+    botmod.set_role_setting(guild.id, role.id, 'sticky', True)
+    member = members[0]
+    await botmod.save_sticky_roles(discord.RawMemberRemoveEvent({'guild_id': guild.id}, member))
+    member.roles = [guild.default_role]
+    http.reset()
+    await botmod.apply_join_roles(member)
+    await drain_outbound(args.drain_timeout)
+    botmod.set_role_setting(guild.id, role.id, 'sticky', False)
+
+    return {
+        'members': args.role_members,
+        'done': job.done,
+        'failed': job.failed,
+        'seconds': elapsed,
+        'per_second': job.rate,
+        'projected_10k_minutes': 10_000 / job.rate / 60 if job.rate else None,
+        'progress_updates': len(progress),
+        'sticky_restored': role in member.roles,
+    }
+
+class ChunkState:
+    """The bits of discord's connection state that building members from a chunk touches"""
+    def __init__(self):
+        self.users = {}
+
+    def store_user(self, data, *, cache=True):
+        user = discord.User(state=self, data=data)
+        self.users[user.id] = user
+        return user
+
+    def create_user(self, data):
+        return discord.User(state=self, data=data)
+
+def _memory():
+    gc.collect()
+    return botmod.process_rss() or 0, tracemalloc.get_traced_memory()[0]
+
+def _member_payloads(rng, count, role_ids):
+    """GUILD_MEMBERS_CHUNK style member payloads"""
+    now = time.time()
+    payloads = []
+    for i in range(count):
+        joined = now - rng.randint(0, 3 * 365 * 86400)
+        payloads.append({
+            'user': {'id': str(10**17 + i), 'username': f"member{i}", 'discriminator': '0', 'avatar': None, 'global_name': None},
+            'roles': [str(role_id) for role_id in rng.sample(role_ids, rng.randint(0, 4))],
+            'joined_at': datetime.fromtimestamp(joined, timezone.utc).isoformat(),
+            'flags': 0, 'deaf': False, 'mute': False,
+        })
+    return payloads
+
+def _persist_snapshot(guild_id, payloads):
+    """Write the member snapshot a previous run would have left behind"""
+    with botmod.get_db() as db:
+        db.executemany("INSERT OR REPLACE INTO member_snapshots VALUES (?, ?, ?, ?, ?, ?)", [
+            (guild_id, int(data['user']['id']), botmod.array('Q', sorted(map(int, data['roles']))).tobytes(),
+             datetime.fromisoformat(data['joined_at']).timestamp(), data['flags'], time.time())
+            for data in payloads
+        ])
+
+def _drop_snapshot(guild_id):
+    botmod.member_snapshots.clear()
+    botmod.member_role_sets.clear()
+    with botmod.get_db() as db:
+        db.execute("DELETE FROM member_snapshots WHERE guild_id = ?", (guild_id,))
+
+@scenario('member_startup')
+async def member_startup(args):
+    """Member data at startup: chunking every member vs warm-loading the persisted snapshot"""
+    rng = random.Random(args.seed)
+    guild_id = next_id()
+    payloads = _member_payloads(rng, args.snapshot_members, [next_id() for _ in range(40)])
+    _persist_snapshot(guild_id, payloads)
+    result = {'members': args.snapshot_members}
+
+    # Snapshot mode: no chunking, load the snapshot before connecting
+    botmod.member_snapshots.clear()
+    rss, traced = _memory()
+    start = time.perf_counter()
+    botmod.load_member_snapshots()
+    result['snapshot_seconds'] = time.perf_counter() - start
+    rss_after, traced_after = _memory()
+    result['snapshot_rss_mb'] = (rss_after - rss) / 2**20
+    result['snapshot_retained_mb'] = (traced_after - traced) / 2**20
+    result['snapshot_loaded'] = len(botmod.member_snapshots[guild_id])
+    botmod.member_snapshots.clear()
+
+    # Default mode: every member arrives in a chunk and is cached as a discord.Member
+    guild = type('ChunkGuild', (), {'id': guild_id})()
+    state = ChunkState()
+    rss, traced = _memory()
+    start = time.perf_counter()
+    members = [discord.Member(data=data, guild=guild, state=state) for data in payloads]
+    result['chunk_seconds'] = time.perf_counter() - start
+    rss_after, traced_after = _memory()
+    result['chunk_rss_mb'] = (rss_after - rss) / 2**20
+    result['chunk_retained_mb'] = (traced_after - traced) / 2**20
+    del members
+
+    _drop_snapshot(guild_id)
+    return result
+
+def _profile_state(profile, dispatch):
+    """A discord.py connection state configured like bot.py under the given cache profile"""
+    settings = botmod.CACHE_PROFILES[profile]
+    intents = discord.Intents.default()
+    intents.members = intents.message_content = True
+    for intent in settings.get('disabled_intents', ()):
+        setattr(intents, intent, False)
+    return discord.state.ConnectionState(
+        dispatch=dispatch, handlers={}, hooks={}, http=None, intents=intents,
+        max_messages=settings['max_messages'],
+        member_cache_flags=settings['member_cache_flags'],
+        chunk_guilds_at_startup=settings['chunk_guilds_at_startup'],
+    )
+
+@scenario('cache_profiles')
+async def cache_profiles(args):
+    """Memory held per guild of --snapshot-members members under each cache profile.
+
+    Every profile sees the same traffic: --profile-messages messages from random members.
+    The default profile also caches every member from the startup chunk, lean loads the
+    persisted member snapshot instead (or nothing, with the snapshot turned off).
+    Run it on its own for RSS figures, freed memory is rarely returned to the OS.
+    """
+    rng = random.Random(args.seed)
+    guild_id = next_id()
+    channel_id = next_id()
+    payloads = _member_payloads(rng, args.snapshot_members, [next_id() for _ in range(40)])
+    messages = []
+    for i in range(args.profile_messages):
+        author = rng.choice(payloads)
+        messages.append({
+            'id': str(next_id()), 'channel_id': str(channel_id), 'guild_id': str(guild_id),
+            'author': author['user'], 'member': {key: value for key, value in author.items() if key != 'user'},
+            'content': " ".join(rng.choice(SEARCH_WORDS) for _ in range(rng.randint(3, 40))),
+            'timestamp': datetime.now(timezone.utc).isoformat(), 'edited_timestamp': None, 'tts': False,
+            'mention_everyone': False, 'mentions': [], 'mention_roles': [], 'attachments': [], 'embeds': [],
+            'pinned': False, 'type': 0,
+        })
+    guild_payload = {
+        'id': str(guild_id), 'name': "Bench Guild", 'owner_id': payloads[0]['user']['id'],
+        'member_count': len(payloads), 'members': [], 'emojis': [], 'stickers': [], 'features': [],
+        'roles': [{'id': str(guild_id), 'name': '@everyone', 'permissions': '0', 'position': 0, 'color': 0,
+                   'hoist': False, 'managed': False, 'mentionable': False}],
+        'channels': [{'id': str(channel_id), 'type': 0, 'name': 'general', 'position': 0, 'permission_overwrites': []}],
+    }
+    _persist_snapshot(guild_id, payloads)
+    result = {'members': args.snapshot_members, 'messages': args.profile_messages}
+    per_100k = 100_000 / max(1, args.snapshot_members)
+
+    # Smallest first, RSS rarely shrinks once the allocator has grown
+    for name, profile, snapshot in (('lean_no_snapshot', 'lean', False), ('lean', 'lean', True), ('default', 'default', False)):
+        compact_size = botmod.CACHE_PROFILES[profile].get('compact_messages', 0)
+        def dispatch(event, *event_args):
+            if event == 'message':
+                # What the live on_message does, with this profile's compact message cache
+                botmod.snapshot_member(event_args[0].author)
+                if compact_size:
+                    botmod.compact_messages[event_args[0].id] = botmod.CompactMessage(event_args[0])
+                    if len(botmod.compact_messages) > compact_size:
+                        del botmod.compact_messages[next(iter(botmod.compact_messages))]
+        state = _profile_state(profile, dispatch)
+        rss, traced = _memory()
+        start = time.perf_counter()
+        state._add_guild_from_data(dict(guild_payload))
+        guild = state._get_guild(guild_id)
+        if snapshot:
+            botmod.load_member_snapshots()
+        if botmod.CACHE_PROFILES[profile]['chunk_guilds_at_startup']:
+            # A startup chunk request caches every member it returns
+            for data in payloads:
+                guild._add_member(discord.Member(data=data, guild=guild, state=state))
+        for data in messages:
+            state.parse_message_create(data)
+        seconds = time.perf_counter() - start
+        rss_after, traced_after = _memory()
+        result[f'{name}_rss_mb_per_100k'] = (rss_after - rss) / 2**20 * per_100k
+        result[f'{name}_retained_mb_per_100k'] = (traced_after - traced) / 2**20 * per_100k
+        result[f'{name}_members_cached'] = len(guild._members)
+        result[f'{name}_messages_cached'] = len(state._messages or ()) + len(botmod.compact_messages)
+        result[f'{name}_seconds'] = seconds
+        del state, guild
+        botmod.member_snapshots.clear()
+        botmod.member_role_sets.clear()
+        botmod.compact_messages.clear()
+
+    _drop_snapshot(guild_id)
+    return result
+
+@scenario('embed_render')
+async def embed_render(args):
+    """Render the running giveaway embed by hand (as handlers used to) and from its template"""
+    guild = FakeGuild(FakeHTTP())
+    giveaway = {
+        'prize': "Bench Prize", 'duration': "1h", 'host': guild.me.mention, 'winners': 3, 'participants': list(range(250)),
+        'end_time': datetime.utcnow() + timedelta(hours=1), 'requirements': botmod.giveaway_requirements(min_account_age=86400),
+    }
+
+    def by_hand():
+        embed = discord.Embed(
+            title="\x1a GIVEAWAY \x1a",
+            description=f"**Prize:** {giveaway['prize']}\n**Duration:** {giveaway['duration']}\n**Host:** {giveaway['host']}\n**Winners:** {giveaway['winners']}",
+            color=0x00ff00
+        )
+        embed.add_field(name="Participants", value=f"{len(giveaway['participants'])} entered", inline=True)
+        embed.add_field(name="Ends", value=f"<t:{int(giveaway['end_time'].timestamp())}:R>", inline=True)
+        if botmod.format_giveaway_requirements(giveaway.get('requirements')):
+            embed.add_field(name="Requirements", value=botmod.format_giveaway_requirements(giveaway['requirements']), inline=False)
+        embed.set_footer(text="Click the button below to enter!")
+        return embed
+
+    def timed(build):
+        # Allocation tracing would dominate timings this small
+        tracing = tracemalloc.is_tracing()
+        tracemalloc.stop()
+        try:
+            # Best of a few runs, so a busy machine doesn't decide which side looks faster
+            best = float('inf')
+            for _ in range(5):
+                start = time.perf_counter()
+                for _ in range(args.renders):
+                    build().to_dict()
+                best = min(best, time.perf_counter() - start)
+            return best / args.renders * 1_000_000
+        finally:
+            if tracing:
+                tracemalloc.start()
+
+    result = {'renders': args.renders}
+    result['by_hand_us'] = timed(by_hand)
+    result['template_us'] = timed(lambda: botmod.build_giveaway_embed(guild, giveaway))
+    botmod.set_embed_template(guild.id, 'giveaway_active', {'title': "🎉 {prize} 🎉", 'color': 0xf1c40f})
+    result['customised_us'] = timed(lambda: botmod.build_giveaway_embed(guild, giveaway))
+    result['customised_title'] = botmod.build_giveaway_embed(guild, giveaway).title
+    botmod.set_embed_template(guild.id, 'giveaway_active', None)
+    result['same_output'] = by_hand().to_dict() == botmod.build_giveaway_embed(guild, giveaway).to_dict()
+    return result
+
+@scenario('welcome_raid')
+async def welcome_raid(args):
+    """A burst of joins: cards render in worker processes until the backlog fills, the rest get embeds"""
+    http = FakeHTTP(args.rest_latency / 1000)
+    gateway = FakeGateway(http, args.concurrency)
+    botmod.welcome_card_stats.clear()
+    await botmod.asset_cache.close()
+    botmod.asset_cache = botmod.AssetCache()
+    await asset_server.start()
+    if botmod.Image is not None:
+        # Workers are started at ready in the bot, don't count their startup here
+        botmod.start_welcome_cards()
+        await asyncio.get_running_loop().run_in_executor(botmod._welcome_card_pool(), botmod._warm_card_worker)
+
+    lag = []
+    async def ticker():
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(0.01)
+            lag.append(time.perf_counter() - start - 0.01)
+    ticking = asyncio.create_task(ticker())
+
+    # Sends are paced by the welcome channel's rate limit, time the cards alone
+    members = [gateway.member(i) for i in range(args.joins)]
+    start = time.perf_counter()
+    # Half arrive at once, the rest as a steady stream of 50 joins a second
+    await asyncio.gather(*(botmod.render_welcome_card(member) for member in members[:args.joins // 2]))
+    burst = time.perf_counter() - start
+    stream = []
+    for member in members[args.joins // 2:]:
+        stream.append(asyncio.create_task(botmod.render_welcome_card(member)))
+        await asyncio.sleep(0.02)
+    await asyncio.gather(*stream)
+    elapsed = time.perf_counter() - start
+    ticking.cancel()
+
+    channel = botmod.config_channel(gateway.guild, 'welcome_channel')
+    await botmod.send_welcome(members[0], channel)
+    await drain_outbound(args.drain_timeout)
+    sent = list(channel.messages.values())[-1]
+    await botmod.asset_cache.close()
+    await asset_server.stop()
+
+    return {
+        'joins': args.joins,
+        'pillow': botmod.Image is not None,
+        'burst_seconds': burst,
+        'seconds': elapsed,
+        'rendered': botmod.welcome_card_stats['rendered'],
+        'degraded': botmod.welcome_card_stats['degraded'],
+        'failed': botmod.welcome_card_stats['failed'],
+        'max_loop_lag_ms': max(lag, default=0) * 1000,
+        'avatar_downloads': asset_server.requests,
+        'sent_card': sent.embeds[0].image.url == "attachment://welcome.png",
+    }
+
+@scenario('asset_cache')
+async def asset_cache(args):
+    """Downloads through the asset cache: cold, warm, after a restart and once stale"""
+    botmod.get_db().execute("DELETE FROM asset_index")
+    await botmod.asset_cache.close()
+    cache = botmod.asset_cache = botmod.AssetCache()
+    await asset_server.start()
+    asset_server.latency = args.asset_latency / 1000
+    rng = random.Random(args.seed)
+    files = [f"/files/f{i}/{rng.choice((4, 16, 64, 256))}" for i in range(args.asset_files)]
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def fetch(path):
+        # Attachment links are re-signed each time they are seen
+        async with semaphore:
+            return await botmod.fetch_asset(f"{asset_server.base}{path}?ex={rng.getrandbits(32):x}&hm={rng.getrandbits(64):x}")
+
+    result = {'files': args.asset_files, 'requests_per_pass': args.n}
+    async def run(phase):
+        before = asset_server.requests
+        start = time.perf_counter()
+        data = await asyncio.gather(*(fetch(rng.choice(files)) for _ in range(args.n)))
+        result[f'{phase}_seconds'] = time.perf_counter() - start
+        result[f'{phase}_downloads'] = asset_server.requests - before
+        result['failed'] = result.get('failed', 0) + data.count(None)
+
+    try:
+        await run('cold')
+        await run('warm')
+        await cache.close()
+        # A restart keeps the disk store
+        cache = botmod.asset_cache = botmod.AssetCache()
+        await run('restart')
+        # Age every copy past its freshness, each file is revalidated once
+        for entry in cache.memory.values():
+            entry.checked_at -= botmod.ASSET_FRESH_SECONDS
+        await run('stale')
+    finally:
+        await cache.close()
+        await asset_server.stop()
+
+    result.update({
+        'not_modified': asset_server.not_modified,
+        'mb_sent': asset_server.bytes_sent / 1024 / 1024,
+        'mb_saved': cache.bytes['saved'] / 1024 / 1024,
+        'memory_mb': cache.memory_bytes / 1024 / 1024,
+    })
+    return result
+
+@scenario('mass_ban')
+async def mass_ban(args):
+    """A mass ban by several moderators: audit log fetches and attribution, with and without pushed entries"""
+    http = FakeHTTP(args.rest_latency / 1000)
+    gateway = FakeGateway(http, args.concurrency)
+    guild = gateway.guild
+    moderators = [gateway.member(f"mod{i}") for i in range(3)]
+    rng = random.Random(args.seed)
+    ban = discord.AuditLogAction.ban
+    result = {'bans': args.bans, 'audit_fetches_before': args.bans}
+
+    for mode in ('pushed', 'polled'):
+        botmod.audit_log_index = index = botmod.AuditLogIndex()
+        targets = [gateway.member(f"{mode}{i}") for i in range(args.bans)]
+        banned_by = {}
+
+        async def ban_one(member):
+            moderator = rng.choice(moderators)
+            banned_by[member.id] = moderator.id
+            entry = FakeAuditEntry(guild, ban, member, moderator, reason="raid")
+            guild.audit_entries.append(entry)
+            if mode == 'pushed':
+                # The entry and the ban event race each other on the gateway
+                asyncio.get_running_loop().call_later(rng.random() * 0.05, index.add, entry)
+            return await index.find(guild, ban, member.id)
+
+        before = http.calls['audit_logs']
+        start = time.perf_counter()
+        entries = []
+        for i in range(0, args.bans, 50):
+            # Moderation bots ban in waves
+            entries += await asyncio.gather(*(ban_one(member) for member in targets[i:i + 50]))
+        result[f'{mode}_seconds'] = time.perf_counter() - start
+        result[f'{mode}_audit_fetches'] = http.calls['audit_logs'] - before
+        result[f'{mode}_polls'] = index.stats['polls']
+        result[f'{mode}_misattributed'] = sum(
+            entry is None or entry.user_id != banned_by[member.id] for member, entry in zip(targets, entries)
+        )
+
+    # End to end through the handler
+    await botmod.on_member_ban(guild, targets[0])
+    await drain_outbound(args.drain_timeout)
+    log = list(guild.get_channel(botmod.LOG_CHANNEL_ID).messages.values())[-1]
+    result['logged_moderator'] = log.embeds[0].fields[1].value.endswith(f"({banned_by[targets[0].id]})")
+    return result
+
+SEARCH_WORDS = ("refund payment account banned appeal withdraw deposit coinflip jackpot crash bonus code "
+                "support ticket staff wallet roblox limited trade scam report error lag promo").split()
+
+@scenario('search')
+async def search_index(args):
+    """Fill the search index and measure query latency"""
+    rng = random.Random(args.seed)
+    guild_id = next_id()
+    db = botmod.get_db()
+    db.execute("DELETE FROM indexed_messages")
+    db.commit()
+
+    start = time.perf_counter()
+    batch = []
+    for i in range(args.search_messages):
+        content = " ".join(rng.choice(SEARCH_WORDS) for _ in range(rng.randint(4, 16))) + f" user{rng.randint(0, 50_000)}"
+        batch.append((i, guild_id, 1, rng.randint(1, 50_000), "bench", rng.choice(list(botmod.SEARCH_SOURCES)), None,
+                      datetime.now(timezone.utc).isoformat(), content))
+        if len(batch) >= 10_000:
+            db.executemany("""INSERT INTO indexed_messages (message_id, guild_id, channel_id, author_id, author, source, ticket_id, created_at, content)
+                              VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""", batch)
+            db.commit()
+            batch = []
+    if batch:
+        db.executemany("""INSERT INTO indexed_messages (message_id, guild_id, channel_id, author_id, author, source, ticket_id, created_at, content)
+                          VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""", batch)
+        db.commit()
+    index_seconds = time.perf_counter() - start
+
+    latency = botmod.LatencyHistogram()
+    queries = [
+        " ".join(rng.sample(SEARCH_WORDS, rng.randint(1, 3))) if i % 4 else f"user{rng.randint(0, 50_000)}"
+        for i in range(200)
+    ]
+    for i, query in enumerate(queries):
+        query_start = time.perf_counter()
+        botmod.search_messages(guild_id, query, page=i % 3, source='deleted' if i % 5 == 0 else None)
+        latency.record(time.perf_counter() - query_start)
+
+    return {
+        'messages': args.search_messages,
+        'index_seconds': index_seconds,
+        'index_rate': args.search_messages / index_seconds if index_seconds else 0.0,
+        'queries': len(queries),
+        'p50_ms': latency.percentile(50) * 1000,
+        'p99_ms': latency.percentile(99) * 1000,
+        'max_ms': latency.max * 1000,
+    }
+
+async def run_scenario(name, args):
+    """Run one scenario and add peak memory to its result"""
+    tracemalloc.start()
+    try:
+        result = await SCENARIOS[name](args)
+        result['peak_mem_kb'] = tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+    return result
+
+def print_result(name, result):
+    print(f"{name}:")
+    for key, value in result.items():
+        if isinstance(value, dict):
+            value = ", ".join(f"{k}={v}" for k, v in sorted(value.items())) or "none"
+        elif isinstance(value, list):
+            value = "; ".join(map(str, value))
+        elif isinstance(value, float):
+            value = f"{value:.2f}"
+        print(f"  {key:<17} {value}")
+
+def compare_to_baseline(results, baseline, tolerance):
+    """Return a list of regressions (throughput down or p99 up by more than tolerance)"""
+    regressions = []
+    for name, result in results.items():
+        old = baseline.get(name)
+        if not old:
+            continue
+        if old.get('throughput') and result['throughput'] < old['throughput'] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {result['throughput']:.1f}/s vs {old['throughput']:.1f}/s")
+        if old.get('p99_ms') and result.get('p99_ms', 0) > old['p99_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p99 {result['p99_ms']:.2f}ms vs {old['p99_ms']:.2f}ms")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks for bot.py")
+    parser.add_argument('scenarios', nargs='*', help=f"Scenarios to run (default: all). Available: {', '.join(SCENARIOS)}")
+    parser.add_argument('-n', type=int, default=1000, help="Events per scenario")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--concurrency', type=int, default=50, help="Events handled at the same time")
+    parser.add_argument('--rest-latency', type=float, default=0.0, help="Simulated REST latency in ms")
+    parser.add_argument('--transcript-messages', type=int, default=50_000, help="Messages in the transcript_export ticket")
+    parser.add_argument('--search-messages', type=int, default=200_000, help="Messages indexed by the search scenario (the target is 10M)")
+    parser.add_argument('--tickets', type=int, default=500, help="Tickets opened at once by the ticket_load scenario")
+    parser.add_argument('--ticket-p99-ms', type=float, default=3000.0, help="ticket_load fails if p99 creation time is above this (Discord's interaction window)")
+    parser.add_argument('--entrants', type=int, default=1_000_000, help="Entrants in the giveaway_draw scenario")
+    parser.add_argument('--snapshot-members', type=int, default=100_000, help="Members in the member_startup scenario")
+    parser.add_argument('--profile-messages', type=int, default=20_000, help="Messages seen by each profile in cache_profiles")
+    parser.add_argument('--renders', type=int, default=50_000, help="Embeds built per variant in embed_render")
+    parser.add_argument('--joins', type=int, default=400, help="Members joining in the welcome_raid scenario")
+    parser.add_argument('--asset-files', type=int, default=200, help="Distinct files requested in the asset_cache scenario")
+    parser.add_argument('--asset-latency', type=float, default=20.0, help="Simulated CDN latency in ms for asset_cache")
+    parser.add_argument('--bans', type=int, default=200, help="Members banned at once in the mass_ban scenario")
+    parser.add_argument('--role-members', type=int, default=450, help="Members updated by the role_bulk scenario (REST is capped at 45/s)")
+    parser.add_argument('--clicks', type=int, default=100, help="Simultaneous clicks from one user in ticket_double_click")
+    parser.add_argument('--drain-timeout', type=float, default=5.0, help="Seconds to wait for queued (rate limited) REST calls after a scenario")
+    parser.add_argument('--events', help="Replay a recorded JSONL event stream instead of synthetic scenarios")
+    parser.add_argument('--json', help="Write results to this file")
+    parser.add_argument('--baseline', help="Compare against results from a previous --json run")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed relative regression against the baseline")
+    parser.add_argument('-v', '--verbose', action='store_true', help="Show output printed by the handlers")
+    args = parser.parse_args(argv)
+
+    async def runner():
+        results = {}
+        try:
+            if args.events:
+                tracemalloc.start()
+                results['recorded'] = await replay_scenario(args, load_events(args.events))
+                results['recorded']['peak_mem_kb'] = tracemalloc.get_traced_memory()[1] / 1024
+                tracemalloc.stop()
+            else:
+                for name in args.scenarios or SCENARIOS:
+                    if name not in SCENARIOS:
+                        parser.error(f"unknown scenario: {name}")
+                    results[name] = await run_scenario(name, args)
+        finally:
+            # Sessions must be closed on the loop that opened them, even when a scenario fails
+            await botmod.asset_cache.close()
+            await asset_server.stop()
+            botmod.stop_welcome_cards()
+        return results
+
+    with contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO()):
+        results = asyncio.run(runner())
+    for name, result in results.items():
+        print_result(name, result)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    failures = [f"{name}: {failure}" for name, result in results.items() for failure in result.get('failures', ())]
+    for failure in failures:
+        print(f"FAILED {failure}")
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare_to_baseline(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+    return 1 if failures or regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,6 +3,7 @@ import discord
 from discord.ext import commands
 import os
 import asyncio
+import contextlib
 from datetime import datetime
 
 # Bot setup with command prefix
@@ -15,7 +16,7 @@ bot = commands.Bot(command_prefix='!', intents=intents)
 # Log function
 async def send_log(guild, title, description, color=discord.Color.blue(), user=None, additional_fields=None):
     """Send a log message to the log channel"""
-    log_channel = guild.get_channel(LOG_CHANNEL_ID)
+    log_channel = config_channel(guild, 'log_channel')
     
     if log_channel:
         try:
@@ -43,13 +44,147 @@ async def send_log(guild, title, description, color=discord.Color.blue(), user=N
             
             embed.set_footer(text=f"Server: {guild.name}")
             
-            await log_channel.send(embed=embed)
+            # Logs are the lowest priority and are sent in the background
+            future = schedule_rest(PRIORITY_LOG, f"channel:{log_channel.id}", lambda: log_channel.send(embed=embed))
+            future.add_done_callback(_report_failure("Failed to send log"))
         except Exception as e:
             print(f"Failed to send log: {e}")
     else:
-        print(f"Log channel not found (ID: {LOG_CHANNEL_ID})")
+        print(f"Log channel not configured for {guild.name}")
 
-# Configuration
+# Interaction acknowledgement helpers
+import functools
+import time
+from collections import deque
+
+ACK_BUDGET = 1.5  # Defer up front when a command usually needs longer than this to respond
+ACK_SAFETY = 2.2  # Defer anyway if nothing has been sent after this long (Discord allows 3s)
+ACK_WINDOW = 50   # Number of recent runs used for the latency estimate
+
+# Per command: recent time-to-first-response samples and ack latency histograms
+command_response_times = {}
+ack_latency = {}
+ack_deferred = {}
+# Interaction id -> state for interactions whose handler is still running
+interaction_ack_state = {}
+
+def estimated_response_time(name):
+    """Rolling p90 of how long a command takes before its first response"""
+    samples = command_response_times.get(name)
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * 0.9))]
+
+def _record_ack(state):
+    """Record how long it took to acknowledge the interaction"""
+    if state['acked_at'] is not None:
+        return
+    state['acked_at'] = time.perf_counter()
+    name = state['name']
+    if name not in ack_latency:
+        ack_latency[name] = LatencyHistogram()
+    ack_latency[name].record(state['acked_at'] - state['started'])
+
+def _record_first_response(state):
+    """Feed the rolling estimate with the time until the handler had something to say"""
+    if state['responded']:
+        return
+    state['responded'] = True
+    samples = command_response_times.setdefault(state['name'], deque(maxlen=ACK_WINDOW))
+    samples.append(time.perf_counter() - state['started'])
+
+async def _defer(interaction, state):
+    """Defer the interaction unless it was already acknowledged"""
+    async with state['lock']:
+        if interaction.response.is_done():
+            return
+        try:
+            if state['update']:
+                await interaction.response.defer()
+            else:
+                await interaction.response.defer(ephemeral=state['ephemeral'], thinking=True)
+            ack_deferred[state['name']] = ack_deferred.get(state['name'], 0) + 1
+            _record_ack(state)
+        except discord.InteractionResponded:
+            pass
+        except Exception as e:
+            print(f"Failed to defer interaction for {state['name']}: {e}")
+
+async def _ack_guard(interaction, state):
+    """Defer if the handler is about to miss the acknowledgement deadline"""
+    await asyncio.sleep(ACK_SAFETY)
+    await _defer(interaction, state)
+
+def auto_defer(name, ephemeral=False, update=False):
+    """Make sure the interaction is acknowledged in time.
+
+    Commands whose rolling response time estimate exceeds ACK_BUDGET are deferred
+    immediately; everything else is deferred by a guard after ACK_SAFETY seconds if it
+    has not responded yet. Handlers must send through respond()/respond_edit() so the
+    response goes through the right channel. Use update=True for component callbacks
+    that edit the message they are attached to.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            interaction = next(a for a in args if hasattr(a, 'response') and hasattr(a, 'followup'))
+            state = {
+                'name': name,
+                'ephemeral': ephemeral,
+                'update': update,
+                'started': time.perf_counter(),
+                'acked_at': None,
+                'responded': False,
+                'lock': asyncio.Lock(),
+            }
+            interaction_ack_state[interaction.id] = state
+
+            if estimated_response_time(name) > ACK_BUDGET:
+                await _defer(interaction, state)
+            guard = asyncio.create_task(_ack_guard(interaction, state))
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                guard.cancel()
+                interaction_ack_state.pop(interaction.id, None)
+        return wrapper
+    return decorator
+
+async def respond(interaction, content=None, *, wait=False, **kwargs):
+    """Send a message as the interaction response, or as a followup once it is acknowledged.
+
+    With wait=True the sent message is returned in both cases.
+    """
+    state = interaction_ack_state.get(interaction.id)
+    if state is None:
+        if interaction.response.is_done():
+            return await interaction.followup.send(content, wait=wait, **kwargs)
+        await interaction.response.send_message(content, **kwargs)
+        return await interaction.original_response() if wait else None
+
+    _record_first_response(state)
+    async with state['lock']:
+        if interaction.response.is_done():
+            return await interaction.followup.send(content, wait=wait, **kwargs)
+        await interaction.response.send_message(content, **kwargs)
+        _record_ack(state)
+    return await interaction.original_response() if wait else None
+
+async def respond_edit(interaction, **kwargs):
+    """Edit the message a component is attached to, whether or not the interaction was deferred"""
+    state = interaction_ack_state.get(interaction.id)
+    if state is not None:
+        _record_first_response(state)
+    async with state['lock'] if state else contextlib.nullcontext():
+        if interaction.response.is_done():
+            await interaction.edit_original_response(**kwargs)
+            return
+        await interaction.response.edit_message(**kwargs)
+        if state is not None:
+            _record_ack(state)
+
+# Configuration (defaults, each guild can override them with /setconfig, see "Guild configuration")
 WELCOME_CHANNEL_ID = 1125419386220585023  # Welcome channel
 REVIEW_CHANNEL_ID = 1380480944011612170   # Review channel
 LOG_CHANNEL_ID = 1252776840850964501      # Log channel
@@ -59,20 +194,12 @@ TICKET_CATEGORY_ID = 1383361163399528478  # Category for tickets
 @bot.event
 async def on_member_join(member):
     """Welcome new members with enhanced embed"""
-    welcome_channel = member.guild.get_channel(WELCOME_CHANNEL_ID)
+    welcome_channel = config_channel(member.guild, 'welcome_channel')
     
     if welcome_channel:
         try:
-            # Create welcome embed
-            embed = discord.Embed(
-                title="👋 Welcome!",
-                description=f"Hey {member.mention}, welcome to **{member.guild.name}**!\nWelcome to the best roblox gambling sites!",
-                color=discord.Color.green()
-            )
-            embed.set_thumbnail(url=member.avatar.url if member.avatar else member.default_avatar.url)
-            embed.set_footer(text="Enjoy your stay with us!")
-            
-            await welcome_channel.send(embed=embed)
+            # Welcome card, or the plain welcome embed when cards can't keep up
+            await send_welcome(member, welcome_channel)
             print(f"Welcomed {member.name} to the server")
             
             # Log member join
@@ -91,23 +218,20 @@ async def on_member_join(member):
         except Exception as e:
             print(f"Failed to send welcome message: {e}")
     else:
-        print(f"Welcome channel not found (ID: {WELCOME_CHANNEL_ID})")
+        print(f"Welcome channel not configured for {member.guild.name}")
 
 @bot.event
 async def on_member_remove(member):
     """Send goodbye message when member leaves"""
-    welcome_channel = member.guild.get_channel(WELCOME_CHANNEL_ID)
+    welcome_channel = config_channel(member.guild, 'welcome_channel')
     
     if welcome_channel:
         try:
             # Create goodbye embed
-            embed = discord.Embed(
-                title="😢 Goodbye!",
-                description=f"{member.name} has left the server.",
-                color=discord.Color.red()
+            embed = render_embed(
+                'goodbye', member.guild,
+                name=member.name, avatar=member.avatar.url if member.avatar else member.default_avatar.url
             )
-            embed.set_thumbnail(url=member.avatar.url if member.avatar else member.default_avatar.url)
-            embed.set_footer(text="Hope to see you again!")
             
             await welcome_channel.send(embed=embed)
             print(f"{member.name} left the server")
@@ -128,7 +252,7 @@ async def on_member_remove(member):
         except Exception as e:
             print(f"Failed to send goodbye message: {e}")
     else:
-        print(f"Welcome channel not found (ID: {WELCOME_CHANNEL_ID})")
+        print(f"Welcome channel not configured for {member.guild.name}")
 
 @bot.event
 async def on_ready():
@@ -161,7 +285,7 @@ async def on_ready():
 
 async def setup_ticket_panel(guild):
     """Set up the ticket creation panel"""
-    ticket_channel = guild.get_channel(TICKET_CHANNEL_ID)
+    ticket_channel = config_channel(guild, 'ticket_channel')
     
     if ticket_channel:
         try:
@@ -203,85 +327,89 @@ class CloseTicketView(discord.ui.View):
 
 async def user_has_open_ticket(guild, user):
     """Check if user already has an open ticket"""
-    category = guild.get_channel(TICKET_CATEGORY_ID)
-    if not category:
-        return False
+    if guild.id not in ticket_category_pool:
+        load_ticket_pool(guild)
     
-    for channel in category.channels:
-        if channel.topic and f"({user.id})" in channel.topic:
-            return channel
-    return False
+    channel_id = ticket_owners.get((guild.id, user.id))
+    channel = guild.get_channel_or_thread(channel_id) if channel_id else None
+    if channel is None:
+        ticket_owners.pop((guild.id, user.id), None)
+        return False
+    return channel
+
+# Ticket creations in flight, (guild_id, user_id) -> task shared by every click of that user
+ticket_creations = {}
 
+@auto_defer('ticket_create', ephemeral=True)
 async def handle_ticket_creation(interaction):
     """Handle ticket creation"""
     guild = interaction.guild
     user = interaction.user
-    category = guild.get_channel(TICKET_CATEGORY_ID)
     
-    if not category:
-        await interaction.response.send_message("❌ Ticket category not found!", ephemeral=True)
+    # Fast repeated clicks wait for the same creation instead of racing the open ticket check
+    key = (guild.id, user.id)
+    creation = ticket_creations.get(key)
+    started = creation is None
+    if started:
+        creation = ticket_creations[key] = asyncio.ensure_future(open_ticket(guild, user))
+        creation.add_done_callback(lambda _: ticket_creations.pop(key, None))
+    
+    try:
+        ticket_channel, error = await asyncio.shield(creation)
+    except Exception as e:
+        await respond(interaction, f"❌ Failed to create ticket: {str(e)}", ephemeral=True)
+        if started:
+            print(f"Ticket creation error: {e}")
         return
     
+    if error:
+        await respond(interaction, error, ephemeral=True)
+    else:
+        await respond(interaction, f"✅ Ticket created! Please check {ticket_channel.mention}", ephemeral=True)
+
+async def open_ticket(guild, user):
+    """Create a ticket for a user unless they already have one.
+
+    Returns (ticket channel, None) or (None, error message to show the user).
+    """
     # Check if user already has an open ticket
     existing_ticket = await user_has_open_ticket(guild, user)
     if existing_ticket:
-        await interaction.response.send_message(f"❌ You already have an open ticket: {existing_ticket.mention}\n\nPlease close your current ticket before creating a new one.", ephemeral=True)
-        return
+        return None, f"❌ You already have an open ticket: {existing_ticket.mention}\n\nPlease close your current ticket before creating a new one."
     
-    try:
-        # Create private ticket channel
-        overwrites = {
-            guild.default_role: discord.PermissionOverwrite(read_messages=False),
-            user: discord.PermissionOverwrite(read_messages=True, send_messages=True, attach_files=True, embed_links=True),
-            guild.me: discord.PermissionOverwrite(read_messages=True, send_messages=True, manage_messages=True)
-        }
-        
-        # Add permissions for roles with manage_channels permission (staff roles)
-        for role in guild.roles:
-            if role.permissions.manage_channels and not role.is_default():
-                overwrites[role] = discord.PermissionOverwrite(read_messages=True, send_messages=True, manage_messages=True)
-        
-        # Create the channel
-        ticket_channel = await guild.create_text_channel(
-            name=f"ticket-{user.name.lower()}-{user.discriminator}",
-            category=category,
-            overwrites=overwrites,
-            topic=f"Ticket created by {user} ({user.id})"
-        )
-        
-        # Create welcome embed for the ticket
-        embed = discord.Embed(
-            title="🎫 Support Ticket Created",
-            description=f"Hello {user.mention}! Your ticket has been created.\n\nPlease describe your issue in detail and our staff will assist you shortly.",
-            color=discord.Color.green()
-        )
-        embed.add_field(name="Ticket Creator", value=user.mention, inline=True)
-        embed.add_field(name="Created", value=f"<t:{int(discord.utils.utcnow().timestamp())}:F>", inline=True)
-        embed.set_footer(text="Staff will be with you shortly!")
-        
-        # Send welcome message with close button
-        close_view = CloseTicketView()
-        await ticket_channel.send(f"{user.mention}", embed=embed, view=close_view)
-        
-        # Respond to interaction
-        await interaction.response.send_message(f"✅ Ticket created! Please check {ticket_channel.mention}", ephemeral=True)
-        
-        # Log ticket creation
-        await send_log(
-            guild,
-            "Ticket Created",
-            f"New support ticket created by {user.mention}",
-            color=discord.Color.green(),
-            user=user,
-            additional_fields=[
-                {"name": "Ticket Channel", "value": ticket_channel.mention, "inline": True},
-                {"name": "Category", "value": category.name, "inline": True}
-            ]
-        )
-        
-    except Exception as e:
-        await interaction.response.send_message(f"❌ Failed to create ticket: {str(e)}", ephemeral=True)
-        print(f"Ticket creation error: {e}")
+    # Create a private thread or channel, depending on the guild's ticket backend
+    if get_ticket_backend(guild.id) == 'thread':
+        ticket_channel = await create_ticket_thread(guild, user)
+        if ticket_channel is None:
+            return None, "❌ Ticket channel not found!"
+    else:
+        ticket_channel = await create_ticket_channel(guild, user)
+        if ticket_channel is None:
+            return None, "❌ Ticket category not found!"
+    ticket_owners[(guild.id, user.id)] = ticket_channel.id
+    record_ticket_event('created', ticket_channel, user.id)
+    touch_ticket(ticket_channel.id)
+    
+    # Create welcome embed for the ticket
+    embed = render_embed('ticket_created', guild, user=user.mention, created=int(discord.utils.utcnow().timestamp()))
+    
+    # Send welcome message with close button
+    close_view = CloseTicketView()
+    await ticket_channel.send(f"{user.mention}", embed=embed, view=close_view)
+    
+    # Log ticket creation
+    await send_log(
+        guild,
+        "Ticket Created",
+        f"New support ticket created by {user.mention}",
+        color=discord.Color.green(),
+        user=user,
+        additional_fields=[
+            {"name": "Ticket Channel", "value": ticket_channel.mention, "inline": True},
+            {"name": "Category", "value": ticket_location(ticket_channel), "inline": True}
+        ]
+    )
+    return ticket_channel, None
 
 async def handle_ticket_close(interaction):
     """Handle ticket closing"""
@@ -289,20 +417,13 @@ async def handle_ticket_close(interaction):
         await interaction.response.send_message("❌ This command can only be used in ticket channels!", ephemeral=True)
         return
     
-    # Extract ticket creator from channel topic or name
-    ticket_creator_id = None
-    if interaction.channel.topic:
-        try:
-            ticket_creator_id = int(interaction.channel.topic.split("(")[1].split(")")[0])
-        except:
-            pass
-    
-    ticket_creator = interaction.guild.get_member(ticket_creator_id) if ticket_creator_id else None
+    # Extract ticket creator from channel topic, threads have none so fall back to the ticket index
+    ticket_creator_id = _ticket_topic_owner(interaction.channel) or open_tickets.get(interaction.channel.id, {}).get('user_id')
     
-    # Check permissions (ticket creator or staff)
+    # Check permissions (ticket creator or staff), by id since the creator may not be cached
     has_permission = (
         interaction.user.guild_permissions.manage_channels or  # Staff
-        (ticket_creator and interaction.user.id == ticket_creator.id)  # Ticket creator
+        (ticket_creator_id is not None and interaction.user.id == ticket_creator_id)  # Ticket creator
     )
     
     if not has_permission:
@@ -321,27 +442,51 @@ async def handle_ticket_close(interaction):
         
         await interaction.response.send_message(embed=embed)
         
-        # Log ticket closure
-        await send_log(
-            interaction.guild,
-            "Ticket Closed",
-            f"Support ticket closed in {interaction.channel.mention}",
-            color=discord.Color.red(),
-            user=interaction.user,
-            additional_fields=[
-                {"name": "Ticket Channel", "value": interaction.channel.name, "inline": True},
-                {"name": "Original Creator", "value": ticket_creator.mention if ticket_creator else "Unknown", "inline": True}
-            ]
-        )
-        
-        # Wait 10 seconds then delete
-        await asyncio.sleep(10)
-        await interaction.channel.delete(reason=f"Ticket closed by {interaction.user}")
+        if not await close_ticket_channel(interaction.channel, ticket_creator_id, closed_by=interaction.user):
+            await interaction.followup.send("❌ Failed to save the ticket transcript, so the channel was not deleted.", ephemeral=True)
         
     except Exception as e:
         await interaction.followup.send(f"❌ Failed to close ticket: {str(e)}", ephemeral=True)
         print(f"Ticket close error: {e}")
 
+async def close_ticket_channel(channel, ticket_creator_id, closed_by=None, delay=10, reason="Support ticket closed"):
+    """Archive, log and delete a ticket channel after the given delay.
+
+    Returns False (and keeps the channel) if the transcript could not be saved.
+    """
+    # Save the transcript while the countdown runs
+    try:
+        transcript, _ = await asyncio.gather(
+            archive_ticket_transcript(channel, ticket_creator_id),
+            asyncio.sleep(delay)
+        )
+    except Exception as e:
+        print(f"Transcript archive error: {e}")
+        return False
+    
+    # Log ticket closure
+    await send_log(
+        channel.guild,
+        "Ticket Closed",
+        f"{reason} in {channel.mention}",
+        color=discord.Color.red(),
+        user=closed_by,
+        additional_fields=[
+            {"name": "Ticket Channel", "value": channel.name, "inline": True},
+            {"name": "Original Creator", "value": f"<@{ticket_creator_id}>" if ticket_creator_id else "Unknown", "inline": True},
+            {"name": "Transcript", "value": f"{transcript['messages']} messages ({os.path.basename(transcript['path'])})", "inline": False}
+        ]
+    )
+    
+    record_ticket_event('closed', channel, ticket_creator_id)
+    forget_ticket(channel.id)
+    await channel.delete(reason=f"Ticket closed by {closed_by}" if closed_by else reason)
+    if channel.type is not discord.ChannelType.private_thread:
+        release_ticket_category(channel.category_id)
+    if ticket_owners.get((channel.guild.id, ticket_creator_id)) == channel.id:
+        del ticket_owners[(channel.guild.id, ticket_creator_id)]
+    return True
+
 @bot.event
 async def on_message(message):
     """Process messages and commands"""
@@ -367,38 +512,74 @@ async def on_message(message):
     await bot.process_commands(message)
 
 @bot.event
-async def on_message_delete(message):
-    """Log deleted messages"""
-    if message.author.bot:
+async def on_raw_message_delete(payload):
+    """Log deleted messages, with their content if the message was still cached"""
+    message = payload.cached_message
+    compact = compact_messages.pop(payload.message_id, None)  # Lean profile: our own cache
+    if message is not None and message.author.bot:
+        return
+    guild = message.guild if message is not None else bot.get_guild(payload.guild_id or 0)
+    if guild is None:
         return
+    
+    fields = [{"name": "Channel", "value": f"<#{payload.channel_id}>", "inline": True}]
+    if message is not None:
+        queue_search_entry(message, 'deleted')
+        content = message.content[:100] + "..." if len(message.content) > 100 else message.content or "*No text content*"
+    elif compact is not None:
+        queue_compact_search_entry(compact, 'deleted')
+        content = compact.content[:100] + "..." if len(compact.content) > 100 else compact.content or "*No text content*"
+        fields.append({"name": "Author", "value": f"{compact.author} (<@{compact.author_id}>)", "inline": True})
+    else:
+        content = "*Not cached, content unknown*"
+    fields.append({"name": "Deleted Content", "value": content, "inline": False})
         
     await send_log(
-        message.guild,
+        guild,
         "Message Deleted",
-        f"Message deleted in {message.channel.mention}",
+        f"Message deleted in <#{payload.channel_id}>",
         color=discord.Color.orange(),
-        user=message.author,
-        additional_fields=[
-            {"name": "Channel", "value": message.channel.mention, "inline": True},
-            {"name": "Deleted Content", "value": message.content[:100] + "..." if len(message.content) > 100 else message.content or "*No text content*", "inline": False}
-        ]
+        user=message.author if message is not None else None,
+        additional_fields=fields
     )
 
 @bot.event
-async def on_message_edit(before, after):
-    """Log edited messages"""
-    if before.author.bot or before.content == after.content:
+async def on_raw_message_edit(payload):
+    """Log edited messages, with the old version if the message was still cached"""
+    before, after = payload.cached_message, payload.message
+    if after.guild is None or after.author.bot:
+        return
+    # Without discord.py's message cache (lean profile) the old text comes from our compact cache
+    compact = compact_messages.get(payload.message_id) if before is None else None
+    if compact is not None:
+        old_text, current = compact.content, after.content[:COMPACT_MESSAGE_CONTENT]
+        compact.content = current
+    else:
+        old_text, current = before.content if before is not None else None, after.content
+    if old_text is not None and old_text == current:
         return
+    if old_text is None and after.edited_at is None:
+        return  # Embed unfurls and similar updates, not an edit
+    
+    # Index the old version, the new one is still visible in the channel
+    if before is not None:
+        queue_search_entry(before, 'edited')
+    elif compact is not None:
+        queue_compact_search_entry(compact, 'edited', old_text)
+    if old_text is not None:
+        old_content = old_text[:100] + "..." if len(old_text) > 100 else old_text or "*No text content*"
+    else:
+        old_content = "*Not cached, content unknown*"
         
     await send_log(
-        before.guild,
+        after.guild,
         "Message Edited",
-        f"Message edited in {before.channel.mention}",
+        f"Message edited in <#{payload.channel_id}>",
         color=discord.Color.yellow(),
-        user=before.author,
+        user=after.author,
         additional_fields=[
-            {"name": "Channel", "value": before.channel.mention, "inline": True},
-            {"name": "Before", "value": before.content[:100] + "..." if len(before.content) > 100 else before.content or "*No text content*", "inline": False},
+            {"name": "Channel", "value": f"<#{payload.channel_id}>", "inline": True},
+            {"name": "Before", "value": old_content, "inline": False},
             {"name": "After", "value": after.content[:100] + "..." if len(after.content) > 100 else after.content or "*No text content*", "inline": False}
         ]
     )
@@ -532,6 +713,7 @@ async def on_voice_state_update(member, before, after):
 @bot.event
 async def on_guild_channel_create(channel):
     """Log channel creation"""
+    entry = await audit_log_index.find(channel.guild, discord.AuditLogAction.channel_create, channel.id)
     await send_log(
         channel.guild,
         "Channel Created",
@@ -540,13 +722,15 @@ async def on_guild_channel_create(channel):
         additional_fields=[
             {"name": "Channel Name", "value": channel.name, "inline": True},
             {"name": "Channel Type", "value": str(channel.type).replace('_', ' ').title(), "inline": True},
-            {"name": "Category", "value": channel.category.name if channel.category else "None", "inline": True}
+            {"name": "Category", "value": channel.category.name if channel.category else "None", "inline": True},
+            {"name": "Created By", "value": audit_moderator(entry), "inline": True}
         ]
     )
 
 @bot.event
 async def on_guild_channel_delete(channel):
     """Log channel deletion"""
+    entry = await audit_log_index.find(channel.guild, discord.AuditLogAction.channel_delete, channel.id)
     await send_log(
         channel.guild,
         "Channel Deleted",
@@ -555,13 +739,15 @@ async def on_guild_channel_delete(channel):
         additional_fields=[
             {"name": "Channel Name", "value": channel.name, "inline": True},
             {"name": "Channel Type", "value": str(channel.type).replace('_', ' ').title(), "inline": True},
-            {"name": "Category", "value": channel.category.name if channel.category else "None", "inline": True}
+            {"name": "Category", "value": channel.category.name if channel.category else "None", "inline": True},
+            {"name": "Deleted By", "value": audit_moderator(entry), "inline": True}
         ]
     )
 
 @bot.event
 async def on_guild_role_create(role):
     """Log role creation"""
+    entry = await audit_log_index.find(role.guild, discord.AuditLogAction.role_create, role.id)
     await send_log(
         role.guild,
         "Role Created",
@@ -570,13 +756,15 @@ async def on_guild_role_create(role):
         additional_fields=[
             {"name": "Role Name", "value": role.name, "inline": True},
             {"name": "Color", "value": str(role.color), "inline": True},
-            {"name": "Mentionable", "value": "Yes" if role.mentionable else "No", "inline": True}
+            {"name": "Mentionable", "value": "Yes" if role.mentionable else "No", "inline": True},
+            {"name": "Created By", "value": audit_moderator(entry), "inline": True}
         ]
     )
 
 @bot.event
 async def on_guild_role_delete(role):
     """Log role deletion"""
+    entry = await audit_log_index.find(role.guild, discord.AuditLogAction.role_delete, role.id)
     await send_log(
         role.guild,
         "Role Deleted",
@@ -585,12 +773,14 @@ async def on_guild_role_delete(role):
         additional_fields=[
             {"name": "Role Name", "value": role.name, "inline": True},
             {"name": "Color", "value": str(role.color), "inline": True},
-            {"name": "Members Had Role", "value": str(len(role.members)), "inline": True}
+            {"name": "Members Had Role", "value": str(len(role.members)), "inline": True},
+            {"name": "Deleted By", "value": audit_moderator(entry), "inline": True}
         ]
     )
 
 # Slash command: Review with site selection
 @bot.tree.command(name='review', description='Submit a review for Luckshot.live or Coinclash.live (1-5 stars)')
+@auto_defer('review', ephemeral=True)
 async def review_slash(interaction: discord.Interaction, site: str, rating: int, feedback: str):
     """Submit a review with site selection, rating and feedback"""
     
@@ -599,7 +789,8 @@ async def review_slash(interaction: discord.Interaction, site: str, rating: int,
     site_lower = site.lower()
     
     if site_lower not in valid_sites:
-        await interaction.response.send_message(
+        await respond(
+            interaction,
             f"❌ Invalid site! Please choose from: **{', '.join(valid_sites)}**", 
             ephemeral=True
         )
@@ -607,7 +798,8 @@ async def review_slash(interaction: discord.Interaction, site: str, rating: int,
     
     # Validate rating
     if not 1 <= rating <= 5:
-        await interaction.response.send_message(
+        await respond(
+            interaction,
             "❌ Rating must be between 1 and 5 stars!", 
             ephemeral=True
         )
@@ -615,14 +807,16 @@ async def review_slash(interaction: discord.Interaction, site: str, rating: int,
     
     # Validate feedback length
     if len(feedback) > 1000:
-        await interaction.response.send_message(
+        await respond(
+            interaction,
             "❌ Feedback must be 1000 characters or less!", 
             ephemeral=True
         )
         return
     
     if len(feedback.strip()) < 5:
-        await interaction.response.send_message(
+        await respond(
+            interaction,
             "❌ Please provide more detailed feedback (at least 5 characters)!", 
             ephemeral=True
         )
@@ -656,7 +850,8 @@ async def review_slash(interaction: discord.Interaction, site: str, rating: int,
     )
     
     # Send confirmation to user
-    await interaction.response.send_message(
+    await respond(
+        interaction,
         f"✅ Review submitted successfully for **{site_lower.title()}**! Thank you for your feedback.", 
         ephemeral=True
     )
@@ -677,12 +872,12 @@ async def review_slash(interaction: discord.Interaction, site: str, rating: int,
     )
     
     # Post review to dedicated review channel
-    review_channel = interaction.guild.get_channel(REVIEW_CHANNEL_ID)
+    review_channel = config_channel(interaction.guild, 'review_channel')
     if review_channel:
         await review_channel.send(embed=embed)
     else:
         # Fallback to current channel if review channel not found
-        await interaction.followup.send(embed=embed)
+        await respond(interaction, embed=embed)
 
 # Autocomplete for site parameter
 @review_slash.autocomplete('site')
@@ -728,6 +923,123 @@ active_giveaways = {}
 # Store completed giveaways for reroll functionality
 completed_giveaways = {}
 
+# Giveaway winner selection
+import hashlib
+import heapq
+import secrets
+from array import array
+from collections import defaultdict
+
+# Extra entries for members with these roles, role_id -> weight (members without one count once).
+# Default for guilds that haven't set their own with /giveawayweight (config key giveaway_weights)
+GIVEAWAY_ROLE_WEIGHTS = {}
+
+class AliasTable:
+    """Vose alias table: O(n) to build, O(1) per weighted pick"""
+    def __init__(self, weights):
+        n = len(weights)
+        total = float(sum(weights))
+        if n == 0 or total <= 0:
+            raise ValueError("Need at least one positive weight")
+        scaled = [w * n / total for w in weights]
+        self.prob = array('d', [0.0]) * n
+        self.alias = array('l', [0]) * n
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            (small if scaled[l] < 1.0 else large).append(l)
+        for i in large + small:  # Leftovers are 1 up to rounding
+            self.prob[i] = 1.0
+
+    def pick(self, rng):
+        i = int(rng.random() * len(self.prob))
+        return i if rng.random() < self.prob[i] else self.alias[i]
+
+def giveaway_weights(guild, participants):
+    """Get the entry weight of every participant, or None when all weigh the same"""
+    role_weights = get_config(guild, 'giveaway_weights') if guild else GIVEAWAY_ROLE_WEIGHTS
+    if not role_weights:
+        return None
+    weights = []
+    for user_id in participants:
+        # Snapshots cover members that aren't in the cache (lean profile, MEMBER_SNAPSHOT=1)
+        snapshot = get_member_snapshot(guild, user_id)
+        role_ids = snapshot.role_ids if snapshot else ()
+        weights.append(max((role_weights.get(role_id, 1) for role_id in role_ids), default=1))
+    return weights if any(w != 1 for w in weights) else None
+
+def entries_digest(participants, weights=None):
+    """Fingerprint of the entry list a draw was made from, for audits"""
+    digest = hashlib.sha256(array('q', participants).tobytes())
+    if weights is not None:
+        digest.update(array('d', weights).tobytes())
+    return digest.hexdigest()[:16]
+
+def draw_winners(participants, count, weights=None, exclude=(), seed=None):
+    """Pick up to count distinct winners, skipping anyone in exclude.
+
+    The RNG is seeded from the OS CSPRNG unless a seed is given. The returned draw
+    record holds the seed and entry digest, so the same input replays the same winners.
+    """
+    seed = seed or secrets.token_hex(16)
+    rng = random.Random(seed)
+    exclude = set(exclude)
+    picked = set()
+    winners = []
+    n = len(participants)
+
+    # Role weights only take a few values, so the alias table is built over weight
+    # classes and a pick is a class followed by a uniform pick inside it
+    classes = table = None
+    if weights is not None and n:
+        by_weight = defaultdict(list)
+        for i, weight in enumerate(weights):
+            if weight > 0:
+                by_weight[weight].append(i)
+        classes = list(by_weight.values())
+        table = AliasTable([weight * len(members) for weight, members in by_weight.items()])
+
+    def pick():
+        if table is None:
+            return rng.randrange(n)
+        members = classes[table.pick(rng)]
+        return members[rng.randrange(len(members))]
+
+    # Rejection sampling touches only the picks, fine while few entrants are excluded
+    attempts = 0
+    while n and len(winners) < count and attempts < 4 * (count + len(exclude)) + 16:
+        attempts += 1
+        user_id = participants[pick()]
+        if user_id in exclude or user_id in picked:
+            continue
+        picked.add(user_id)
+        winners.append(user_id)
+
+    if len(winners) < count:
+        # Mostly excluded, draw the rest from what is left
+        remaining = [i for i, user_id in enumerate(participants) if user_id not in exclude and user_id not in picked]
+        if weights is None:
+            rest = rng.sample(remaining, min(count - len(winners), len(remaining)))
+        else:
+            # Weighted sampling without replacement (Efraimidis-Spirakis keys)
+            keyed = [(rng.random() ** (1.0 / weights[i]), i) for i in remaining if weights[i] > 0]
+            rest = [i for _, i in heapq.nlargest(count - len(winners), keyed)]
+        winners.extend(participants[i] for i in rest)
+
+    draw = {
+        'seed': seed,
+        'entrants': n,
+        'digest': entries_digest(participants, weights),
+        'weighted': weights is not None,
+        'winners': winners,
+        'drawn_at': datetime.utcnow()
+    }
+    return winners, draw
+
 def parse_duration(duration_str):
     """Parse duration string like '1m', '5m', '1h', '30s' into seconds"""
     duration_str = duration_str.lower().strip()
@@ -770,76 +1082,61 @@ async def auto_end_giveaway(giveaway_id, duration_seconds):
         winners_count = giveaway['winners']
         
         if not participants:
-            embed = discord.Embed(
-                title=" Giveaway Ended (Auto)",
-                description=f"**Prize:** {giveaway['prize']}\n\n No one entered the giveaway!",
-                color=0xff0000
-            )
+            embed = render_embed('giveaway_no_entries_auto', channel.guild, prize=giveaway['prize'])
             await channel.send(embed=embed)
-            del active_giveaways[giveaway_id]
+            remove_active_giveaway(giveaway_id)
             return
         
-        # Pick winners
-        winners = random.sample(participants, min(winners_count, len(participants)))
+        # Pick winners off the event loop, large weighted draws take a while
+        eligible = await filter_eligible_participants(channel.guild, participants, giveaway.get('requirements'))
+        winners, draw = await asyncio.to_thread(draw_winners, eligible, winners_count, giveaway_weights(channel.guild, eligible))
         
-        # Create winners list
-        winner_mentions = []
-        for winner_id in winners:
-            user = channel.guild.get_member(winner_id)
-            if user:
-                winner_mentions.append(user.mention)
+        # Resolve all winners at once, winners who left are named instead of dropped
+        winner_members = await resolve_winners(channel.guild, winners)
+        winner_mentions = format_winner_mentions(winner_members)
         
         # Create result embed
-        embed = discord.Embed(
-            title=" Giveaway Ended! (Auto)",
-            description=f"**Prize:** {giveaway['prize']}\n**Host:** {giveaway['host']}",
-            color=0x00ff00
+        embed = render_embed(
+            'giveaway_result_auto', channel.guild,
+            prize=giveaway['prize'], host=giveaway['host'], winners="\n".join(winner_mentions),
+            participants=len(participants), giveaway_id=giveaway_id
         )
         
-        if winner_mentions:
-            embed.add_field(
-                name=" Winners",
-                value="\n".join(winner_mentions),
-                inline=False
-            )
-        
-        embed.add_field(name="Total Participants", value=str(len(participants)), inline=True)
-        embed.add_field(name="Giveaway ID", value=f"`{giveaway_id}`", inline=True)
-        embed.set_footer(text="Congratulations to the winners! - Use /greroll with the Giveaway ID to reroll")
-        
         await channel.send(embed=embed)
         
         # Send congratulations message
-        if winner_mentions:
-            congrats_msg = f" Congratulations {', '.join(winner_mentions)}! You won **{giveaway['prize']}**!"
+        if any(winner_members.values()):
+            congrats_msg = f" Congratulations {', '.join(m.mention for m in winner_members.values() if m)}! You won **{giveaway['prize']}**!"
             await channel.send(congrats_msg)
         
         # Update original giveaway message to show it ended
         try:
             if giveaway['message_id']:
-                message = await channel.fetch_message(giveaway['message_id'])
-                ended_embed = discord.Embed(
-                    title=" GIVEAWAY ENDED ",
-                    description=f"**Prize:** {giveaway['prize']}\n**Duration:** {giveaway['duration']}\n**Host:** {giveaway['host']}\n**Winners:** {giveaway['winners']}",
-                    color=0xff0000
+                message = channel.get_partial_message(giveaway['message_id'])
+                ended_embed = render_embed(
+                    'giveaway_ended', channel.guild,
+                    prize=giveaway['prize'], duration=giveaway['duration'], host=giveaway['host'],
+                    winners=giveaway['winners'], participants=len(giveaway['participants'])
                 )
-                ended_embed.add_field(name="Status", value=" Ended", inline=True)
-                ended_embed.add_field(name="Final Participants", value=f"{len(giveaway['participants'])} entered", inline=True)
-                ended_embed.set_footer(text="This giveaway has ended!")
-                await message.edit(embed=ended_embed, view=None)
+                # Replaces any participant count edit that is still queued
+                await schedule_rest(PRIORITY_PANEL, f"channel:{channel.id}", lambda: message.edit(embed=ended_embed, view=None), key=f"edit:{message.id}")
         except:
             pass
         
         # Store completed giveaway for reroll functionality
-        completed_giveaways[giveaway_id] = {
+        store_completed_giveaway(giveaway_id, {
             'prize': giveaway['prize'],
             'host': giveaway['host'],
             'participants': giveaway['participants'].copy(),
             'winners_count': giveaway['winners'],
             'channel_id': giveaway['channel_id'],
             'completed_at': datetime.utcnow(),
-            'last_winners': winners
-        }
+            'last_winners': winners,
+            'draws': [draw],
+            'requirements': giveaway.get('requirements'),
+            'deliveries': {}
+        })
+        notify_giveaway_winners(channel.guild, giveaway_id, winner_members)
         
         # Log giveaway end
         try:
@@ -852,14 +1149,15 @@ async def auto_end_giveaway(giveaway_id, duration_seconds):
                     {"name": "Prize", "value": giveaway['prize'], "inline": True},
                     {"name": "Participants", "value": str(len(participants)), "inline": True},
                     {"name": "Winners", "value": "\n".join(winner_mentions) if winner_mentions else "None", "inline": False},
-                    {"name": "Giveaway ID", "value": f"`{giveaway_id}`", "inline": True}
+                    {"name": "Giveaway ID", "value": f"`{giveaway_id}`", "inline": True},
+                    {"name": "Draw Seed", "value": f"`{draw['seed']}`", "inline": True}
                 ]
             )
         except Exception as e:
             print(f"Error sending log: {e}")
         
         # Remove from active giveaways
-        del active_giveaways[giveaway_id]
+        remove_active_giveaway(giveaway_id)
         
     except Exception as e:
         print(f"Error auto-ending giveaway {giveaway_id}: {e}")
@@ -880,6 +1178,12 @@ class GiveawayView(discord.ui.View):
             await interaction.followup.send(" This giveaway is no longer active!", ephemeral=True)
             return
         
+        # Checked against the member in the interaction payload, no fetches per click
+        reason = check_giveaway_entry(giveaway.get('requirements'), interaction.user)
+        if reason:
+            await interaction.followup.send(f"❌ You can't enter this giveaway: {reason}.", ephemeral=True)
+            return
+        
         user_id = interaction.user.id
         if user_id in giveaway['participants']:
             await interaction.followup.send(" You're already entered in this giveaway!", ephemeral=True)
@@ -888,93 +1192,118 @@ class GiveawayView(discord.ui.View):
         giveaway['participants'].append(user_id)
         await interaction.followup.send(" You've entered the giveaway! Good luck!", ephemeral=True)
         
-        # Update embed with new participant count
-        embed = discord.Embed(
-            title=" GIVEAWAY ",
-            description=f"**Prize:** {giveaway['prize']}\n**Duration:** {giveaway['duration']}\n**Host:** {giveaway['host']}\n**Winners:** {giveaway['winners']}",
-            color=0x00ff00
-        )
-        embed.add_field(name="Participants", value=f"{len(giveaway['participants'])} entered", inline=True)
-        embed.set_footer(text="Click the button below to enter!")
-        
-        # Get the original message and edit it
-        try:
-            channel = interaction.guild.get_channel(giveaway['channel_id'])
-            if channel and giveaway['message_id']:
-                message = await channel.fetch_message(giveaway['message_id'])
-                await message.edit(embed=embed, view=self)
-        except discord.NotFound:
-            print(f"Could not find message {giveaway['message_id']} in channel {giveaway['channel_id']}")
-        except discord.Forbidden:
-            print("Bot doesn't have permission to edit the message")
-        except Exception as e:
-            print(f"Error updating giveaway message: {e}")
+        # Update the giveaway message with the new participant count. Queued edits of the
+        # same message are coalesced, so a burst of entries only sends the latest count.
+        channel = interaction.guild.get_channel(giveaway['channel_id'])
+        if channel and giveaway['message_id']:
+            message = channel.get_partial_message(giveaway['message_id'])
+            view = self
 
-# Slash command: Start Giveaway
-@bot.tree.command(name='giveaway', description='Start a giveaway')
-async def giveaway_slash(interaction: discord.Interaction, prize: str, duration: str, winners: int = 1):
-    """Start a new giveaway"""
-    
+            async def edit_giveaway_message():
+                embed = build_giveaway_embed(interaction.guild, giveaway)
+                await message.edit(embed=embed, view=view)
+
+            future = schedule_rest(PRIORITY_PANEL, f"channel:{channel.id}", edit_giveaway_message, key=f"edit:{message.id}")
+            future.add_done_callback(_report_failure(f"Error updating giveaway message {giveaway['message_id']}"))
+
+def build_giveaway_embed(guild, giveaway):
+    """The embed of a running giveaway, rebuilt with the current participant count"""
+    return render_embed(
+        'giveaway_active', guild,
+        prize=giveaway['prize'], duration=giveaway['duration'], host=giveaway['host'], winners=giveaway['winners'],
+        participants=len(giveaway['participants']), ends=int(giveaway['end_time'].replace(tzinfo=timezone.utc).timestamp()),
+        requirements=format_giveaway_requirements(giveaway.get('requirements')) or "",
+        footer=giveaway.get('footer', "Click the button below to enter!")
+    )
+
+def validate_giveaway_options(prize, duration, winners):
+    """Check giveaway options, returning (duration in seconds, None) or (None, error message)"""
     if winners < 1 or winners > 20:
-        await interaction.response.send_message(" Number of winners must be between 1 and 20!", ephemeral=True)
-        return
+        return None, " Number of winners must be between 1 and 20!"
     
     if len(prize) > 100:
-        await interaction.response.send_message(" Prize description must be 100 characters or less!", ephemeral=True)
-        return
+        return None, " Prize description must be 100 characters or less!"
     
     # Parse duration
     duration_seconds = parse_duration(duration)
     if duration_seconds is None:
-        await interaction.response.send_message(" Invalid duration format! Use format like: 30s, 5m, 1h, 2d", ephemeral=True)
-        return
+        return None, " Invalid duration format! Use format like: 30s, 5m, 1h, 2d"
     
     if duration_seconds < 10:  # Minimum 10 seconds
-        await interaction.response.send_message(" Duration must be at least 10 seconds!", ephemeral=True)
-        return
+        return None, " Duration must be at least 10 seconds!"
     
     if duration_seconds > 86400 * 7:  # Maximum 7 days
-        await interaction.response.send_message(" Duration cannot exceed 7 days!", ephemeral=True)
+        return None, " Duration cannot exceed 7 days!"
+    
+    return duration_seconds, None
+
+def parse_giveaway_requirements(required_role=None, min_account_age=None, min_server_age=None):
+    """Parse entry requirement options, returning (requirements, None) or (None, error message)"""
+    # Ages use the same format as the duration
+    account_age = parse_duration(min_account_age) if min_account_age else 0
+    server_age = parse_duration(min_server_age) if min_server_age else 0
+    if account_age is None or server_age is None:
+        return None, "❌ Invalid age format! Use format like: 30s, 5m, 1h, 2d"
+    return giveaway_requirements(required_role, account_age, server_age), None
+
+# Slash command: Start Giveaway
+@bot.tree.command(name='giveaway', description='Start a giveaway')
+@auto_defer('giveaway')
+async def giveaway_slash(interaction: discord.Interaction, prize: str, duration: str, winners: int = 1,
+                         required_role: discord.Role = None, min_account_age: str = None, min_server_age: str = None):
+    """Start a new giveaway"""
+    
+    duration_seconds, error = validate_giveaway_options(prize, duration, winners)
+    if error:
+        await respond(interaction, error, ephemeral=True)
+        return
+    
+    requirements, error = parse_giveaway_requirements(required_role, min_account_age, min_server_age)
+    if error:
+        await respond(interaction, error, ephemeral=True)
         return
     
     # Create giveaway ID
     giveaway_id = f"{interaction.guild.id}_{interaction.user.id}_{int(discord.utils.utcnow().timestamp())}"
     
+    await start_giveaway(
+        interaction.guild, interaction.channel, interaction.user, giveaway_id, prize, duration, duration_seconds, winners,
+        requirements=requirements, send=lambda **kwargs: respond(interaction, wait=True, **kwargs)
+    )
+
+async def start_giveaway(guild, channel, host, giveaway_id, prize, duration, duration_seconds, winners,
+                         requirements=None, send=None, footer="Click the button below to enter!"):
+    """Post a giveaway message and start its end timer. send posts the message, channel.send by default"""
+    send = send or channel.send
+    
     # Calculate end time
     end_time = datetime.utcnow() + timedelta(seconds=duration_seconds)
     
     # Store giveaway data
-    active_giveaways[giveaway_id] = {
+    add_active_giveaway(giveaway_id, {
         'prize': prize,
         'duration': duration,
         'duration_seconds': duration_seconds,
         'end_time': end_time,
         'winners': winners,
-        'host': interaction.user.mention,
+        'host': host.mention,
         'participants': [],
-        'channel_id': interaction.channel.id,
-        'message_id': None
-    }
+        'channel_id': channel.id,
+        'message_id': None,
+        'requirements': requirements,
+        'footer': footer
+    })
     
     # Create giveaway embed
-    embed = discord.Embed(
-        title=" GIVEAWAY ",
-        description=f"**Prize:** {prize}\n**Duration:** {duration}\n**Host:** {interaction.user.mention}\n**Winners:** {winners}",
-        color=0x00ff00
-    )
-    embed.add_field(name="Participants", value="0 entered", inline=True)
-    embed.add_field(name="Ends", value=f"<t:{int(end_time.timestamp())}:R>", inline=True)
-    embed.set_footer(text="Click the button below to enter!")
+    embed = build_giveaway_embed(guild, active_giveaways[giveaway_id])
     
     # Create view with the giveaway ID
     view = GiveawayView(giveaway_id)
     
-    # Send the message
-    await interaction.response.send_message(embed=embed, view=view)
-    
-    # Store message ID for later reference
+    # Send the message and store its ID for later reference
+    message = None
     try:
-        message = await interaction.original_response()
+        message = await send(embed=embed, view=view)
         active_giveaways[giveaway_id]['message_id'] = message.id
     except Exception as e:
         print(f"Error getting original response: {e}")
@@ -985,39 +1314,36 @@ async def giveaway_slash(interaction: discord.Interaction, prize: str, duration:
     # Log giveaway creation (make sure send_log function exists)
     try:
         await send_log(
-            interaction.guild,
+            guild,
             "Giveaway Started",
-            f"New giveaway started by {interaction.user.mention}",
+            f"New giveaway started by {host.mention}",
             color=discord.Color.gold(),
-            user=interaction.user,
+            user=host,
             additional_fields=[
                 {"name": "Prize", "value": prize, "inline": True},
                 {"name": "Duration", "value": duration, "inline": True},
                 {"name": "Winners", "value": str(winners), "inline": True},
-                {"name": "Channel", "value": interaction.channel.mention, "inline": True},
+                {"name": "Channel", "value": channel.mention, "inline": True},
                 {"name": "Giveaway ID", "value": f"`{giveaway_id}`", "inline": True}
             ]
         )
     except Exception as e:
         print(f"Error sending log: {e}")
+    return message
 
 # Slash command: End Giveaway
 @bot.tree.command(name='gend', description='End a giveaway and pick winners')
-async def end_giveaway_slash(interaction: discord.Interaction):
-    """End the most recent giveaway in this channel"""
+@auto_defer('gend')
+async def end_giveaway_slash(interaction: discord.Interaction, giveaway: str = None):
+    """End a giveaway in this channel, the most recent one unless picked"""
     
     # Find giveaway in this channel
-    giveaway_id = None
-    giveaway_data = None
-    
-    for gid, gdata in active_giveaways.items():
-        if gdata['channel_id'] == interaction.channel.id:
-            giveaway_id = gid
-            giveaway_data = gdata
-            break
+    channel_giveaways = active_giveaways_by_channel.get(interaction.channel.id, {})
+    giveaway_id = giveaway.strip('`') if giveaway else next(reversed(channel_giveaways), None)
+    giveaway_data = active_giveaways.get(giveaway_id) if giveaway_id in channel_giveaways else None
     
     if not giveaway_data:
-        await interaction.response.send_message(" No active giveaway found in this channel!", ephemeral=True)
+        await respond(interaction, " No active giveaway found in this channel!", ephemeral=True)
         return
     
     # Check if user is host or has manage messages permission
@@ -1025,7 +1351,7 @@ async def end_giveaway_slash(interaction: discord.Interaction):
     has_permission = interaction.user.guild_permissions.manage_messages
     
     if not (is_host or has_permission):
-        await interaction.response.send_message(" Only the giveaway host or staff can end this giveaway!", ephemeral=True)
+        await respond(interaction, " Only the giveaway host or staff can end this giveaway!", ephemeral=True)
         return
     
     await end_giveaway(interaction, giveaway_id, giveaway_data)
@@ -1037,61 +1363,47 @@ async def end_giveaway(interaction, giveaway_id, giveaway_data):
     winners_count = giveaway_data['winners']
     
     if not participants:
-        embed = discord.Embed(
-            title=" Giveaway Ended",
-            description=f"**Prize:** {giveaway_data['prize']}\n\n No one entered the giveaway!",
-            color=0xff0000
-        )
-        await interaction.response.send_message(embed=embed)
-        del active_giveaways[giveaway_id]
+        embed = render_embed('giveaway_no_entries', interaction.guild, prize=giveaway_data['prize'])
+        await respond(interaction, embed=embed)
+        remove_active_giveaway(giveaway_id)
         return
     
     # Pick winners
-    import random
-    winners = random.sample(participants, min(winners_count, len(participants)))
+    eligible = await filter_eligible_participants(interaction.guild, participants, giveaway_data.get('requirements'))
+    winners, draw = await asyncio.to_thread(draw_winners, eligible, winners_count, giveaway_weights(interaction.guild, eligible))
     
-    # Create winners list
-    winner_mentions = []
-    for winner_id in winners:
-        user = interaction.guild.get_member(winner_id)
-        if user:
-            winner_mentions.append(user.mention)
+    # Resolve all winners at once, winners who left are named instead of dropped
+    winner_members = await resolve_winners(interaction.guild, winners)
+    winner_mentions = format_winner_mentions(winner_members)
     
     # Create result embed
-    embed = discord.Embed(
-        title=" Giveaway Ended!",
-        description=f"**Prize:** {giveaway_data['prize']}\n**Host:** {giveaway_data['host']}",
-        color=0x00ff00
+    embed = render_embed(
+        'giveaway_result', interaction.guild,
+        prize=giveaway_data['prize'], host=giveaway_data['host'], winners="\n".join(winner_mentions),
+        participants=len(participants), giveaway_id=giveaway_id
     )
     
-    if winner_mentions:
-        embed.add_field(
-            name=" Winners",
-            value="\n".join(winner_mentions),
-            inline=False
-        )
-    
-    embed.add_field(name="Total Participants", value=str(len(participants)), inline=True)
-    embed.add_field(name="Giveaway ID", value=f"`{giveaway_id}`", inline=True)
-    embed.set_footer(text="Congratulations to the winners! - Use /greroll with the Giveaway ID to reroll")
-    
-    await interaction.response.send_message(embed=embed)
+    await respond(interaction, embed=embed)
     
     # Send congratulations message
-    if winner_mentions:
-        congrats_msg = f" Congratulations {', '.join(winner_mentions)}! You won **{giveaway_data['prize']}**!"
-        await interaction.followup.send(congrats_msg)
+    if any(winner_members.values()):
+        congrats_msg = f" Congratulations {', '.join(m.mention for m in winner_members.values() if m)}! You won **{giveaway_data['prize']}**!"
+        await respond(interaction, congrats_msg)
     
     # Store completed giveaway for reroll functionality
-    completed_giveaways[giveaway_id] = {
+    store_completed_giveaway(giveaway_id, {
         'prize': giveaway_data['prize'],
         'host': giveaway_data['host'],
         'participants': giveaway_data['participants'].copy(),
         'winners_count': giveaway_data['winners'],
         'channel_id': giveaway_data['channel_id'],
         'completed_at': datetime.utcnow(),
-        'last_winners': winners
-    }
+        'last_winners': winners,
+        'draws': [draw],
+        'requirements': giveaway_data.get('requirements'),
+        'deliveries': {}
+    })
+    notify_giveaway_winners(interaction.guild, giveaway_id, winner_members)
     
     # Log giveaway end
     try:
@@ -1105,17 +1417,19 @@ async def end_giveaway(interaction, giveaway_id, giveaway_data):
                 {"name": "Prize", "value": giveaway_data['prize'], "inline": True},
                 {"name": "Participants", "value": str(len(participants)), "inline": True},
                 {"name": "Winners", "value": "\n".join(winner_mentions) if winner_mentions else "None", "inline": False},
-                {"name": "Giveaway ID", "value": f"`{giveaway_id}`", "inline": True}
+                {"name": "Giveaway ID", "value": f"`{giveaway_id}`", "inline": True},
+                {"name": "Draw Seed", "value": f"`{draw['seed']}`", "inline": True}
             ]
         )
     except Exception as e:
         print(f"Error sending log: {e}")
     
     # Remove from active giveaways
-    del active_giveaways[giveaway_id]
+    remove_active_giveaway(giveaway_id)
 
 # Slash command: Reroll Giveaway Winners
 @bot.tree.command(name='greroll', description='Reroll winners for a completed giveaway')
+@auto_defer('greroll')
 async def reroll_giveaway_slash(interaction: discord.Interaction, giveaway_id: str):
     """Reroll winners for a completed giveaway using the giveaway ID"""
     
@@ -1123,81 +1437,64 @@ async def reroll_giveaway_slash(interaction: discord.Interaction, giveaway_id: s
     giveaway_id = giveaway_id.strip('`')
     
     # Check if giveaway exists in completed giveaways
-    if giveaway_id not in completed_giveaways:
-        await interaction.response.send_message(" Invalid giveaway ID or giveaway not found! Make sure you're using the correct Giveaway ID from a completed giveaway.", ephemeral=True)
+    giveaway_data = get_completed_giveaway(giveaway_id)
+    if giveaway_data is None:
+        await respond(interaction, " Invalid giveaway ID or giveaway not found! Make sure you're using the correct Giveaway ID from a completed giveaway.", ephemeral=True)
         return
     
-    giveaway_data = completed_giveaways[giveaway_id]
-    
     # Check if user has permission to reroll (host or manage messages)
     is_host = interaction.user.mention == giveaway_data['host']
     has_permission = interaction.user.guild_permissions.manage_messages
     
     if not (is_host or has_permission):
-        await interaction.response.send_message(" Only the giveaway host or staff can reroll this giveaway!", ephemeral=True)
+        await respond(interaction, " Only the giveaway host or staff can reroll this giveaway!", ephemeral=True)
         return
     
     # Check if giveaway is in the same channel (optional security check)
     if giveaway_data['channel_id'] != interaction.channel.id:
-        await interaction.response.send_message(" You can only reroll giveaways in the channel where they were originally held!", ephemeral=True)
+        await respond(interaction, " You can only reroll giveaways in the channel where they were originally held!", ephemeral=True)
         return
     
     participants = giveaway_data['participants']
     winners_count = giveaway_data['winners_count']
     
     if not participants:
-        await interaction.response.send_message(" Cannot reroll - no participants were in this giveaway!", ephemeral=True)
+        await respond(interaction, " Cannot reroll - no participants were in this giveaway!", ephemeral=True)
         return
     
-    # Pick new winners (exclude previous winners to avoid duplicates if possible)
-    available_participants = participants.copy()
-    
-    # Try to exclude previous winners if there are enough participants
-    if len(participants) > winners_count and 'last_winners' in giveaway_data:
-        available_participants = [p for p in participants if p not in giveaway_data['last_winners']]
-        if len(available_participants) < winners_count:
-            # If not enough new participants, use all participants
-            available_participants = participants.copy()
+    # Exclude previous winners if there are enough other eligible participants
+    eligible = await filter_eligible_participants(interaction.guild, participants, giveaway_data.get('requirements'))
+    previous_winners = set(giveaway_data.get('last_winners', ()))
+    if len(eligible) - len(previous_winners) < winners_count:
+        previous_winners = set()
     
     # Pick new winners
-    new_winners = random.sample(available_participants, min(winners_count, len(available_participants)))
+    new_winners, draw = await asyncio.to_thread(draw_winners, eligible, winners_count, giveaway_weights(interaction.guild, eligible), exclude=previous_winners)
     
-    # Create winners list
-    winner_mentions = []
-    for winner_id in new_winners:
-        user = interaction.guild.get_member(winner_id)
-        if user:
-            winner_mentions.append(user.mention)
+    # Resolve all winners at once, winners who left are named instead of dropped
+    winner_members = await resolve_winners(interaction.guild, new_winners)
+    winner_mentions = format_winner_mentions(winner_members)
     
     # Create reroll result embed
-    embed = discord.Embed(
-        title=" Giveaway Rerolled!",
-        description=f"**Prize:** {giveaway_data['prize']}\n**Original Host:** {giveaway_data['host']}\n**Rerolled by:** {interaction.user.mention}",
-        color=0x9932cc
+    embed = render_embed(
+        'giveaway_reroll', interaction.guild,
+        prize=giveaway_data['prize'], host=giveaway_data['host'], rerolled_by=interaction.user.mention,
+        winners="\n".join(winner_mentions), participants=len(participants), giveaway_id=giveaway_id
     )
     
-    if winner_mentions:
-        embed.add_field(
-            name=" New Winners",
-            value="\n".join(winner_mentions),
-            inline=False
-        )
-    
-    embed.add_field(name="Total Participants", value=str(len(participants)), inline=True)
-    embed.add_field(name="Giveaway ID", value=f"`{giveaway_id}`", inline=True)
-    embed.set_footer(text="New winners have been selected!")
-    
-    await interaction.response.send_message(embed=embed)
+    await respond(interaction, embed=embed)
     
     # Send congratulations message to new winners
-    if winner_mentions:
-        congrats_msg = f" Congratulations {', '.join(winner_mentions)}! You won **{giveaway_data['prize']}** (Reroll)!"
-        await interaction.followup.send(congrats_msg)
+    if any(winner_members.values()):
+        congrats_msg = f" Congratulations {', '.join(m.mention for m in winner_members.values() if m)}! You won **{giveaway_data['prize']}** (Reroll)!"
+        await respond(interaction, congrats_msg)
     
     # Update the stored data with new winners
-    completed_giveaways[giveaway_id]['last_winners'] = new_winners
-    completed_giveaways[giveaway_id]['last_reroll'] = datetime.utcnow()
-    completed_giveaways[giveaway_id]['rerolled_by'] = interaction.user.mention
+    giveaway_data['last_winners'] = new_winners
+    giveaway_data.setdefault('draws', []).append(draw)
+    giveaway_data['last_reroll'] = datetime.utcnow()
+    giveaway_data['rerolled_by'] = interaction.user.mention
+    notify_giveaway_winners(interaction.guild, giveaway_id, winner_members, reroll=True)
     
     # Log giveaway reroll
     try:
@@ -1211,7 +1508,8 @@ async def reroll_giveaway_slash(interaction: discord.Interaction, giveaway_id: s
                 {"name": "Prize", "value": giveaway_data['prize'], "inline": True},
                 {"name": "Original Host", "value": giveaway_data['host'], "inline": True},
                 {"name": "New Winners", "value": "\n".join(winner_mentions) if winner_mentions else "None", "inline": False},
-                {"name": "Giveaway ID", "value": f"`{giveaway_id}`", "inline": True}
+                {"name": "Giveaway ID", "value": f"`{giveaway_id}`", "inline": True},
+                {"name": "Draw Seed", "value": f"`{draw['seed']}`", "inline": True}
             ]
         )
     except Exception as e:
@@ -1222,26 +1520,13 @@ async def reroll_giveaway_slash(interaction: discord.Interaction, giveaway_id: s
 async def list_giveaways_slash(interaction: discord.Interaction):
     """List recent completed giveaways in this channel with their IDs"""
     
-    # Filter giveaways for this channel
-    channel_giveaways = {
-        gid: gdata for gid, gdata in completed_giveaways.items() 
-        if gdata['channel_id'] == interaction.channel.id
-    }
+    # Most recent 10 from the channel index, older ones come from the archive
+    recent_giveaways = recent_completed_giveaways(interaction.channel.id, 10)
     
-    if not channel_giveaways:
+    if not recent_giveaways:
         await interaction.response.send_message(" No completed giveaways found in this channel!", ephemeral=True)
         return
     
-    # Sort by completion date (most recent first)
-    sorted_giveaways = sorted(
-        channel_giveaways.items(), 
-        key=lambda x: x[1]['completed_at'], 
-        reverse=True
-    )
-    
-    # Take only the most recent 10
-    recent_giveaways = sorted_giveaways[:10]
-    
     embed = discord.Embed(
         title=" Recent Completed Giveaways",
         description="Here are the most recent completed giveaways in this channel:",
@@ -1333,7 +1618,7 @@ async def start_number_game(interaction: discord.Interaction, max_number: int, c
     # Create game start embed
     embed = discord.Embed(
         title=" Guess the Number Game Started!",
-        description=f"I'm thinking of a number between **1** and **{max_number}**!\n\nHead over to <#{GUESS_CHANNEL_ID}> and start guessing!",
+        description=f"I'm thinking of a number between **1** and **{max_number}**!\n\nHead over to <#{get_config(interaction.guild, 'guess_channel')}> and start guessing!",
         color=discord.Color.blue()
     )
     embed.add_field(name="Range", value=f"1 - {max_number}", inline=True)
@@ -1344,7 +1629,7 @@ async def start_number_game(interaction: discord.Interaction, max_number: int, c
     await interaction.response.send_message(embed=embed)
     
     # Send notification to guess channel
-    guess_channel = interaction.guild.get_channel(GUESS_CHANNEL_ID)
+    guess_channel = config_channel(interaction.guild, 'guess_channel')
     if guess_channel:
         game_embed = discord.Embed(
             title=" New Number Guessing Game!",
@@ -1367,7 +1652,7 @@ async def start_number_game(interaction: discord.Interaction, max_number: int, c
         additional_fields=[
             {"name": "Range", "value": f"1 - {max_number}", "inline": True},
             {"name": "Custom Number", "value": "Yes" if custom_number else "No", "inline": True},
-            {"name": "Channel", "value": f"<#{GUESS_CHANNEL_ID}>", "inline": True}
+            {"name": "Channel", "value": f"<#{get_config(interaction.guild, 'guess_channel')}>", "inline": True}
         ]
     )
 
@@ -1406,7 +1691,7 @@ async def stop_number_game(interaction: discord.Interaction):
     await interaction.response.send_message(embed=embed)
     
     # Send notification to guess channel
-    guess_channel = interaction.guild.get_channel(GUESS_CHANNEL_ID)
+    guess_channel = config_channel(interaction.guild, 'guess_channel')
     if guess_channel:
         end_embed = discord.Embed(
             title=" Game Ended!",
@@ -1446,7 +1731,7 @@ async def handle_number_guess(message):
     global active_number_game
     
     # Check for number guessing in the specific channel
-    if message.channel.id == GUESS_CHANNEL_ID and active_number_game and active_number_game.is_active:
+    if message.guild and message.channel.id == get_config(message.guild, 'guess_channel') and active_number_game and active_number_game.is_active:
         # Check if message is a number
         try:
             guess = int(message.content.strip())
@@ -1539,25 +1824,25 @@ async def on_message(message):
 
 @bot.event
 async def on_member_ban(guild, user):
-    log_channel = bot.get_channel(LOG_CHANNEL_ID)
+    """Log bans with the moderator who made them"""
+    log_channel = config_channel(guild, 'log_channel')
     if not log_channel:
         return
     
-    # Get audit log to find who made the ban
-    async for entry in guild.audit_logs(action=discord.AuditLogAction.ban, limit=1):
-        if entry.target.id == user.id:
-            embed = discord.Embed(
-                title="Member Banned",
-                color=discord.Color.red(),
-                timestamp=entry.created_at
-            )
-            embed.add_field(name="Banned User", value=f"{user} ({user.id})", inline=False)
-            embed.add_field(name="Banned By", value=f"{entry.user} ({entry.user.id})", inline=False)
-            if entry.reason:
-                embed.add_field(name="Reason", value=entry.reason, inline=False)
-            
-            await log_channel.send(embed=embed)
-            break            
+    # Matched by target, so a mass ban is attributed per user and shares one audit log poll
+    entry = await audit_log_index.find(guild, discord.AuditLogAction.ban, user.id)
+    embed = discord.Embed(
+        title="Member Banned",
+        color=discord.Color.red(),
+        timestamp=entry.created_at if entry else discord.utils.utcnow()
+    )
+    embed.add_field(name="Banned User", value=f"{user} ({user.id})", inline=False)
+    embed.add_field(name="Banned By", value=audit_moderator(entry), inline=False)
+    if entry and entry.reason:
+        embed.add_field(name="Reason", value=entry.reason, inline=False)
+    
+    future = schedule_rest(PRIORITY_LOG, f"channel:{log_channel.id}", lambda: log_channel.send(embed=embed))
+    future.add_done_callback(_report_failure("Failed to log ban"))
 
 import discord
 from discord.ext import commands, tasks
@@ -1568,7 +1853,92 @@ from datetime import datetime, timedelta
 intents = discord.Intents.default()
 intents.message_content = True
 intents.dm_messages = True
-bot = commands.Bot(command_prefix='!', intents=intents)
+intents.members = True  # Member join/leave events for auto and sticky roles
+
+# Cache profiles, picked with BOT_PROFILE. "lean" keeps no members beyond the bot itself,
+# no message cache and skips chunking: handlers work from event and interaction payloads,
+# the member snapshot and fetches instead.
+CACHE_PROFILES = {
+    'default': {
+        'max_messages': 1000,
+        'member_cache_flags': discord.MemberCacheFlags.from_intents(intents),
+        'chunk_guilds_at_startup': True,
+    },
+    'lean': {
+        'max_messages': None,
+        'compact_messages': 5000,  # Our own message cache instead, see "Compact message cache"
+        'member_cache_flags': discord.MemberCacheFlags.none(),
+        'chunk_guilds_at_startup': False,
+        # Events no live handler listens to, so we don't parse them at all
+        'disabled_intents': ('typing', 'dm_typing', 'voice_states', 'invites', 'webhooks', 'integrations'),
+    },
+}
+BOT_PROFILE = os.getenv('BOT_PROFILE', 'default')
+if BOT_PROFILE not in CACHE_PROFILES:
+    print(f"Unknown BOT_PROFILE {BOT_PROFILE!r}, using default")
+    BOT_PROFILE = 'default'
+cache_profile = CACHE_PROFILES[BOT_PROFILE]
+for intent in cache_profile.get('disabled_intents', ()):
+    setattr(intents, intent, False)
+
+# discord.py only dispatches these for members in the cache, use the raw events instead
+CACHED_MEMBER_EVENTS = ('on_member_remove', 'on_member_update')
+
+def warn_uncached_listeners(bot):
+    """Name the listeners that won't run for most members under a profile without a member cache"""
+    if cache_profile['member_cache_flags'].value:
+        return
+    for event in CACHED_MEMBER_EVENTS:
+        for listener in bot.extra_events.get(event, ()):
+            print(f"Warning: {listener.__name__} listens to {event}, which the {BOT_PROFILE} profile only dispatches for cached members")
+
+# With MEMBER_SNAPSHOT=1 guilds are not chunked at startup, member data comes from the
+# snapshot persisted by the last run instead (see "Member snapshot"). On by default when lean.
+MEMBER_SNAPSHOT = os.getenv('MEMBER_SNAPSHOT', '1' if BOT_PROFILE == 'lean' else '0') == '1'
+
+class MetricsCommandTree(discord.app_commands.CommandTree):
+    """Command tree that times slash commands once instrument_bot() has run (see "Metrics")"""
+    timed = False
+
+    async def interaction_check(self, interaction):
+        # Runs right before the command is parsed and called, completion or on_error ends the timing
+        if self.timed and interaction.type is discord.InteractionType.application_command:
+            interaction.extras['metrics_started'] = time.perf_counter()
+        return True
+
+    async def on_error(self, interaction, error):
+        _record_command(interaction, failed=True)
+        await super().on_error(interaction, error)
+
+class ManagedBot(commands.Bot):
+    """The bot, releasing our own resources when it closes"""
+
+    async def close(self):
+        # The asset cache's HTTP session has to be closed on the bot's loop, bot.run closes the bot just before stopping it
+        try:
+            await asset_cache.close()
+        finally:
+            stop_welcome_cards()
+            await super().close()
+
+bot = ManagedBot(
+    command_prefix='!',
+    intents=intents,
+    tree_cls=MetricsCommandTree,
+    max_messages=cache_profile['max_messages'],
+    member_cache_flags=cache_profile['member_cache_flags'],
+    chunk_guilds_at_startup=cache_profile['chunk_guilds_at_startup'] and not MEMBER_SNAPSHOT,
+)
+
+# Commands and handlers defined above were added to the first bot instance, add them to this one
+bot.tree.add_command(review_slash)
+bot.tree.add_command(giveaway_slash)
+bot.tree.add_command(end_giveaway_slash)
+bot.tree.add_command(reroll_giveaway_slash)
+bot.tree.add_command(list_giveaways_slash)
+# Raw events: with max_messages=None (lean profile) there is no message cache for the plain ones
+bot.add_listener(on_raw_message_delete)
+bot.add_listener(on_raw_message_edit)
 
 # Application system configuration
 APPLY_CHANNEL_ID = 1379879557984944270
@@ -1612,7 +1982,7 @@ class ApplicationView(discord.ui.View):
             )
             start_embed.set_footer(text='Question 1 coming up...')
             
-            await interaction.user.send(embed=start_embed)
+            await schedule_rest(PRIORITY_DM, f"dm:{user_id}", lambda: interaction.user.send(embed=start_embed))
             
             active_applications[user_id] = {
                 'user_id': user_id, 
@@ -1660,7 +2030,7 @@ class ApplicationView(discord.ui.View):
             )
             question_embed.set_footer(text=footer_text)
 
-            await user.send(embed=question_embed)
+            await schedule_rest(PRIORITY_DM, f"dm:{user_id}", lambda: user.send(embed=question_embed))
             print(f"Sent question {question_index + 1} to {user.name}")
             
         except Exception as e:
@@ -1677,7 +2047,7 @@ class ApplicationView(discord.ui.View):
         try:
             user = bot.get_user(user_id)
             guild = bot.get_guild(application['guild_id'])
-            staff_channel = guild.get_channel(STAFF_CHANNEL_ID)
+            staff_channel = config_channel(guild, 'staff_results_channel')
 
             # Handle username display properly for new username system
             username_display = f"{user.name}"
@@ -1710,7 +2080,7 @@ class ApplicationView(discord.ui.View):
             )
             success_embed.set_footer(text='Typical review time: 24-48 hours')
 
-            await user.send(embed=success_embed)
+            await schedule_rest(PRIORITY_DM, f"dm:{user_id}", lambda: user.send(embed=success_embed))
 
             del active_applications[user_id]
             print(f"Application submitted for {user.name}")
@@ -1729,7 +2099,7 @@ class ReviewView(discord.ui.View):
     async def approve_button(self, interaction: discord.Interaction, button: discord.ui.Button):
         # Check for proper permissions
         if not (interaction.user.guild_permissions.manage_guild or 
-                any(role.id == STAFF_ROLE_ID for role in interaction.user.roles)):
+                any(role.id == get_config(interaction.guild, 'staff_role') for role in interaction.user.roles)):
             await interaction.response.send_message('❌ You don\'t have permission to review applications.', ephemeral=True)
             return
 
@@ -1738,7 +2108,7 @@ class ReviewView(discord.ui.View):
             guild = interaction.guild
             
             member = await guild.fetch_member(self.user_id)
-            role = guild.get_role(STAFF_ROLE_ID)
+            role = guild.get_role(get_config(guild, 'staff_role'))
             
             if role:
                 await member.add_roles(role)
@@ -1757,7 +2127,7 @@ class ReviewView(discord.ui.View):
             )
             approval_embed.set_footer(text=f'Reviewed by {interaction.user.name}')
 
-            await applicant.send(embed=approval_embed)
+            await schedule_rest(PRIORITY_DM, f"dm:{self.user_id}", lambda: applicant.send(embed=approval_embed))
 
         except Exception as e:
             print(f'Error handling application approval: {e}')
@@ -1767,7 +2137,7 @@ class ReviewView(discord.ui.View):
     async def reject_button(self, interaction: discord.Interaction, button: discord.ui.Button):
         # Check for proper permissions
         if not (interaction.user.guild_permissions.manage_guild or 
-                any(role.id == STAFF_ROLE_ID for role in interaction.user.roles)):
+                any(role.id == get_config(interaction.guild, 'staff_role') for role in interaction.user.roles)):
             await interaction.response.send_message('❌ You don\'t have permission to review applications.', ephemeral=True)
             return
 
@@ -1788,7 +2158,7 @@ class ReviewView(discord.ui.View):
             )
             rejection_embed.set_footer(text=f'Reviewed by {interaction.user.name}')
 
-            await applicant.send(embed=rejection_embed)
+            await schedule_rest(PRIORITY_DM, f"dm:{self.user_id}", lambda: applicant.send(embed=rejection_embed))
 
         except Exception as e:
             print(f'Error handling application rejection: {e}')
@@ -1826,30 +2196,31 @@ async def setup_application_system(bot):
         print(f"Application system error: {e}")
 
 async def setup_application_embed(bot):
-    """Send the application embed to the designated channel"""
-    try:
-        channel = bot.get_channel(APPLY_CHANNEL_ID)
-        if not channel:
-            print(f'Channel {APPLY_CHANNEL_ID} not found')
-            return
+    """Send the application embed to each guild's application channel"""
+    for guild in bot.guilds:
+        try:
+            channel = config_channel(guild, 'staff_apply_channel')
+            if not channel:
+                print(f'Application channel not configured for {guild.name}')
+                continue
 
-        embed = discord.Embed(
-            title='📋 Staff Application', 
-            description='Ready to join our amazing staff team?\n\nClick the button below to start your application process. You\'ll receive a private message with questions to fill out.', 
-            color=0x00AE86
-        )
-        embed.add_field(name='📝 Process', value='• Click "Apply Now"\n• Answer questions in DMs\n• Wait for staff review\n• Get notified of decision', inline=True)
-        embed.add_field(name='⏱️ Time Required', value='About 5-10 minutes', inline=True)
-        embed.add_field(name='📋 Questions', value='10 questions total', inline=True)
-        embed.set_footer(text='Make sure your DMs are open!')
-        embed.timestamp = datetime.now()
-
-        view = ApplicationView()
-        await channel.send(embed=embed, view=view)
-        print(f'Application embed sent to #{channel.name}')
+            embed = discord.Embed(
+                title='📋 Staff Application', 
+                description='Ready to join our amazing staff team?\n\nClick the button below to start your application process. You\'ll receive a private message with questions to fill out.', 
+                color=0x00AE86
+            )
+            embed.add_field(name='📝 Process', value='• Click "Apply Now"\n• Answer questions in DMs\n• Wait for staff review\n• Get notified of decision', inline=True)
+            embed.add_field(name='⏱️ Time Required', value='About 5-10 minutes', inline=True)
+            embed.add_field(name='📋 Questions', value='10 questions total', inline=True)
+            embed.set_footer(text='Make sure your DMs are open!')
+            embed.timestamp = datetime.now()
+
+            view = ApplicationView()
+            await channel.send(embed=embed, view=view)
+            print(f'Application embed sent to #{channel.name}')
         
-    except Exception as e:
-        print(f'Error sending embed: {e}')
+        except Exception as e:
+            print(f'Error sending embed: {e}')
 
 async def handle_application_dm(bot, message):
     """Handle DM responses for applications"""
@@ -1959,7 +2330,7 @@ class StaffApplicationView(discord.ui.View):
                 color=discord.Color.blue()
             )
             test_embed.set_footer(text="You have 10 minutes to answer each question.")
-            await dm_channel.send(embed=test_embed)
+            await schedule_rest(PRIORITY_DM, f"dm:{user_id}", lambda: dm_channel.send(embed=test_embed))
             
             # Initialize application data
             active_applications[user_id] = {
@@ -1997,14 +2368,12 @@ async def ask_next_question(user_id):
     try:
         dm_channel = await user.create_dm()
         
-        embed = discord.Embed(
-            title=f"Question {question_num + 1}/{len(STAFF_QUESTIONS)}",
-            description=STAFF_QUESTIONS[question_num],
-            color=discord.Color.blue()
+        embed = render_embed(
+            'application_question', bot.get_guild(app_data['guild_id']),
+            number=question_num + 1, total=len(STAFF_QUESTIONS), question=STAFF_QUESTIONS[question_num]
         )
-        embed.set_footer(text="Please respond with your answer. You have 10 minutes to respond.")
         
-        await dm_channel.send(embed=embed)
+        await schedule_rest(PRIORITY_DM, f"dm:{user_id}", lambda: dm_channel.send(embed=embed))
         
         # Set up timeout for response
         asyncio.create_task(question_timeout(user_id, question_num))
@@ -2026,12 +2395,8 @@ async def question_timeout(user_id, question_num):
         user = active_applications[user_id]['user']
         try:
             dm_channel = await user.create_dm()
-            embed = discord.Embed(
-                title="❌ Application Timed Out",
-                description="Your staff application has been cancelled due to inactivity. You can start a new application anytime.",
-                color=discord.Color.red()
-            )
-            await dm_channel.send(embed=embed)
+            embed = render_embed('application_timeout', bot.get_guild(active_applications[user_id]['guild_id']))
+            await schedule_rest(PRIORITY_DM, f"dm:{user_id}", lambda: dm_channel.send(embed=embed))
         except:
             pass
         
@@ -2053,15 +2418,11 @@ async def complete_application(user_id):
     try:
         # Send completion message to user
         dm_channel = await user.create_dm()
-        completion_embed = discord.Embed(
-            title="✅ Application Submitted!",
-            description="Thank you for submitting your staff application! Our team will review it and get back to you soon.",
-            color=discord.Color.green()
-        )
-        await dm_channel.send(embed=completion_embed)
+        completion_embed = render_embed('application_submitted', guild)
+        await schedule_rest(PRIORITY_DM, f"dm:{user_id}", lambda: dm_channel.send(embed=completion_embed))
         
         # Send application to results channel
-        results_channel = guild.get_channel(STAFF_RESULTS_CHANNEL_ID)
+        results_channel = config_channel(guild, 'staff_results_channel')
         if results_channel:
             app_embed = discord.Embed(
                 title="📝 New Staff Application",
@@ -2111,22 +2472,23 @@ class StaffDecisionView(discord.ui.View):
         self.applicant_id = applicant_id
     
     @discord.ui.button(label='✅ Accept', style=discord.ButtonStyle.success, custom_id='accept_staff')
+    @auto_defer('staff_accept', update=True)
     async def accept_application(self, interaction: discord.Interaction, button: discord.ui.Button):
         # Check if user has permission to make decisions
         if not interaction.user.guild_permissions.manage_roles:
-            await interaction.response.send_message("❌ You don't have permission to make staff decisions!", ephemeral=True)
+            await respond(interaction, "❌ You don't have permission to make staff decisions!", ephemeral=True)
             return
         
         guild = interaction.guild
-        applicant = guild.get_member(self.applicant_id)
+        applicant = guild.get_member(self.applicant_id) or await _fetch_member_or_none(guild, self.applicant_id)
         
         if not applicant:
-            await interaction.response.send_message("❌ Applicant is no longer in the server!", ephemeral=True)
+            await respond(interaction, "❌ Applicant is no longer in the server!", ephemeral=True)
             return
         
         try:
             # Give staff role
-            staff_role = guild.get_role(STAFF_ROLE_ID)
+            staff_role = guild.get_role(get_config(guild, 'staff_role'))
             if staff_role:
                 await applicant.add_roles(staff_role, reason=f"Staff application accepted by {interaction.user}")
             
@@ -2138,7 +2500,7 @@ class StaffDecisionView(discord.ui.View):
                     description=f"Congratulations! Your staff application for **{guild.name}** has been accepted!\nWelcome to the team!",
                     color=discord.Color.green()
                 )
-                await dm_channel.send(embed=accept_embed)
+                await schedule_rest(PRIORITY_DM, f"dm:{applicant.id}", lambda: dm_channel.send(embed=accept_embed))
             except:
                 pass  # User has DMs disabled
             
@@ -2150,7 +2512,7 @@ class StaffDecisionView(discord.ui.View):
                 timestamp=discord.utils.utcnow()
             )
             
-            await interaction.response.edit_message(embed=embed, view=None)
+            await respond_edit(interaction, embed=embed, view=None)
             
             # Log acceptance
             await send_log(
@@ -2167,17 +2529,18 @@ class StaffDecisionView(discord.ui.View):
             )
             
         except Exception as e:
-            await interaction.response.send_message(f"❌ Error accepting application: {str(e)}", ephemeral=True)
+            await respond(interaction, f"❌ Error accepting application: {str(e)}", ephemeral=True)
     
     @discord.ui.button(label='❌ Deny', style=discord.ButtonStyle.danger, custom_id='deny_staff')
+    @auto_defer('staff_deny', update=True)
     async def deny_application(self, interaction: discord.Interaction, button: discord.ui.Button):
         # Check if user has permission to make decisions
         if not interaction.user.guild_permissions.manage_roles:
-            await interaction.response.send_message("❌ You don't have permission to make staff decisions!", ephemeral=True)
+            await respond(interaction, "❌ You don't have permission to make staff decisions!", ephemeral=True)
             return
         
         guild = interaction.guild
-        applicant = guild.get_member(self.applicant_id)
+        applicant = guild.get_member(self.applicant_id) or await _fetch_member_or_none(guild, self.applicant_id)
         
         if applicant:
             # Send denial DM
@@ -2188,7 +2551,7 @@ class StaffDecisionView(discord.ui.View):
                     description=f"Thank you for your interest in becoming a staff member for **{guild.name}**.\n\nUnfortunately, your application has been denied at this time. You may reapply in the future.",
                     color=discord.Color.red()
                 )
-                await dm_channel.send(embed=deny_embed)
+                await schedule_rest(PRIORITY_DM, f"dm:{applicant.id}", lambda: dm_channel.send(embed=deny_embed))
             except:
                 pass  # User has DMs disabled
         
@@ -2200,7 +2563,7 @@ class StaffDecisionView(discord.ui.View):
             timestamp=discord.utils.utcnow()
         )
         
-        await interaction.response.edit_message(embed=embed, view=None)
+        await respond_edit(interaction, embed=embed, view=None)
         
         # Log denial
         await send_log(
@@ -2222,6 +2585,11 @@ async def on_message(message):
     if message.author.bot:
         return
     
+    # Ticket response time tracking
+    track_ticket_message(message)
+    snapshot_member(message.author)
+    cache_compact_message(message)
+    
     # Check if it's a DM and user has active application
     if isinstance(message.channel, discord.DMChannel) and message.author.id in active_applications:
         user_id = message.author.id
@@ -2241,7 +2609,7 @@ async def on_message(message):
 # Setup staff application panel
 async def setup_staff_panel(guild):
     """Set up the staff application panel"""
-    staff_channel = guild.get_channel(STAFF_APPLY_CHANNEL_ID)
+    staff_channel = config_channel(guild, 'staff_apply_channel')
     
     if staff_channel:
         try:
@@ -2291,6 +2659,18 @@ async def on_ready():
         # Set up staff application panel
         await setup_staff_panel(guild)
     
+    # Restore ticket statistics and start the inactivity sweeper
+    load_ticket_stats()
+    start_ticket_sweeper()
+    start_giveaway_scheduler()
+    start_member_snapshots()
+    start_welcome_cards()
+    report_startup()
+    
+    # Start the local metrics endpoint and loop watchdog
+    await start_metrics_server()
+    start_loop_watchdog()
+    
     # Sync slash commands
     try:
         synced = await bot.tree.sync()
@@ -2298,19 +2678,3985 @@ async def on_ready():
     except Exception as e:
         print(f'Failed to sync commands: {e}')
 
-#start
-if __name__ == "__main__":
-    # Get token from environment variable or user input
-    bot_token = os.getenv('DISCORD_BOT_TOKEN')
-    
-    if not bot_token:
-        bot_token = input("Enter your Discord bot token: ").strip()
-        
-        if not bot_token:
-            print("No token provided. Exiting...")
-            exit(1)
-    
-    try:
+# Metrics and instrumentation
+import functools
+import logging
+import time
+from collections import defaultdict
+from aiohttp import web
+
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')  # Only listen locally by default
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))
+
+class LatencyHistogram:
+    """HDR-style latency histogram with log-linear buckets (2 significant digits)"""
+    SUB_BUCKET_BITS = 8  # 256 sub-buckets per power of two => <1% relative error
+    EXPORT_BOUNDS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+    def __init__(self):
+        self.counts = {}  # (bucket, sub_bucket) -> count, values stored in microseconds
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def _key(self, micros):
+        bucket = max(0, micros.bit_length() - self.SUB_BUCKET_BITS)
+        return bucket, micros >> bucket
+
+    def record(self, seconds):
+        """Record a duration in seconds"""
+        micros = max(0, int(seconds * 1_000_000))
+        key = self._key(micros)
+        self.counts[key] = self.counts.get(key, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, pct):
+        """Return the value (in seconds) at the given percentile (0-100)"""
+        if not self.count:
+            return 0.0
+        target = max(1, int(round(self.count * pct / 100.0)))
+        seen = 0
+        for bucket, sub in sorted(self.counts):
+            seen += self.counts[(bucket, sub)]
+            if seen >= target:
+                # Report the upper edge of the sub-bucket
+                return (((sub + 1) << bucket) - 1) / 1_000_000
+        return self.max
+
+    def count_at_or_below(self, seconds):
+        """Number of recorded values that are <= seconds"""
+        limit = int(seconds * 1_000_000)
+        return sum(c for (bucket, sub), c in self.counts.items() if (((sub + 1) << bucket) - 1) <= limit)
+
+# Metric storage (in-memory)
+handler_invocations = defaultdict(int)
+handler_errors = defaultdict(int)
+handler_latency = defaultdict(LatencyHistogram)
+rest_calls = defaultdict(int)
+rest_errors = defaultdict(int)
+rest_latency = defaultdict(LatencyHistogram)
+# 429 retries and global limits reported by discord.py, and time our own scheduler held queued calls back
+rate_limit_stats = {'sleeps': 0, 'seconds': 0.0, 'global': 0, 'queue_waits': 0, 'queue_seconds': 0.0}
+metrics_server_runner = None
+
+# Friendly names for the REST routes we care about most
+REST_ROUTE_NAMES = {
+    ('POST', '/channels/{channel_id}/messages'): 'send',
+    ('PATCH', '/channels/{channel_id}/messages/{message_id}'): 'edit',
+    ('GET', '/channels/{channel_id}/messages/{message_id}'): 'fetch_message',
+    ('POST', '/guilds/{guild_id}/channels'): 'create_text_channel',
+}
+
+def record_rest_call(route_name, seconds, failed=False):
+    """Record one outgoing REST call"""
+    rest_calls[route_name] += 1
+    rest_latency[route_name].record(seconds)
+    if failed:
+        rest_errors[route_name] += 1
+
+def instrument_handler(name, func):
+    """Wrap a coroutine so every call is counted and timed under the given name"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        handler_invocations[name] += 1
+        start = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        except Exception:
+            handler_errors[name] += 1
+            raise
+        finally:
+            handler_latency[name].record(time.perf_counter() - start)
+    wrapper.__instrumented__ = True
+    return wrapper
+
+def _record_command(interaction, failed=False):
+    """Record a slash command the tree started timing"""
+    started = interaction.extras.pop('metrics_started', None)
+    if started is None or interaction.command is None:
+        return
+    name = f"command:{interaction.command.qualified_name}"
+    handler_invocations[name] += 1
+    if failed:
+        handler_errors[name] += 1
+    handler_latency[name].record(time.perf_counter() - started)
+
+async def record_command_completion(interaction, command):
+    _record_command(interaction)
+
+record_command_completion.__instrumented__ = True
+
+def instrument_http(http):
+    """Count and time every request made through discord's HTTP client"""
+    if getattr(http.request, '__instrumented__', False):
+        return
+    original_request = http.request
+
+    async def request(route, **kwargs):
+        route_name = REST_ROUTE_NAMES.get((route.method, route.path), f"{route.method} {route.path}")
+        start = time.perf_counter()
+        failed = False
+        try:
+            return await original_request(route, **kwargs)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            record_rest_call(route_name, time.perf_counter() - start, failed)
+
+    request.__instrumented__ = True
+    http.request = request
+
+class RateLimitLogHandler(logging.Handler):
+    """Counts the rate limit sleeps discord.py reports through its logger"""
+    # Matches the 429 and global rate limit warnings of discord/http.py in discord.py 2.7.1,
+    # check them again when upgrading discord.py
+    RETRY = re.compile(r'Retrying in ([0-9.]+) seconds')
+
+    def emit(self, record):
+        try:
+            message = record.getMessage()
+        except Exception:
+            return
+        match = self.RETRY.search(message)
+        if match is None:
+            return
+        if message.startswith('Global rate limit'):
+            # Logged after the 429 it belongs to, whose sleep is already counted
+            rate_limit_stats['global'] += 1
+            return
+        rate_limit_stats['sleeps'] += 1
+        rate_limit_stats['seconds'] += float(match.group(1))
+
+def instrument_bot(bot):
+    """Wrap every registered event handler and listener of the bot and start timing slash commands"""
+    for name, handler in list(vars(bot).items()):
+        if name.startswith('on_') and asyncio.iscoroutinefunction(handler) and not getattr(handler, '__instrumented__', False):
+            setattr(bot, name, instrument_handler(f"event:{name}", handler))
+
+    # Handlers added with bot.listen() / bot.add_listener()
+    for event, listeners in bot.extra_events.items():
+        for i, listener in enumerate(listeners):
+            if not getattr(listener, '__instrumented__', False):
+                listeners[i] = instrument_handler(f"listener:{event}:{listener.__name__}", listener)
+
+    # Slash commands are timed by the tree, from its interaction check to completion or error
+    if isinstance(bot.tree, MetricsCommandTree) and not bot.tree.timed:
+        bot.tree.timed = True
+        bot.add_listener(record_command_completion, 'on_app_command_completion')
+
+    instrument_http(bot.http)
+
+    http_logger = logging.getLogger('discord.http')
+    if not any(isinstance(h, RateLimitLogHandler) for h in http_logger.handlers):
+        http_logger.addHandler(RateLimitLogHandler())
+
+def _prometheus_histogram(lines, metric, labels, histogram):
+    """Append a histogram in Prometheus text format"""
+    for bound in LatencyHistogram.EXPORT_BOUNDS:
+        lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {histogram.count_at_or_below(bound)}')
+    lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+    lines.append(f'{metric}_sum{{{labels}}} {histogram.total:.6f}')
+    lines.append(f'{metric}_count{{{labels}}} {histogram.count}')
+
+def render_prometheus_metrics():
+    """Render all metrics in the Prometheus text exposition format"""
+    lines = [
+        '# HELP bot_handler_invocations_total Number of handler invocations',
+        '# TYPE bot_handler_invocations_total counter',
+    ]
+    for name, value in sorted(handler_invocations.items()):
+        lines.append(f'bot_handler_invocations_total{{handler="{name}"}} {value}')
+
+    lines += ['# HELP bot_handler_errors_total Number of handler invocations that raised', '# TYPE bot_handler_errors_total counter']
+    for name, value in sorted(handler_errors.items()):
+        lines.append(f'bot_handler_errors_total{{handler="{name}"}} {value}')
+
+    lines += ['# HELP bot_handler_latency_seconds Handler latency', '# TYPE bot_handler_latency_seconds histogram']
+    for name, histogram in sorted(handler_latency.items()):
+        _prometheus_histogram(lines, 'bot_handler_latency_seconds', f'handler="{name}"', histogram)
+
+    lines += ['# HELP bot_rest_calls_total Outgoing REST calls by route', '# TYPE bot_rest_calls_total counter']
+    for name, value in sorted(rest_calls.items()):
+        lines.append(f'bot_rest_calls_total{{route="{name}"}} {value}')
+
+    lines += ['# HELP bot_rest_errors_total Outgoing REST calls that failed', '# TYPE bot_rest_errors_total counter']
+    for name, value in sorted(rest_errors.items()):
+        lines.append(f'bot_rest_errors_total{{route="{name}"}} {value}')
+
+    lines += ['# HELP bot_rest_latency_seconds Outgoing REST call latency', '# TYPE bot_rest_latency_seconds histogram']
+    for name, histogram in sorted(rest_latency.items()):
+        _prometheus_histogram(lines, 'bot_rest_latency_seconds', f'route="{name}"', histogram)
+
+    lines += ['# HELP bot_interaction_ack_seconds Time until an interaction was acknowledged', '# TYPE bot_interaction_ack_seconds histogram']
+    for name, histogram in sorted(ack_latency.items()):
+        _prometheus_histogram(lines, 'bot_interaction_ack_seconds', f'command="{name}"', histogram)
+
+    lines += ['# HELP bot_interaction_deferred_total Interactions acknowledged with a defer', '# TYPE bot_interaction_deferred_total counter']
+    for name, value in sorted(ack_deferred.items()):
+        lines.append(f'bot_interaction_deferred_total{{command="{name}"}} {value}')
+
+    lines += ['# HELP bot_search_query_seconds Search query latency', '# TYPE bot_search_query_seconds histogram']
+    _prometheus_histogram(lines, 'bot_search_query_seconds', 'index="messages"', search_latency)
+
+    lines += ['# HELP bot_event_loop_lag_seconds Event loop heartbeat lag', '# TYPE bot_event_loop_lag_seconds histogram']
+    _prometheus_histogram(lines, 'bot_event_loop_lag_seconds', 'loop="main"', loop_lag_histogram)
+
+    lines += ['# HELP bot_outbound_queued Queued outgoing requests by priority class', '# TYPE bot_outbound_queued gauge']
+    for priority, name in PRIORITY_NAMES.items():
+        lines.append(f'bot_outbound_queued{{priority="{name}"}} {outbound.queued(priority)}')
+
+    lines += ['# HELP bot_outbound_jobs_total Outgoing request scheduler events', '# TYPE bot_outbound_jobs_total counter']
+    for name, value in sorted(outbound.stats.items()):
+        lines.append(f'bot_outbound_jobs_total{{result="{name}"}} {value}')
+
+    lines += ['# HELP bot_outbound_bucket_tokens_used_total Tokens used per rate limit bucket', '# TYPE bot_outbound_bucket_tokens_used_total counter']
+    for name, bucket in sorted(outbound.buckets.items()):
+        lines.append(f'bot_outbound_bucket_tokens_used_total{{bucket="{name}"}} {bucket.used}')
+    lines += ['# HELP bot_outbound_bucket_throttled_total Times a bucket had no token left', '# TYPE bot_outbound_bucket_throttled_total counter']
+    for name, bucket in sorted(outbound.buckets.items()):
+        lines.append(f'bot_outbound_bucket_throttled_total{{bucket="{name}"}} {bucket.throttled}')
+
+    lines += ['# HELP bot_audit_log_lookups_total Moderation events matched to an audit log entry', '# TYPE bot_audit_log_lookups_total counter']
+    for name in ('matched', 'unmatched'):
+        lines.append(f'bot_audit_log_lookups_total{{result="{name}"}} {audit_log_index.stats[name]}')
+    lines += [
+        '# HELP bot_audit_log_polls_total Audit log polls for events without a pushed entry',
+        '# TYPE bot_audit_log_polls_total counter',
+        f"bot_audit_log_polls_total {audit_log_index.stats['polls']}",
+    ]
+
+    lines += ['# HELP bot_asset_requests_total Asset cache lookups by result', '# TYPE bot_asset_requests_total counter']
+    for name, value in sorted(asset_cache.stats.items()):
+        if name != 'requests':
+            lines.append(f'bot_asset_requests_total{{result="{name}"}} {value}')
+    lines += ['# HELP bot_asset_bytes_total Asset bytes downloaded and saved by the cache', '# TYPE bot_asset_bytes_total counter']
+    for name, value in sorted(asset_cache.bytes.items()):
+        lines.append(f'bot_asset_bytes_total{{kind="{name}"}} {value}')
+    lines += [
+        '# HELP bot_asset_hit_ratio Asset requests served without a download',
+        '# TYPE bot_asset_hit_ratio gauge',
+        f'bot_asset_hit_ratio {asset_cache.hit_ratio():.4f}',
+        '# HELP bot_asset_memory_bytes Bytes held by the in-memory asset cache',
+        '# TYPE bot_asset_memory_bytes gauge',
+        f'bot_asset_memory_bytes {asset_cache.memory_bytes}',
+    ]
+
+    lines += [
+        '# HELP bot_rate_limit_sleeps_total Rate limit sleeps reported by discord.py',
+        '# TYPE bot_rate_limit_sleeps_total counter',
+        f"bot_rate_limit_sleeps_total {rate_limit_stats['sleeps']}",
+        '# HELP bot_rate_limit_sleep_seconds_total Time spent sleeping on rate limits',
+        '# TYPE bot_rate_limit_sleep_seconds_total counter',
+        f"bot_rate_limit_sleep_seconds_total {rate_limit_stats['seconds']:.3f}",
+        '# HELP bot_rate_limit_global_total Global rate limits reported by discord.py',
+        '# TYPE bot_rate_limit_global_total counter',
+        f"bot_rate_limit_global_total {rate_limit_stats['global']}",
+        '# HELP bot_outbound_throttle_seconds_total Time queued calls waited for a rate limit token',
+        '# TYPE bot_outbound_throttle_seconds_total counter',
+        f"bot_outbound_throttle_seconds_total {rate_limit_stats['queue_seconds']:.3f}",
+    ]
+    return "\n".join(lines) + "\n"
+
+async def metrics_endpoint(request):
+    return web.Response(text=render_prometheus_metrics(), content_type='text/plain', charset='utf-8')
+
+async def start_metrics_server():
+    """Start the local Prometheus endpoint (only once)"""
+    global metrics_server_runner
+    if metrics_server_runner:
+        return
+    try:
+        app = web.Application()
+        app.router.add_get('/metrics', metrics_endpoint)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, METRICS_HOST, METRICS_PORT).start()
+        metrics_server_runner = runner
+        print(f"Metrics available at http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    except Exception as e:
+        print(f"Failed to start metrics server: {e}")
+
+# Slash command: Bot statistics
+@bot.tree.command(name='botstats', description='Show handler latency and REST call statistics (Admin only)')
+async def botstats_slash(interaction: discord.Interaction):
+    """Show the busiest and slowest handlers"""
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("❌ You need administrator permissions to use this command!", ephemeral=True)
+        return
+
+    embed = discord.Embed(
+        title="📊 Bot Statistics",
+        description="Latency values are p50 / p99 / max in milliseconds.",
+        color=discord.Color.blue(),
+        timestamp=datetime.utcnow()
+    )
+
+    # Slowest handlers by p99
+    slowest = sorted(handler_latency.items(), key=lambda x: x[1].percentile(99), reverse=True)[:10]
+    handler_lines = [
+        f"`{name}` {handler_invocations[name]} calls, {handler_errors[name]} errors - "
+        f"{h.percentile(50) * 1000:.0f} / {h.percentile(99) * 1000:.0f} / {h.max * 1000:.0f}"
+        for name, h in slowest
+    ]
+    embed.add_field(name="Handlers", value="\n".join(handler_lines) or "No data yet", inline=False)
+
+    rest_lines = [
+        f"`{name}` {count} calls, {rest_errors[name]} errors, p99 {rest_latency[name].percentile(99) * 1000:.0f}"
+        for name, count in sorted(rest_calls.items(), key=lambda x: x[1], reverse=True)[:10]
+    ]
+    embed.add_field(name="REST Calls", value="\n".join(rest_lines) or "No data yet", inline=False)
+    ack_lines = [
+        f"`{name}` p50 {h.percentile(50) * 1000:.0f} / p99 {h.percentile(99) * 1000:.0f}ms, {ack_deferred.get(name, 0)} deferred"
+        for name, h in sorted(ack_latency.items())
+    ]
+    embed.add_field(name="Interaction Acks", value="\n".join(ack_lines)[:1024] or "No data yet", inline=False)
+    embed.add_field(
+        name="Rate Limits",
+        value=(f"{rate_limit_stats['sleeps']} retries ({rate_limit_stats['seconds']:.1f}s), {rate_limit_stats['global']} global\n"
+               f"Queue held back {rate_limit_stats['queue_seconds']:.1f}s"),
+        inline=True
+    )
+    embed.add_field(name="Gateway Latency", value=f"{round(bot.latency * 1000)}ms", inline=True)
+    embed.add_field(name="Asset Cache", value=f"{asset_cache.hit_ratio():.0%} hits, {asset_cache.bytes['saved'] / 1024 / 1024:.1f} MB saved", inline=True)
+    embed.set_footer(text=f"Prometheus endpoint: {METRICS_HOST}:{METRICS_PORT}/metrics")
+
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+# Event loop lag watchdog and slow callback profiler
+import sys
+import threading
+import traceback
+from logging.handlers import RotatingFileHandler
+
+LOOP_LAG_THRESHOLD = float(os.getenv('LOOP_LAG_THRESHOLD', '0.25'))  # Seconds before a stall is reported
+LOOP_WATCHDOG_INTERVAL = 0.1  # Seconds between heartbeats
+SLOW_CALLBACK_LOG = os.getenv('SLOW_CALLBACK_LOG', 'slow_callbacks.log')
+
+loop_lag_histogram = LatencyHistogram()
+# Stall location -> {'count', 'total', 'max', 'stack'}
+slow_callback_offenders = {}
+slow_callback_lock = threading.Lock()
+loop_watchdog = None
+
+slow_callback_logger = logging.getLogger('bot.slow_callbacks')
+slow_callback_logger.propagate = False
+
+def _stall_location(stack):
+    """Pick the innermost frame from this file, falling back to the innermost frame"""
+    this_file = os.path.abspath(__file__)
+    for frame in reversed(stack):
+        if os.path.abspath(frame.filename) == this_file:
+            return f"{frame.name} (bot.py:{frame.lineno})"
+    frame = stack[-1]
+    return f"{frame.name} ({os.path.basename(frame.filename)}:{frame.lineno})"
+
+def record_slow_callback(lag, stack):
+    """Store a stall sample and write it to the rotating report file"""
+    location = _stall_location(stack)
+    formatted = "".join(traceback.format_list(stack))
+
+    with slow_callback_lock:
+        offender = slow_callback_offenders.setdefault(location, {'count': 0, 'total': 0.0, 'max': 0.0, 'stack': formatted})
+        offender['count'] += 1
+        offender['total'] += lag
+        if lag >= offender['max']:
+            offender['max'] = lag
+            offender['stack'] = formatted
+
+    slow_callback_logger.warning("Event loop blocked for %.3fs in %s\n%s", lag, location, formatted)
+
+class LoopWatchdog(threading.Thread):
+    """Measures event loop lag from a separate thread.
+
+    A heartbeat is scheduled on the loop every interval. If the loop has not run it
+    within the threshold, the loop thread's current stack is sampled, which shows the
+    callback or coroutine that is holding the loop.
+    """
+    def __init__(self, loop, threshold=LOOP_LAG_THRESHOLD, interval=LOOP_WATCHDOG_INTERVAL):
+        super().__init__(name='loop-watchdog', daemon=True)
+        self.loop = loop
+        self.loop_thread_id = threading.get_ident()  # Must be created from the loop thread
+        self.threshold = threshold
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            heartbeat = threading.Event()
+            sent = time.perf_counter()
+            try:
+                self.loop.call_soon_threadsafe(heartbeat.set)
+            except RuntimeError:
+                return  # Loop is closed
+
+            stack = None
+            if not heartbeat.wait(self.threshold):
+                frame = sys._current_frames().get(self.loop_thread_id)
+                if frame is not None:
+                    stack = traceback.extract_stack(frame)
+                    del frame
+                # Keep waiting so the full length of the stall is measured
+                while not heartbeat.wait(self.interval):
+                    if self.stopped.is_set() or self.loop.is_closed():
+                        return
+
+            lag = time.perf_counter() - sent
+            loop_lag_histogram.record(lag)
+            if stack:
+                record_slow_callback(lag, stack)
+
+def start_loop_watchdog():
+    """Start the watchdog for the running event loop (only once)"""
+    global loop_watchdog
+    if loop_watchdog and loop_watchdog.is_alive():
+        return
+
+    if not slow_callback_logger.handlers:
+        try:
+            handler = RotatingFileHandler(SLOW_CALLBACK_LOG, maxBytes=1_000_000, backupCount=3, encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+            slow_callback_logger.addHandler(handler)
+        except Exception as e:
+            print(f"Failed to open slow callback log: {e}")
+
+    loop_watchdog = LoopWatchdog(asyncio.get_running_loop())
+    loop_watchdog.start()
+    print(f"Event loop watchdog started (threshold {LOOP_LAG_THRESHOLD}s)")
+
+# Slash command: Slow callback report
+@bot.tree.command(name='slowcallbacks', description='Show the code that blocked the event loop the most (Admin only)')
+async def slow_callbacks_slash(interaction: discord.Interaction, show_stack: bool = False):
+    """Dump the top event loop offenders"""
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("❌ You need administrator permissions to use this command!", ephemeral=True)
+        return
+
+    with slow_callback_lock:
+        offenders = sorted(slow_callback_offenders.items(), key=lambda x: x[1]['total'], reverse=True)[:10]
+
+    embed = discord.Embed(
+        title="🐢 Slow Callbacks",
+        description=f"Loop lag p50 / p99 / max: {loop_lag_histogram.percentile(50) * 1000:.0f} / "
+                    f"{loop_lag_histogram.percentile(99) * 1000:.0f} / {loop_lag_histogram.max * 1000:.0f} ms",
+        color=discord.Color.orange(),
+        timestamp=datetime.utcnow()
+    )
+
+    lines = [
+        f"`{location}` {data['count']}x, total {data['total']:.2f}s, max {data['max'] * 1000:.0f}ms"
+        for location, data in offenders
+    ]
+    embed.add_field(name="Top Offenders", value="\n".join(lines)[:1024] or "No stalls recorded", inline=False)
+
+    if show_stack and offenders:
+        stack = offenders[0][1]['stack']
+        embed.add_field(name="Worst Stack", value=f"```{stack[-1000:]}```", inline=False)
+
+    embed.set_footer(text=f"Threshold {LOOP_LAG_THRESHOLD}s - full reports in {SLOW_CALLBACK_LOG}")
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+# Outbound REST scheduler
+from collections import OrderedDict
+
+# Priority classes, lower runs first. Interaction responses are never queued here
+# (they go straight out through respond()), so they always win.
+PRIORITY_INTERACTION = 0
+PRIORITY_DM = 1
+PRIORITY_PANEL = 2
+PRIORITY_LOG = 3
+PRIORITY_BULK = 4  # Long running batches (mass role edits), only use capacity nothing else wants
+PRIORITY_NAMES = {PRIORITY_INTERACTION: 'interaction', PRIORITY_DM: 'dm', PRIORITY_PANEL: 'panel', PRIORITY_LOG: 'log', PRIORITY_BULK: 'bulk'}
+
+OUTBOUND_CONCURRENCY = 8     # Requests in flight at once
+OUTBOUND_GLOBAL_RATE = 45    # Requests per second across all buckets (Discord allows 50)
+BUCKET_CAPACITY = 5          # Requests per bucket per BUCKET_PERIOD (message send limit per channel)
+BUCKET_PERIOD = 5.0
+MAX_QUEUED_LOGS = 1000       # Oldest log messages are dropped beyond this
+
+class TokenBucket:
+    """Simple token bucket refilled continuously"""
+    def __init__(self, capacity, period):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.used = 0
+        self.throttled = 0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self, now):
+        self._refill(now)
+        return self.tokens >= 1
+
+    def take(self, now):
+        """Take a token if one is available"""
+        if not self.available(now):
+            self.throttled += 1
+            return False
+        self.tokens -= 1
+        self.used += 1
+        return True
+
+    def wait_time(self, now):
+        self._refill(now)
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+class OutboundJob:
+    __slots__ = ('priority', 'bucket', 'factory', 'key', 'future')
+
+    def __init__(self, priority, bucket, factory, key, future):
+        self.priority = priority
+        self.bucket = bucket
+        self.factory = factory
+        self.key = key
+        self.future = future
+
+class OutboundScheduler:
+    """Central queue for outgoing REST calls.
+
+    Jobs are coroutine factories grouped by priority class and rate limit bucket
+    (usually one per channel). Each bucket runs one request at a time and has its own
+    token bucket, so a flood in one channel never holds up another. Jobs submitted with
+    a key replace a queued job with the same key, e.g. only the latest edit of a message
+    is sent.
+    """
+    def __init__(self):
+        self.queues = {priority: OrderedDict() for priority in PRIORITY_NAMES}  # priority -> bucket -> deque of jobs
+        self.pending_by_key = {}
+        self.buckets = {}
+        self.busy_buckets = set()
+        self.global_bucket = TokenBucket(OUTBOUND_GLOBAL_RATE, 1.0)
+        self.in_flight = 0
+        self.wakeup = asyncio.Event()
+        self.task = None
+        self.stats = defaultdict(int)
+
+    def queued(self, priority):
+        return sum(len(jobs) for jobs in self.queues[priority].values())
+
+    def _bucket(self, name):
+        bucket = self.buckets.get(name)
+        if bucket is None:
+            if len(self.buckets) > 10000:
+                # Forget idle buckets that have fully refilled
+                now = time.monotonic()
+                for idle in [n for n, b in self.buckets.items() if n not in self.busy_buckets and b.wait_time(now) == 0 and b.tokens >= b.capacity]:
+                    del self.buckets[idle]
+            bucket = self.buckets[name] = TokenBucket(BUCKET_CAPACITY, BUCKET_PERIOD)
+        return bucket
+
+    def submit(self, priority, bucket, factory, key=None):
+        """Queue a coroutine factory and return a future for its result"""
+        if key is not None and key in self.pending_by_key:
+            job = self.pending_by_key[key]
+            job.factory = factory  # Keep only the latest version
+            self.stats['coalesced'] += 1
+            return job.future
+
+        if priority == PRIORITY_LOG and self.queued(PRIORITY_LOG) >= MAX_QUEUED_LOGS:
+            self._drop_oldest(PRIORITY_LOG)
+
+        job = OutboundJob(priority, bucket, factory, key, asyncio.get_running_loop().create_future())
+        self.queues[priority].setdefault(bucket, deque()).append(job)
+        if key is not None:
+            self.pending_by_key[key] = job
+        self.stats['submitted'] += 1
+
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._run())
+        self.wakeup.set()
+        return job.future
+
+    def _drop_oldest(self, priority):
+        queue = self.queues[priority]
+        bucket_name = next(iter(queue))
+        job = queue[bucket_name].popleft()
+        if not queue[bucket_name]:
+            del queue[bucket_name]
+        if job.key is not None:
+            self.pending_by_key.pop(job.key, None)
+        job.future.set_result(None)
+        self.stats['dropped'] += 1
+
+    def _next_job(self, now):
+        """Highest priority job whose bucket is idle and has a token, round-robin across buckets"""
+        for priority in sorted(self.queues):
+            queue = self.queues[priority]
+            for bucket_name in list(queue):
+                if bucket_name in self.busy_buckets or not self._bucket(bucket_name).take(now):
+                    continue
+                jobs = queue[bucket_name]
+                job = jobs.popleft()
+                if jobs:
+                    queue.move_to_end(bucket_name)
+                else:
+                    del queue[bucket_name]
+                return job
+        return None
+
+    def _next_refill(self, now):
+        """Seconds until a queued job may become runnable, None to wait for a wakeup"""
+        if self.in_flight >= OUTBOUND_CONCURRENCY:
+            return None
+        waits = [
+            self._bucket(bucket_name).wait_time(now)
+            for queue in self.queues.values()
+            for bucket_name in queue
+            if bucket_name not in self.busy_buckets
+        ]
+        if not waits:
+            return None
+        return max(min(waits), self.global_bucket.wait_time(now), 0.001)
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+            job = None
+            if self.in_flight < OUTBOUND_CONCURRENCY and self.global_bucket.available(now):
+                job = self._next_job(now)
+
+            if job is None:
+                self.wakeup.clear()
+                refill = self._next_refill(now)
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), refill)
+                except asyncio.TimeoutError:
+                    pass
+                if refill is not None:
+                    # Queued calls were held back by a bucket or the global limit
+                    rate_limit_stats['queue_waits'] += 1
+                    rate_limit_stats['queue_seconds'] += time.monotonic() - now
+                continue
+
+            self.global_bucket.take(now)
+            if job.key is not None and self.pending_by_key.get(job.key) is job:
+                del self.pending_by_key[job.key]
+            self.busy_buckets.add(job.bucket)
+            self.in_flight += 1
+            asyncio.create_task(self._execute(job))
+
+    async def _execute(self, job):
+        try:
+            result = await job.factory()
+            if not job.future.done():
+                job.future.set_result(result)
+            self.stats['completed'] += 1
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+            self.stats['failed'] += 1
+        finally:
+            self.busy_buckets.discard(job.bucket)
+            self.in_flight -= 1
+            self.wakeup.set()
+
+outbound = OutboundScheduler()
+
+def schedule_rest(priority, bucket, factory, key=None):
+    """Queue an outgoing REST call, await the returned future for its result"""
+    return outbound.submit(priority, bucket, factory, key)
+
+def _report_failure(description):
+    """Done callback for fire-and-forget jobs"""
+    def callback(future):
+        if not future.cancelled() and future.exception():
+            print(f"{description}: {future.exception()}")
+    return callback
+
+# Local storage (SQLite)
+import sqlite3
+
+DATA_DIR = os.getenv('BOT_DATA_DIR', 'data')
+DB_PATH = os.path.join(DATA_DIR, 'bot.db')
+
+# Each subsystem adds the tables it needs, they are created on first use
+DB_SCHEMA = []
+# One-off upgrades of older databases, run after DB_SCHEMA. Each takes the
+# connection and must check for itself whether it still has work to do
+DB_MIGRATIONS = []
+db_connection = None
+
+def _table_exists(db, table):
+    return db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone() is not None
+
+def _table_columns(db, table):
+    return {row['name'] for row in db.execute(f"PRAGMA table_info({table})")}
+
+def get_db():
+    """Return the shared SQLite connection, creating the database on first use"""
+    global db_connection
+    if db_connection is None:
+        os.makedirs(DATA_DIR, exist_ok=True)
+        db_connection = sqlite3.connect(DB_PATH)
+        db_connection.row_factory = sqlite3.Row
+        db_connection.execute('PRAGMA journal_mode=WAL')
+        db_connection.execute('PRAGMA synchronous=NORMAL')
+        for statement in DB_SCHEMA:
+            db_connection.execute(statement)
+        for migration in DB_MIGRATIONS:
+            migration(db_connection)
+        db_connection.commit()
+    return db_connection
+
+# Ticket transcripts
+import gzip
+import json
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None  # Optional, gzip is used without it
+
+TRANSCRIPT_DIR = os.path.join(DATA_DIR, 'transcripts')
+TRANSCRIPT_COMPRESSION = os.getenv('TRANSCRIPT_COMPRESSION', 'zstd' if zstandard else 'gzip')
+TRANSCRIPT_PAGE_SIZE = 100  # Messages written per batch, matches the history page size
+
+DB_SCHEMA += [
+    """CREATE TABLE IF NOT EXISTS ticket_transcripts (
+        ticket_id INTEGER PRIMARY KEY,
+        guild_id INTEGER NOT NULL,
+        user_id INTEGER,
+        channel_name TEXT,
+        path TEXT NOT NULL,
+        message_count INTEGER NOT NULL,
+        size_bytes INTEGER NOT NULL,
+        archived_at TEXT NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS ticket_transcripts_user ON ticket_transcripts (user_id)",
+]
+
+def _open_transcript_writer(path):
+    """Open a compressed binary writer for the transcript file"""
+    if TRANSCRIPT_COMPRESSION == 'zstd' and zstandard:
+        return zstandard.ZstdCompressor(level=3).stream_writer(open(path, 'wb'), closefd=True)
+    return gzip.open(path, 'wb', compresslevel=6)
+
+def transcript_record(message):
+    """Compact JSON-serialisable form of a message"""
+    return {
+        'id': message.id,
+        'author_id': message.author.id,
+        'author': str(message.author),
+        'content': message.content,
+        'created_at': message.created_at.isoformat(),
+        'edited_at': message.edited_at.isoformat() if message.edited_at else None,
+        'attachments': [attachment.url for attachment in message.attachments],
+        'embeds': [embed.to_dict() for embed in message.embeds],
+    }
+
+async def archive_ticket_transcript(channel, user_id):
+    """Stream a ticket's history into a compressed JSONL file and index it.
+
+    History is written one page at a time, so memory use does not grow with the
+    size of the ticket.
+    """
+    os.makedirs(TRANSCRIPT_DIR, exist_ok=True)
+    extension = 'jsonl.zst' if TRANSCRIPT_COMPRESSION == 'zstd' and zstandard else 'jsonl.gz'
+    path = os.path.join(TRANSCRIPT_DIR, f"{channel.guild.id}-{channel.id}.{extension}")
+
+    # A ticket that is archived again replaces its earlier search entries
+    flush_search_index()
+    db = get_db()
+    db.execute("DELETE FROM indexed_messages WHERE ticket_id = ? AND source = 'ticket'", (channel.id,))
+    db.commit()
+
+    writer = await asyncio.to_thread(_open_transcript_writer, path)
+    count = 0
+    page = []
+    try:
+        async for message in channel.history(limit=None, oldest_first=True):
+            page.append(json.dumps(transcript_record(message), ensure_ascii=False))
+            queue_search_entry(message, 'ticket', ticket_id=channel.id)
+            if len(page) >= TRANSCRIPT_PAGE_SIZE:
+                await asyncio.to_thread(writer.write, ("\n".join(page) + "\n").encode('utf-8'))
+                count += len(page)
+                page = []
+        if page:
+            await asyncio.to_thread(writer.write, ("\n".join(page) + "\n").encode('utf-8'))
+            count += len(page)
+    except Exception:
+        await asyncio.to_thread(writer.close)
+        os.remove(path)
+        raise
+    await asyncio.to_thread(writer.close)
+
+    size = os.path.getsize(path)
+    db.execute(
+        "INSERT OR REPLACE INTO ticket_transcripts VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (channel.id, channel.guild.id, user_id, channel.name, path, count, size, datetime.utcnow().isoformat())
+    )
+    db.commit()
+    return {'path': path, 'messages': count, 'bytes': size}
+
+# Message search index
+SEARCH_PAGE_SIZE = 10
+SEARCH_FLUSH_INTERVAL = 1.0  # Seconds queued entries may wait before being written
+SEARCH_FLUSH_BATCH = 500     # Write immediately once this many entries are queued
+SEARCH_SOURCES = {'ticket': '🎫', 'deleted': '🗑️', 'edited': '✏️'}
+
+DB_SCHEMA += [
+    """CREATE TABLE IF NOT EXISTS indexed_messages (
+        id INTEGER PRIMARY KEY,
+        message_id INTEGER,
+        guild_id INTEGER NOT NULL,
+        channel_id INTEGER,
+        author_id INTEGER,
+        author TEXT,
+        source TEXT NOT NULL,
+        ticket_id INTEGER,
+        created_at TEXT,
+        content TEXT NOT NULL
+    )""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS message_search USING fts5(
+        content, content='indexed_messages', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS indexed_messages_insert AFTER INSERT ON indexed_messages BEGIN
+        INSERT INTO message_search(rowid, content) VALUES (new.id, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS indexed_messages_delete AFTER DELETE ON indexed_messages BEGIN
+        INSERT INTO message_search(message_search, rowid, content) VALUES ('delete', old.id, old.content);
+    END""",
+]
+
+search_index_queue = []
+search_flush_handle = None
+search_read_connection = None
+search_read_lock = threading.Lock()
+search_latency = LatencyHistogram()
+
+def queue_search_entry(message, source, ticket_id=None, content=None):
+    """Queue a message for the search index, writes are batched"""
+    content = message.content if content is None else content
+    if not content or not message.guild:
+        return
+    _queue_search_row((
+        message.id, message.guild.id, message.channel.id, message.author.id, str(message.author),
+        source, ticket_id, message.created_at.isoformat(), content
+    ))
+
+def _queue_search_row(row):
+    global search_flush_handle
+    search_index_queue.append(row)
+
+    if len(search_index_queue) >= SEARCH_FLUSH_BATCH:
+        flush_search_index()
+    elif search_flush_handle is None:
+        search_flush_handle = asyncio.get_running_loop().call_later(SEARCH_FLUSH_INTERVAL, flush_search_index)
+
+def flush_search_index():
+    """Write all queued entries in one transaction"""
+    global search_flush_handle
+    if search_flush_handle is not None:
+        search_flush_handle.cancel()
+        search_flush_handle = None
+    if not search_index_queue:
+        return
+
+    rows = search_index_queue[:]
+    search_index_queue.clear()
+    try:
+        db = get_db()
+        db.executemany(
+            """INSERT INTO indexed_messages (message_id, guild_id, channel_id, author_id, author, source, ticket_id, created_at, content)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            rows
+        )
+        db.commit()
+    except Exception as e:
+        print(f"Failed to update search index: {e}")
+
+# Compact message cache: with max_messages=None (lean profile) discord.py keeps no messages,
+# so raw delete and edit events carry no old content. Keep just enough of recent guild
+# messages to log and index them, bounded in count and size.
+COMPACT_MESSAGE_CONTENT = 1000  # Characters kept per message
+
+class CompactMessage:
+    __slots__ = ('id', 'guild_id', 'channel_id', 'author_id', 'author', 'content')
+
+    def __init__(self, message):
+        self.id = message.id
+        self.guild_id = message.guild.id
+        self.channel_id = message.channel.id
+        self.author_id = message.author.id
+        self.author = str(message.author)
+        self.content = message.content[:COMPACT_MESSAGE_CONTENT]
+
+compact_messages = {}  # message_id -> CompactMessage, in arrival order so the oldest goes first
+
+def cache_compact_message(message):
+    """Remember a guild message when the profile replaces discord.py's message cache"""
+    size = cache_profile.get('compact_messages', 0)
+    if not size or message.guild is None:
+        return
+    compact_messages[message.id] = CompactMessage(message)
+    if len(compact_messages) > size:
+        del compact_messages[next(iter(compact_messages))]
+
+def queue_compact_search_entry(compact, source, content=None):
+    """Queue a compact cached message for the search index"""
+    content = compact.content if content is None else content
+    if not content:
+        return
+    _queue_search_row((
+        compact.id, compact.guild_id, compact.channel_id, compact.author_id, compact.author,
+        source, None, discord.utils.snowflake_time(compact.id).isoformat(), content
+    ))
+
+def _fts_query(text):
+    """Quote every word so user input can't break FTS syntax (all words must match)"""
+    words = [word.replace('"', '""') for word in text.split()]
+    return " ".join(f'"{word}"' for word in words)
+
+def search_messages(guild_id, text, page=0, source=None):
+    """Newest-first search results for a guild, returns (rows, has_more). Blocking."""
+    global search_read_connection
+    query = _fts_query(text)
+    if not query:
+        return [], False
+
+    sql = """SELECT m.message_id, m.channel_id, m.author_id, m.author, m.source, m.ticket_id, m.created_at,
+                    snippet(message_search, 0, '**', '**', '…', 16) AS snippet
+             FROM message_search JOIN indexed_messages m ON m.id = message_search.rowid
+             WHERE message_search MATCH ? AND m.guild_id = ?"""
+    params = [query, guild_id]
+    if source:
+        sql += " AND m.source = ?"
+        params.append(source)
+    sql += " ORDER BY message_search.rowid DESC LIMIT ? OFFSET ?"
+    params += [SEARCH_PAGE_SIZE + 1, page * SEARCH_PAGE_SIZE]
+
+    with search_read_lock:
+        if search_read_connection is None:
+            get_db()  # Make sure the schema exists
+            search_read_connection = sqlite3.connect(DB_PATH, check_same_thread=False)
+            search_read_connection.row_factory = sqlite3.Row
+        rows = search_read_connection.execute(sql, params).fetchall()
+    return rows[:SEARCH_PAGE_SIZE], len(rows) > SEARCH_PAGE_SIZE
+
+async def build_search_embed(guild_id, text, page, source):
+    """Run a search off the event loop and render one page of results"""
+    flush_search_index()  # Include anything still queued
+    start = time.perf_counter()
+    rows, has_more = await asyncio.to_thread(search_messages, guild_id, text, page, source)
+    elapsed = time.perf_counter() - start
+    search_latency.record(elapsed)
+
+    embed = discord.Embed(
+        title=f"🔎 Search: {text[:100]}",
+        color=discord.Color.blue()
+    )
+    lines = []
+    for i, row in enumerate(rows, page * SEARCH_PAGE_SIZE + 1):
+        created = datetime.fromisoformat(row['created_at'])
+        where = f"ticket `{row['ticket_id']}`" if row['ticket_id'] else f"<#{row['channel_id']}>"
+        lines.append(
+            f"**{i}.** {SEARCH_SOURCES.get(row['source'], '')} <@{row['author_id']}> in {where} <t:{int(created.timestamp())}:R>\n"
+            f"> {row['snippet'][:200]}"
+        )
+    embed.description = "\n".join(lines) if lines else "No matching messages found."
+    embed.set_footer(text=f"Page {page + 1} - {elapsed * 1000:.0f} ms")
+    return embed, has_more
+
+class SearchResultsView(discord.ui.View):
+    def __init__(self, author_id, guild_id, text, source, page=0, has_more=False):
+        super().__init__(timeout=300)
+        self.author_id = author_id
+        self.guild_id = guild_id
+        self.text = text
+        self.source = source
+        self.page = page
+        self.update_buttons(has_more)
+
+    def update_buttons(self, has_more):
+        self.previous_page.disabled = self.page == 0
+        self.next_page.disabled = not has_more
+
+    async def show_page(self, interaction, page):
+        if interaction.user.id != self.author_id:
+            await interaction.response.send_message("❌ Run /search yourself to browse results.", ephemeral=True)
+            return
+        self.page = page
+        embed, has_more = await build_search_embed(self.guild_id, self.text, page, self.source)
+        self.update_buttons(has_more)
+        await interaction.response.edit_message(embed=embed, view=self)
+
+    @discord.ui.button(label='◀ Previous', style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.show_page(interaction, max(0, self.page - 1))
+
+    @discord.ui.button(label='Next ▶', style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.show_page(interaction, self.page + 1)
+
+# Slash command: Search transcripts and logged messages
+@bot.tree.command(name='search', description='Search ticket transcripts and deleted/edited messages (Staff only)')
+@discord.app_commands.choices(source=[
+    discord.app_commands.Choice(name='Ticket transcripts', value='ticket'),
+    discord.app_commands.Choice(name='Deleted messages', value='deleted'),
+    discord.app_commands.Choice(name='Edited messages', value='edited'),
+])
+async def search_slash(interaction: discord.Interaction, query: str, source: discord.app_commands.Choice[str] = None, page: int = 1):
+    """Full-text search over the local message index"""
+    if not interaction.user.guild_permissions.manage_messages:
+        await interaction.response.send_message("❌ You don't have permission to search messages!", ephemeral=True)
+        return
+
+    source_value = source.value if source else None
+    page = max(1, page) - 1
+    embed, has_more = await build_search_embed(interaction.guild.id, query, page, source_value)
+    view = SearchResultsView(interaction.user.id, interaction.guild.id, query, source_value, page, has_more)
+    await interaction.response.send_message(embed=embed, view=view, ephemeral=True)
+
+# Ticket analytics
+DB_SCHEMA += [
+    """CREATE TABLE IF NOT EXISTS ticket_events (
+        ticket_id INTEGER NOT NULL,
+        guild_id INTEGER NOT NULL,
+        user_id INTEGER,
+        event TEXT NOT NULL,
+        at REAL NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS ticket_events_ticket ON ticket_events (ticket_id)",
+]
+
+# Open tickets by channel id -> {'guild_id', 'user_id', 'created_at', 'first_response_at'}
+open_tickets = {}
+# Aggregates per guild, updated as events happen
+ticket_stats = {}
+ticket_stats_loaded = False
+
+class TicketStats:
+    """Rolling ticket queue aggregates, every update is O(1)"""
+    def __init__(self):
+        self.open = 0
+        self.created = 0
+        self.closed = 0
+        self.first_response = LatencyHistogram()
+        self.hourly = [(None, 0)] * 24  # Ring buffer of (hour, tickets created)
+
+    def on_created(self, at):
+        self.open += 1
+        self.created += 1
+        hour = int(at // 3600)
+        slot_hour, count = self.hourly[hour % 24]
+        self.hourly[hour % 24] = (hour, count + 1 if slot_hour == hour else 1)
+
+    def on_first_response(self, seconds):
+        self.first_response.record(seconds)
+
+    def on_closed(self):
+        self.open = max(0, self.open - 1)
+        self.closed += 1
+
+    def created_since(self, now, hours):
+        current = int(now // 3600)
+        return sum(count for hour, count in self.hourly if hour is not None and current - hours < hour <= current)
+
+def _ticket_stats(guild_id):
+    stats = ticket_stats.get(guild_id)
+    if stats is None:
+        stats = ticket_stats[guild_id] = TicketStats()
+    return stats
+
+def load_ticket_stats():
+    """Rebuild aggregates and open tickets from the stored events (once at startup)"""
+    global ticket_stats_loaded
+    if ticket_stats_loaded:
+        return
+    ticket_stats_loaded = True
+    try:
+        for row in get_db().execute("SELECT ticket_id, guild_id, user_id, event, at FROM ticket_events ORDER BY at"):
+            _apply_ticket_event(row['event'], row['ticket_id'], row['guild_id'], row['user_id'], row['at'])
+    except Exception as e:
+        print(f"Failed to load ticket stats: {e}")
+
+def _apply_ticket_event(event, ticket_id, guild_id, user_id, at):
+    stats = _ticket_stats(guild_id)
+    if event == 'created':
+        open_tickets[ticket_id] = {'guild_id': guild_id, 'user_id': user_id, 'created_at': at, 'first_response_at': None}
+        stats.on_created(at)
+    elif event == 'first_response':
+        ticket = open_tickets.get(ticket_id)
+        if ticket and ticket['first_response_at'] is None:
+            ticket['first_response_at'] = at
+            stats.on_first_response(at - ticket['created_at'])
+    elif event == 'closed':
+        if open_tickets.pop(ticket_id, None) is not None:
+            stats.on_closed()
+
+def record_ticket_event(event, channel, user_id=None):
+    """Store a ticket lifecycle event and update the aggregates"""
+    _record_ticket_event(event, channel.id, channel.guild.id, user_id)
+
+def _record_ticket_event(event, ticket_id, guild_id, user_id):
+    at = time.time()
+    try:
+        db = get_db()
+        db.execute("INSERT INTO ticket_events VALUES (?, ?, ?, ?, ?)", (ticket_id, guild_id, user_id, event, at))
+        db.commit()
+    except Exception as e:
+        print(f"Failed to store ticket event: {e}")
+    _apply_ticket_event(event, ticket_id, guild_id, user_id, at)
+
+def close_deleted_ticket(channel_id):
+    """Record a ticket whose channel is gone without close_ticket_channel (deleted by hand) as closed.
+
+    Returns the ticket, or None if it wasn't open.
+    """
+    ticket = open_tickets.get(channel_id)
+    if ticket is None:
+        return None
+    forget_ticket(channel_id)
+    _record_ticket_event('closed', channel_id, ticket['guild_id'], ticket['user_id'])
+    if ticket_owners.get((ticket['guild_id'], ticket['user_id'])) == channel_id:
+        del ticket_owners[(ticket['guild_id'], ticket['user_id'])]
+    return ticket
+
+@bot.listen('on_guild_channel_delete')
+async def close_deleted_ticket_channel(channel):
+    # Tickets closed normally are released by close_ticket_channel
+    if close_deleted_ticket(channel.id) is not None:
+        release_ticket_category(channel.category_id)
+
+@bot.listen('on_raw_thread_delete')
+async def close_deleted_ticket_thread(payload):
+    close_deleted_ticket(payload.thread_id)
+
+def track_ticket_message(message):
+    """Record activity and the first staff reply in a ticket"""
+    ticket = open_tickets.get(message.channel.id)
+    if not ticket:
+        return
+    touch_ticket(message.channel.id)
+    if ticket['first_response_at'] is not None or message.author.id == ticket['user_id']:
+        return
+    permissions = getattr(message.author, 'guild_permissions', None)
+    if permissions and permissions.manage_channels:
+        record_ticket_event('first_response', message.channel, message.author.id)
+
+def _format_duration(seconds):
+    if seconds < 60:
+        return f"{seconds:.0f}s"
+    if seconds < 3600:
+        return f"{seconds / 60:.1f}m"
+    return f"{seconds / 3600:.1f}h"
+
+# Slash command: Ticket statistics
+@bot.tree.command(name='ticketstats', description='Show ticket queue statistics (Staff only)')
+async def ticket_stats_slash(interaction: discord.Interaction):
+    """Show ticket backlog and response times from the precomputed aggregates"""
+    if not interaction.user.guild_permissions.manage_channels:
+        await interaction.response.send_message("❌ You don't have permission to view ticket statistics!", ephemeral=True)
+        return
+
+    stats = _ticket_stats(interaction.guild.id)
+    now = time.time()
+    responded = stats.first_response.count
+
+    embed = discord.Embed(
+        title="🎫 Ticket Statistics",
+        color=discord.Color.blue(),
+        timestamp=datetime.utcnow()
+    )
+    embed.add_field(name="Open Tickets", value=str(stats.open), inline=True)
+    embed.add_field(name="Created (total)", value=str(stats.created), inline=True)
+    embed.add_field(name="Closed (total)", value=str(stats.closed), inline=True)
+    embed.add_field(name="Last Hour", value=f"{stats.created_since(now, 1)} tickets", inline=True)
+    embed.add_field(name="Last 24 Hours", value=f"{stats.created_since(now, 24)} tickets ({stats.created_since(now, 24) / 24:.1f}/h)", inline=True)
+    embed.add_field(name="\u200b", value="\u200b", inline=True)
+    embed.add_field(
+        name="First Response (median)",
+        value=_format_duration(stats.first_response.percentile(50)) if responded else "No data yet",
+        inline=True
+    )
+    embed.add_field(
+        name="First Response (p90)",
+        value=_format_duration(stats.first_response.percentile(90)) if responded else "No data yet",
+        inline=True
+    )
+    embed.add_field(name="Tickets Answered", value=str(responded), inline=True)
+
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+# Ticket inactivity sweeper
+import heapq
+
+TICKET_INACTIVE_WARN = 24 * 3600   # Seconds without messages before a ticket gets a warning
+TICKET_INACTIVE_CLOSE = 24 * 3600  # Seconds after the warning before it is closed
+
+# Last activity per open ticket channel, and a heap of (due_at, channel_id) checks.
+# Heap entries are not updated on every message; when one comes due it is compared
+# against the activity index and pushed back if the ticket was active since.
+ticket_activity = {}
+ticket_warned = {}  # channel_id -> time the warning was sent
+ticket_expiry_heap = []
+ticket_sweeper_wakeup = asyncio.Event()
+ticket_sweeper_task = None
+
+def touch_ticket(channel_id, at=None):
+    """Record activity in a ticket, scheduling a check if it has none yet"""
+    at = at or time.time()
+    is_new = channel_id not in ticket_activity
+    ticket_activity[channel_id] = at
+    ticket_warned.pop(channel_id, None)
+    if is_new:
+        heapq.heappush(ticket_expiry_heap, (at + TICKET_INACTIVE_WARN, channel_id))
+        ticket_sweeper_wakeup.set()
+
+def forget_ticket(channel_id):
+    """Stop tracking a ticket, its heap entry is dropped when it comes due"""
+    ticket_activity.pop(channel_id, None)
+    ticket_warned.pop(channel_id, None)
+
+async def _warn_inactive_ticket(channel):
+    embed = discord.Embed(
+        title="⏰ Ticket Inactive",
+        description=f"This ticket has had no activity for {TICKET_INACTIVE_WARN // 3600} hours.\n\n"
+                    f"It will be closed automatically in {TICKET_INACTIVE_CLOSE // 3600} hours unless someone replies.",
+        color=discord.Color.orange()
+    )
+    await channel.send(embed=embed)
+
+async def _close_inactive_ticket(channel):
+    try:
+        embed = discord.Embed(
+            title="🔒 Ticket Closing",
+            description="This ticket was closed for inactivity and will be deleted in 10 seconds...",
+            color=discord.Color.red()
+        )
+        await channel.send(embed=embed)
+        ticket = open_tickets.get(channel.id, {})
+        if not await close_ticket_channel(channel, ticket.get('user_id'), reason="Ticket closed for inactivity"):
+            touch_ticket(channel.id)  # Try again after another full period
+    except Exception as e:
+        print(f"Failed to auto-close ticket {channel.id}: {e}")
+
+async def _process_due_ticket(channel_id, now):
+    last_activity = ticket_activity.get(channel_id)
+    if last_activity is None:
+        return  # Closed in the meantime
+
+    channel = bot.get_channel(channel_id)
+    if channel is None:
+        close_deleted_ticket(channel_id)
+        return
+
+    warned_at = ticket_warned.get(channel_id)
+    if warned_at is None:
+        if now - last_activity < TICKET_INACTIVE_WARN:
+            heapq.heappush(ticket_expiry_heap, (last_activity + TICKET_INACTIVE_WARN, channel_id))
+            return
+        await _warn_inactive_ticket(channel)
+        ticket_warned[channel_id] = now
+        heapq.heappush(ticket_expiry_heap, (now + TICKET_INACTIVE_CLOSE, channel_id))
+    elif now - warned_at >= TICKET_INACTIVE_CLOSE:
+        forget_ticket(channel_id)
+        # Closing waits out the countdown, don't hold up other tickets
+        asyncio.create_task(_close_inactive_ticket(channel))
+    else:
+        heapq.heappush(ticket_expiry_heap, (warned_at + TICKET_INACTIVE_CLOSE, channel_id))
+
+async def ticket_sweeper():
+    """Sleep until the next ticket check is due, no scanning of all tickets"""
+    while True:
+        ticket_sweeper_wakeup.clear()
+        timeout = max(0, ticket_expiry_heap[0][0] - time.time()) if ticket_expiry_heap else None
+        try:
+            await asyncio.wait_for(ticket_sweeper_wakeup.wait(), timeout)
+            continue  # A new, possibly earlier, check was scheduled
+        except asyncio.TimeoutError:
+            pass
+
+        now = time.time()
+        while ticket_expiry_heap and ticket_expiry_heap[0][0] <= now:
+            _, channel_id = heapq.heappop(ticket_expiry_heap)
+            try:
+                await _process_due_ticket(channel_id, now)
+            except Exception as e:
+                print(f"Ticket sweeper error for {channel_id}: {e}")
+
+def start_ticket_sweeper():
+    """Seed the activity index from open tickets and start the sweeper (only once)"""
+    global ticket_sweeper_task
+    if ticket_sweeper_task and not ticket_sweeper_task.done():
+        return
+
+    for channel_id, ticket in list(open_tickets.items()):
+        if channel_id in ticket_activity:
+            continue
+        channel = bot.get_channel(channel_id)
+        if channel is None:
+            continue
+        # The last message id tells us when the channel was last active
+        last_message_id = getattr(channel, 'last_message_id', None)
+        at = discord.utils.snowflake_time(last_message_id).timestamp() if last_message_id else ticket['created_at']
+        touch_ticket(channel_id, max(at, ticket['created_at']))
+
+    ticket_sweeper_task = asyncio.create_task(ticket_sweeper())
+
+# Ticket category pool
+TICKET_CATEGORY_LIMIT = 50  # Discord allows at most 50 channels per category
+
+DB_SCHEMA += [
+    """CREATE TABLE IF NOT EXISTS ticket_categories (
+        category_id INTEGER PRIMARY KEY,
+        guild_id INTEGER NOT NULL,
+        created_at REAL NOT NULL
+    )""",
+]
+
+# The guild's configured ticket category comes first, overflow categories follow in creation order.
+# Fill levels count channels in use plus slots reserved by tickets still being created.
+ticket_category_pool = {}  # guild_id -> [category ids]
+ticket_category_fill = {}  # category_id -> channel count
+ticket_owners = {}         # (guild_id, user_id) -> ticket channel id
+ticket_pool_locks = {}     # guild_id -> lock held while creating an overflow category
+
+def _ticket_topic_owner(channel):
+    """Get the creator id from a ticket channel topic"""
+    match = re.search(r'\((\d+)\)$', getattr(channel, 'topic', None) or '')
+    return int(match.group(1)) if match else None
+
+def load_ticket_pool(guild):
+    """Build the category pool, fill levels and ticket ownership for a guild from the cache"""
+    category_ids = [get_config(guild, 'ticket_category')]
+    try:
+        rows = get_db().execute(
+            "SELECT category_id FROM ticket_categories WHERE guild_id = ? ORDER BY created_at", (guild.id,)
+        ).fetchall()
+        category_ids += [row['category_id'] for row in rows]
+    except Exception as e:
+        print(f"Failed to load ticket categories: {e}")
+
+    pool = ticket_category_pool[guild.id] = []
+    for category_id in category_ids:
+        category = guild.get_channel(category_id)
+        if category is None:
+            continue
+        pool.append(category_id)
+        ticket_category_fill[category_id] = len(category.channels)
+        for channel in category.channels:
+            owner_id = _ticket_topic_owner(channel)
+            if owner_id and channel.name.startswith("ticket-"):
+                ticket_owners.setdefault((guild.id, owner_id), channel.id)
+
+    # Thread tickets have no topic, their owners come from the ticket analytics index
+    for channel_id, ticket in open_tickets.items():
+        if ticket['guild_id'] == guild.id and ticket['user_id'] and guild.get_channel_or_thread(channel_id):
+            ticket_owners.setdefault((guild.id, ticket['user_id']), channel_id)
+    return pool
+
+def _claim_ticket_slot(guild):
+    for category_id in ticket_category_pool[guild.id]:
+        if ticket_category_fill.get(category_id, 0) < TICKET_CATEGORY_LIMIT:
+            category = guild.get_channel(category_id)
+            if category is None:
+                continue
+            ticket_category_fill[category_id] = ticket_category_fill.get(category_id, 0) + 1
+            return category
+    return None
+
+async def reserve_ticket_category(guild):
+    """Reserve a slot in a pool category with room, creating an overflow category when all are full.
+
+    Returns None if the primary ticket category does not exist.
+    """
+    if guild.id not in ticket_category_pool:
+        load_ticket_pool(guild)
+
+    category = _claim_ticket_slot(guild)
+    if category:
+        return category
+
+    # Only one overflow category is created at a time, everyone else waits for it
+    lock = ticket_pool_locks.setdefault(guild.id, asyncio.Lock())
+    async with lock:
+        category = _claim_ticket_slot(guild)
+        if category:
+            return category
+
+        primary = config_channel(guild, 'ticket_category')
+        if primary is None:
+            return None
+
+        pool = ticket_category_pool[guild.id]
+        category = await guild.create_category(
+            f"{primary.name} {len(pool) + 1}",
+            overwrites=primary.overwrites,
+            position=primary.position + len(pool),
+            reason="Ticket category overflow"
+        )
+        try:
+            with get_db() as db:
+                db.execute(
+                    "INSERT OR IGNORE INTO ticket_categories (category_id, guild_id, created_at) VALUES (?, ?, ?)",
+                    (category.id, guild.id, time.time())
+                )
+        except Exception as e:
+            print(f"Failed to save ticket category: {e}")
+        pool.append(category.id)
+        ticket_category_fill[category.id] = 1
+        return category
+
+def release_ticket_category(category_id):
+    """Free a slot after a ticket channel was deleted or could not be created"""
+    if category_id in ticket_category_fill:
+        ticket_category_fill[category_id] = max(0, ticket_category_fill[category_id] - 1)
+
+def mark_ticket_category_full(category_id):
+    """Stop using a category Discord reports as full, until a ticket in it closes"""
+    ticket_category_fill[category_id] = TICKET_CATEGORY_LIMIT
+
+def is_category_full_error(error):
+    return isinstance(error, discord.HTTPException) and error.code == 50035 and 'parent_id' in error.text
+
+async def create_ticket_channel(guild, user):
+    """Create a private ticket channel in the first pool category with room.
+
+    Returns None if the primary ticket category does not exist.
+    """
+    overwrites = {
+        guild.default_role: discord.PermissionOverwrite(read_messages=False),
+        user: discord.PermissionOverwrite(read_messages=True, send_messages=True, attach_files=True, embed_links=True),
+        guild.me: discord.PermissionOverwrite(read_messages=True, send_messages=True, manage_messages=True)
+    }
+    
+    # Add permissions for roles with manage_channels permission (staff roles)
+    for role in guild.roles:
+        if role.permissions.manage_channels and not role.is_default():
+            overwrites[role] = discord.PermissionOverwrite(read_messages=True, send_messages=True, manage_messages=True)
+    
+    # Retry in the next category if Discord says this one is full
+    for attempt in range(3):
+        category = await reserve_ticket_category(guild)
+        if category is None:
+            return None
+        try:
+            return await guild.create_text_channel(
+                name=f"ticket-{user.name.lower()}-{user.discriminator}",
+                category=category,
+                overwrites=overwrites,
+                topic=f"Ticket created by {user} ({user.id})"
+            )
+        except Exception as e:
+            if not is_category_full_error(e) or attempt == 2:
+                release_ticket_category(category.id)
+                raise
+            mark_ticket_category_full(category.id)
+
+# Ticket backends
+TICKET_BACKENDS = ('channel', 'thread')
+TICKET_BACKEND = os.getenv('TICKET_BACKEND', 'channel')  # Default for guilds that did not pick one
+
+def get_ticket_backend(guild_id):
+    """Get the ticket backend ('channel' or 'thread') for a guild"""
+    return guild_config(guild_id)['ticket_backend']
+
+def set_ticket_backend(guild_id, backend):
+    set_guild_config(guild_id, 'ticket_backend', backend)
+
+async def create_ticket_thread(guild, user):
+    """Create a private ticket thread under the ticket channel.
+
+    One REST call and no per-role overwrites: mentioning the creator in the welcome
+    message adds them, staff see private threads through Manage Threads.
+    Returns None if the ticket channel does not exist.
+    """
+    panel = config_channel(guild, 'ticket_channel')
+    if panel is None:
+        return None
+    return await panel.create_thread(
+        name=f"ticket-{user.name.lower()}-{user.discriminator}",
+        type=discord.ChannelType.private_thread,
+        invitable=False,
+        auto_archive_duration=10080,
+        reason=f"Ticket created by {user} ({user.id})"
+    )
+
+def ticket_location(channel):
+    """Describe where a ticket lives, for logs"""
+    if channel.type is discord.ChannelType.private_thread:
+        return f"#{channel.parent.name} (thread)" if channel.parent else "Thread"
+    return channel.category.name if channel.category else "None"
+
+@bot.tree.command(name='ticketmode', description='Choose whether tickets are channels or private threads (Admin only)')
+@discord.app_commands.choices(mode=[
+    discord.app_commands.Choice(name='Channels (one channel per ticket)', value='channel'),
+    discord.app_commands.Choice(name='Private threads (faster, no channel limit)', value='thread'),
+])
+async def ticket_mode_slash(interaction: discord.Interaction, mode: discord.app_commands.Choice[str]):
+    """Switch the ticket backend for new tickets, open tickets keep working"""
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("❌ You need administrator permissions to use this command!", ephemeral=True)
+        return
+
+    try:
+        set_ticket_backend(interaction.guild.id, mode.value)
+    except Exception as e:
+        await interaction.response.send_message(f"❌ Failed to save ticket mode: {e}", ephemeral=True)
+        return
+
+    embed = discord.Embed(
+        title="🎫 Ticket Mode Updated",
+        description=f"New tickets will be created as **{mode.name.lower()}**.",
+        color=discord.Color.green()
+    )
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+# Member snapshot
+from datetime import timezone
+
+MEMBER_SNAPSHOT_FLUSH = 60  # Seconds between writes of changed snapshots to disk
+# Snapshots the gateway hasn't confirmed for this long are looked up again before they decide
+# anything, and rows unconfirmed for the expiry (members who left while we missed it) are dropped
+MEMBER_SNAPSHOT_MAX_AGE = int(os.getenv('MEMBER_SNAPSHOT_MAX_AGE', 7 * 86400))
+MEMBER_SNAPSHOT_EXPIRY = int(os.getenv('MEMBER_SNAPSHOT_EXPIRY', 30 * 86400))
+
+DB_SCHEMA += [
+    """CREATE TABLE IF NOT EXISTS member_snapshots (
+        guild_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        role_ids BLOB NOT NULL,
+        joined_at REAL,
+        flags INTEGER NOT NULL DEFAULT 0,
+        seen_at REAL,
+        PRIMARY KEY (guild_id, user_id)
+    ) WITHOUT ROWID""",
+]
+
+def _migrate_member_snapshot_seen_at(db):
+    """Rows saved before seen_at existed start out unverified"""
+    if 'seen_at' not in _table_columns(db, 'member_snapshots'):
+        db.execute("ALTER TABLE member_snapshots ADD COLUMN seen_at REAL")
+        db.execute("UPDATE member_snapshots SET seen_at = ?", (time.time() - MEMBER_SNAPSHOT_MAX_AGE,))
+
+DB_MIGRATIONS.append(_migrate_member_snapshot_seen_at)
+
+# Roles, join time and flags of members we have seen, refreshed from the member objects
+# that interactions, messages and member events carry anyway, so checks never fetch members.
+# With MEMBER_SNAPSHOT=1 they are also persisted, and the last run's snapshot stands in
+# for the member chunks we no longer request at startup.
+class MemberSnapshot:
+    __slots__ = ('role_ids', 'joined_at', 'flags', 'seen_at')
+
+    def __init__(self, role_ids, joined_at, flags=0, seen_at=0):
+        self.role_ids = role_ids    # frozenset of role ids
+        self.joined_at = joined_at  # Unix timestamp, or None if unknown
+        self.flags = flags          # discord.MemberFlags value
+        self.seen_at = seen_at      # Unix timestamp the gateway last confirmed the member
+
+    def __eq__(self, other):
+        return (self.role_ids, self.joined_at, self.flags) == (other.role_ids, other.joined_at, other.flags)
+
+member_snapshots = defaultdict(dict)  # guild_id -> {user_id: MemberSnapshot}
+member_snapshot_dirty = set()         # (guild_id, user_id) changed since the last flush
+member_snapshot_removed = set()       # (guild_id, user_id) gone since the last flush
+member_role_sets = {}                 # Interned role id sets, most members share a handful of combinations
+member_snapshot_task = None
+startup_clock = time.monotonic()
+startup_report = {}
+
+def _store_snapshot(guild_id, user_id, role_ids, joined_at, flags):
+    now = time.time()
+    snapshot = MemberSnapshot(member_role_sets.setdefault(role_ids, role_ids), joined_at, flags, now)
+    snapshots = member_snapshots[guild_id]
+    previous = snapshots.get(user_id)
+    if previous is not None and previous == snapshot:
+        # Busy members confirm their snapshot constantly, only rewrite the row a few times a day
+        if now - previous.seen_at < MEMBER_SNAPSHOT_MAX_AGE / 24:
+            return previous
+        previous.seen_at = now
+    else:
+        snapshots[user_id] = previous = snapshot
+    if MEMBER_SNAPSHOT:
+        member_snapshot_dirty.add((guild_id, user_id))
+        member_snapshot_removed.discard((guild_id, user_id))
+    return previous
+
+def snapshot_member(member):
+    """Record a guild member's roles and join time, returning the snapshot"""
+    guild = getattr(member, 'guild', None)
+    if guild is None or not hasattr(member, 'roles'):
+        return None  # Users from DMs have no guild data
+    joined_at = member.joined_at.timestamp() if member.joined_at else None
+    return _store_snapshot(guild.id, member.id, frozenset(role.id for role in member.roles), joined_at, member.flags.value)
+
+def snapshot_member_data(data):
+    """Record a member from a raw gateway payload, for members outside the member cache"""
+    guild_id = int(data['guild_id'])
+    joined_at = discord.utils.parse_time(data.get('joined_at'))
+    # member.roles includes @everyone (the guild id), payloads don't
+    role_ids = frozenset(map(int, data.get('roles', ()))) | {guild_id}
+    return _store_snapshot(guild_id, int(data['user']['id']), role_ids,
+                           joined_at.timestamp() if joined_at else None, data.get('flags', 0))
+
+def snapshot_verified(snapshot, now=None):
+    """Whether the gateway confirmed this snapshot recently enough to act on it alone"""
+    return snapshot is not None and (now or time.time()) - snapshot.seen_at < MEMBER_SNAPSHOT_MAX_AGE
+
+def forget_member(guild_id, user_id):
+    """Drop a member who left (or turned out to be gone) from the snapshot"""
+    if member_snapshots[guild_id].pop(user_id, None) is not None and MEMBER_SNAPSHOT:
+        member_snapshot_dirty.discard((guild_id, user_id))
+        member_snapshot_removed.add((guild_id, user_id))
+
+def load_member_snapshots():
+    """Warm the snapshot from disk before connecting, gateway events then reconcile it"""
+    start = time.perf_counter()
+    count = 0
+    by_blob = {}
+    try:
+        with get_db() as db:
+            db.execute("DELETE FROM member_snapshots WHERE seen_at < ?", (time.time() - MEMBER_SNAPSHOT_EXPIRY,))
+        rows = get_db().execute("SELECT guild_id, user_id, role_ids, joined_at, flags, seen_at FROM member_snapshots")
+        for guild_id, user_id, blob, joined_at, flags, seen_at in rows:
+            role_ids = by_blob.get(blob)
+            if role_ids is None:
+                roles = array('Q')
+                roles.frombytes(blob)
+                role_ids = frozenset(roles)
+                role_ids = by_blob[blob] = member_role_sets.setdefault(role_ids, role_ids)
+            # Anything the gateway told us since takes precedence
+            member_snapshots[guild_id].setdefault(user_id, MemberSnapshot(role_ids, joined_at, flags, seen_at or 0))
+            count += 1
+    except Exception as e:
+        print(f"Failed to load member snapshot: {e}")
+    startup_report.update(snapshot_members=count, snapshot_load_seconds=time.perf_counter() - start)
+    return count
+
+def flush_member_snapshots():
+    """Write changed and removed snapshots to disk"""
+    if not member_snapshot_dirty and not member_snapshot_removed:
+        return
+    dirty, removed = list(member_snapshot_dirty), list(member_snapshot_removed)
+    member_snapshot_dirty.clear()
+    member_snapshot_removed.clear()
+    rows = []
+    for guild_id, user_id in dirty:
+        snapshot = member_snapshots[guild_id].get(user_id)
+        if snapshot is not None:
+            rows.append((guild_id, user_id, array('Q', sorted(snapshot.role_ids)).tobytes(), snapshot.joined_at,
+                         snapshot.flags, snapshot.seen_at))
+    try:
+        with get_db() as db:
+            db.executemany(
+                "INSERT OR REPLACE INTO member_snapshots (guild_id, user_id, role_ids, joined_at, flags, seen_at) VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            db.executemany("DELETE FROM member_snapshots WHERE guild_id = ? AND user_id = ?", removed)
+    except Exception as e:
+        print(f"Failed to save member snapshot: {e}")
+        member_snapshot_dirty.update(dirty)
+        member_snapshot_removed.update(removed)
+
+def reconcile_member_snapshots(guilds):
+    """Drop guilds we left while offline and replace the snapshot of any guild that is fully chunked"""
+    guild_ids = {guild.id for guild in guilds}
+    for guild_id in list(member_snapshots):
+        if guild_id not in guild_ids:
+            for user_id in list(member_snapshots[guild_id]):
+                forget_member(guild_id, user_id)
+            del member_snapshots[guild_id]
+    for guild in guilds:
+        if guild.chunked:
+            for user_id in set(member_snapshots[guild.id]) - {member.id for member in guild.members}:
+                forget_member(guild.id, user_id)
+            for member in guild.members:
+                snapshot_member(member)
+
+async def member_snapshot_flusher():
+    while True:
+        await asyncio.sleep(MEMBER_SNAPSHOT_FLUSH)
+        flush_member_snapshots()
+
+def start_member_snapshots():
+    """Reconcile the warm snapshot with what we got on connect and start flushing it (only once)"""
+    global member_snapshot_task
+    if not MEMBER_SNAPSHOT or (member_snapshot_task and not member_snapshot_task.done()):
+        return
+    reconcile_member_snapshots(bot.guilds)
+    member_snapshot_task = asyncio.create_task(member_snapshot_flusher())
+
+def process_rss():
+    """Resident memory of this process in bytes, or None where we can't tell"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # Peak, in KB on Linux
+    except ImportError:
+        return None
+
+def report_startup():
+    """Print how long it took to become ready and how much memory we hold"""
+    rss = process_rss()
+    members = sum(len(guild.members) for guild in bot.guilds)
+    line = f"Ready in {time.monotonic() - startup_clock:.1f}s ({BOT_PROFILE} profile), {members} members cached"
+    if rss is not None:
+        line += f", RSS {rss / 2**20:.0f} MB"
+    if MEMBER_SNAPSHOT:
+        line += (f", snapshot of {startup_report.get('snapshot_members', 0)} members loaded in "
+                 f"{startup_report.get('snapshot_load_seconds', 0):.2f}s")
+    else:
+        line += ", guilds chunked at startup"
+    print(line)
+
+def get_member_snapshot(guild, user_id):
+    """Get the freshest snapshot we have, preferring the gateway member cache"""
+    member = guild.get_member(user_id)
+    if member is not None:
+        return snapshot_member(member)
+    return member_snapshots[guild.id].get(user_id)
+
+@bot.listen('on_member_join')
+async def snapshot_member_join(member):
+    snapshot_member(member)
+
+# Members outside the cache (all of them without chunking) get no on_member_remove, the raw event always fires.
+# Sticky roles are read from the snapshot, so they are saved here before the member is forgotten.
+@bot.listen('on_raw_member_remove')
+async def member_removed(payload):
+    try:
+        await save_sticky_roles(payload)
+    finally:
+        forget_member(payload.guild_id, payload.user.id)
+
+# Likewise GUILD_MEMBER_UPDATE dispatches nothing for uncached members, and discord.py (2.7.1) has no
+# raw member update event, so snapshot every payload before its parser runs. The payload carries the
+# member's full roles, join time and flags. ConnectionState.parsers is private, check it is still there.
+def hook_member_update_parser(connection):
+    parsers = getattr(connection, 'parsers', None)
+    if not isinstance(parsers, dict) or 'GUILD_MEMBER_UPDATE' not in parsers:
+        raise RuntimeError(
+            f"discord.py {discord.__version__} has no GUILD_MEMBER_UPDATE parser to hook, "
+            "member snapshots would miss role changes of uncached members"
+        )
+    parse = parsers['GUILD_MEMBER_UPDATE']
+
+    def parse_guild_member_update(data):
+        if bot.get_guild(int(data['guild_id'])) is not None:
+            snapshot_member_data(data)
+        parse(data)
+
+    parsers['GUILD_MEMBER_UPDATE'] = parse_guild_member_update
+
+hook_member_update_parser(bot._connection)
+
+# Giveaway requirements
+def giveaway_requirements(required_role=None, min_account_age=None, min_server_age=None):
+    """Build the requirements stored with a giveaway (ages in seconds)"""
+    return {
+        'roles': [required_role.id] if required_role else [],
+        'account_age': min_account_age or 0,
+        'server_age': min_server_age or 0
+    }
+
+def format_giveaway_requirements(requirements):
+    """Describe a giveaway's requirements for its embed, or None if there are none"""
+    if not requirements:
+        return None
+    lines = [f"Role: <@&{role_id}>" for role_id in requirements['roles']]
+    if requirements['account_age']:
+        lines.append(f"Account age: {_format_duration(requirements['account_age'])}")
+    if requirements['server_age']:
+        lines.append(f"In server for: {_format_duration(requirements['server_age'])}")
+    return "\n".join(lines) or None
+
+def check_giveaway_entry(requirements, member):
+    """Check one member against a giveaway's requirements, returning why they can't enter (or None)"""
+    if not requirements:
+        return None
+    now = time.time()
+    if requirements['account_age'] and discord.utils.snowflake_time(member.id).timestamp() > now - requirements['account_age']:
+        return f"your account must be at least {_format_duration(requirements['account_age'])} old"
+    if not requirements['roles'] and not requirements['server_age']:
+        return None
+    snapshot = snapshot_member(member) or get_member_snapshot(member.guild, member.id)
+    if snapshot is None:
+        return "your server membership could not be checked"
+    missing = [role_id for role_id in requirements['roles'] if role_id not in snapshot.role_ids]
+    if missing:
+        return f"you need the <@&{missing[0]}> role"
+    if requirements['server_age'] and (snapshot.joined_at is None or snapshot.joined_at > now - requirements['server_age']):
+        return f"you must have been in the server for at least {_format_duration(requirements['server_age'])}"
+    return None
+
+async def filter_eligible_participants(guild, participants, requirements):
+    """Drop entrants who left or no longer meet the requirements, in one pass before the draw.
+
+    Entrants that are not cached and have no recently verified snapshot are looked up first, one
+    gateway query per 100, so the ones who left are dropped and the rest are checked like everyone else.
+    """
+    snapshots = member_snapshots[guild.id]
+    now = time.time()
+    unknown = [user_id for user_id in participants
+               if guild.get_member(user_id) is None and not snapshot_verified(snapshots.get(user_id), now)]
+    gone = set()
+    if unknown:
+        try:
+            resolved = await resolve_winners(guild, unknown)
+            gone = {user_id for user_id, member in resolved.items() if member is None}
+        except (discord.HTTPException, asyncio.TimeoutError) as e:
+            print(f"Failed to look up {len(unknown)} giveaway entrants: {e}")
+
+    requirements = requirements or {'roles': [], 'account_age': 0, 'server_age': 0}
+    required_roles = frozenset(requirements['roles'])
+    # Account age is encoded in the user id, so compare ids against the cutoff's snowflake
+    max_user_id = discord.utils.time_snowflake(datetime.fromtimestamp(now - requirements['account_age'], timezone.utc), high=True)
+    min_joined = now - requirements['server_age'] if requirements['server_age'] else None
+    # Without a role or server age requirement, entrants we couldn't look up still get the benefit of the doubt
+    needs_snapshot = bool(required_roles) or min_joined is not None
+
+    eligible = []
+    for user_id in participants:
+        if user_id in gone or user_id > max_user_id:
+            continue
+        member = guild.get_member(user_id)
+        snapshot = snapshot_member(member) if member is not None else snapshots.get(user_id)
+        if snapshot is None:
+            if not needs_snapshot:
+                eligible.append(user_id)
+            continue
+        if not required_roles <= snapshot.role_ids:
+            continue
+        if min_joined is not None and (snapshot.joined_at is None or snapshot.joined_at > min_joined):
+            continue
+        eligible.append(user_id)
+    return eligible
+
+# Giveaway indexes and retention
+import json
+
+GIVEAWAY_RETENTION = 500  # Completed giveaways kept in memory, older ones move to the database
+
+DB_SCHEMA += [
+    """CREATE TABLE IF NOT EXISTS giveaway_archive (
+        giveaway_id TEXT PRIMARY KEY,
+        channel_id INTEGER NOT NULL,
+        host TEXT NOT NULL,
+        completed_at TEXT NOT NULL,
+        data TEXT NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_giveaway_archive_channel ON giveaway_archive (channel_id, completed_at)",
+]
+
+# channel_id / host mention -> {giveaway_id: None}, dicts used as insertion ordered sets
+active_giveaways_by_channel = defaultdict(dict)
+active_giveaways_by_host = defaultdict(dict)
+completed_giveaways_by_channel = defaultdict(dict)
+completed_giveaways_by_host = defaultdict(dict)
+
+def _index_add(index, key, giveaway_id):
+    index[key][giveaway_id] = None
+
+def _index_remove(index, key, giveaway_id):
+    ids = index.get(key)
+    if ids is not None:
+        ids.pop(giveaway_id, None)
+        if not ids:
+            del index[key]
+
+def add_active_giveaway(giveaway_id, data):
+    active_giveaways[giveaway_id] = data
+    _index_add(active_giveaways_by_channel, data['channel_id'], giveaway_id)
+    _index_add(active_giveaways_by_host, data['host'], giveaway_id)
+
+def remove_active_giveaway(giveaway_id):
+    data = active_giveaways.pop(giveaway_id, None)
+    if data is not None:
+        _index_remove(active_giveaways_by_channel, data['channel_id'], giveaway_id)
+        _index_remove(active_giveaways_by_host, data['host'], giveaway_id)
+
+def _encode_giveaway(data):
+    return json.dumps(data, default=lambda value: value.isoformat())
+
+def _decode_giveaway(text):
+    data = json.loads(text)
+    for key in ('completed_at', 'last_reroll'):
+        if data.get(key):
+            data[key] = datetime.fromisoformat(data[key])
+    for draw in data.get('draws', ()):
+        draw['drawn_at'] = datetime.fromisoformat(draw['drawn_at'])
+    data['deliveries'] = {int(user_id): status for user_id, status in data.get('deliveries', {}).items()}
+    return data
+
+def store_completed_giveaway(giveaway_id, data):
+    """Keep a completed giveaway for /greroll and /glist, archiving the oldest past the retention limit"""
+    completed_giveaways.pop(giveaway_id, None)
+    completed_giveaways[giveaway_id] = data
+    _index_add(completed_giveaways_by_channel, data['channel_id'], giveaway_id)
+    _index_add(completed_giveaways_by_host, data['host'], giveaway_id)
+
+    while len(completed_giveaways) > GIVEAWAY_RETENTION:
+        old_id = next(iter(completed_giveaways))
+        old = completed_giveaways[old_id]
+        try:
+            with get_db() as db:
+                db.execute(
+                    "INSERT OR REPLACE INTO giveaway_archive (giveaway_id, channel_id, host, completed_at, data) VALUES (?, ?, ?, ?, ?)",
+                    (old_id, old['channel_id'], old['host'], old['completed_at'].isoformat(), _encode_giveaway(old))
+                )
+        except Exception as e:
+            print(f"Failed to archive giveaway {old_id}: {e}")
+            break  # Keep it in memory rather than lose it
+        del completed_giveaways[old_id]
+        _index_remove(completed_giveaways_by_channel, old['channel_id'], old_id)
+        _index_remove(completed_giveaways_by_host, old['host'], old_id)
+
+def get_completed_giveaway(giveaway_id):
+    """Get a completed giveaway from memory, or bring it back from the archive"""
+    data = completed_giveaways.get(giveaway_id)
+    if data is not None:
+        return data
+    try:
+        row = get_db().execute("SELECT data FROM giveaway_archive WHERE giveaway_id = ?", (giveaway_id,)).fetchone()
+    except Exception as e:
+        print(f"Failed to load archived giveaway {giveaway_id}: {e}")
+        return None
+    if row is None:
+        return None
+    data = _decode_giveaway(row['data'])
+    store_completed_giveaway(giveaway_id, data)
+    return data
+
+def recent_completed_giveaways(channel_id, limit):
+    """Most recently completed giveaways of a channel as (giveaway_id, data), newest first"""
+    recent = [(gid, completed_giveaways[gid]) for gid in reversed(completed_giveaways_by_channel.get(channel_id, {}))]
+    recent.sort(key=lambda item: item[1]['completed_at'], reverse=True)  # Rerolls may reload older ones
+    recent = recent[:limit]
+    if len(recent) < limit:
+        seen = {gid for gid, _ in recent}
+        try:
+            rows = get_db().execute(
+                "SELECT giveaway_id, data FROM giveaway_archive WHERE channel_id = ? ORDER BY completed_at DESC LIMIT ?",
+                (channel_id, limit + len(seen))
+            ).fetchall()
+        except Exception as e:
+            print(f"Failed to load archived giveaways: {e}")
+            rows = []
+        recent += [(row['giveaway_id'], _decode_giveaway(row['data'])) for row in rows if row['giveaway_id'] not in seen]
+        recent = recent[:limit]
+    return recent
+
+@end_giveaway_slash.autocomplete('giveaway')
+async def end_giveaway_autocomplete(interaction: discord.Interaction, current: str):
+    """Offer this channel's active giveaways, only the user's own unless they are staff"""
+    giveaway_ids = active_giveaways_by_channel.get(interaction.channel.id, {})
+    if not interaction.user.guild_permissions.manage_messages:
+        hosted = active_giveaways_by_host.get(interaction.user.mention, {})
+        giveaway_ids = [gid for gid in giveaway_ids if gid in hosted]
+
+    current = current.lower()
+    choices = []
+    for giveaway_id in reversed(list(giveaway_ids)):
+        data = active_giveaways[giveaway_id]
+        name = f"{data['prize'][:70]} - ends {data['end_time']:%b %d %H:%M} UTC"
+        if current in name.lower() or current in giveaway_id:
+            choices.append(discord.app_commands.Choice(name=name, value=giveaway_id))
+            if len(choices) == 25:
+                break
+    return choices
+
+# Giveaway winner notifications
+WINNER_DM_CONCURRENCY = 5  # Winner DMs in flight per giveaway
+WINNER_DM_ATTEMPTS = 3
+WINNER_DM_BACKOFF = 2.0    # Seconds before the first retry, doubled after each failure
+WINNER_FETCH_CONCURRENCY = 5  # Member fetches in flight when the gateway query for winners fails
+
+DELIVERY_LABELS = {
+    'pending': "⏳ Sending",
+    'sent': "✅ Sent",
+    'dm_closed': "🔒 DMs closed",
+    'left': "🚪 Left the server",
+    'failed': "❌ Failed"
+}
+
+async def _fetch_member_or_none(guild, user_id):
+    try:
+        return await guild.fetch_member(user_id)
+    except discord.NotFound:
+        return None
+
+async def resolve_winners(guild, user_ids):
+    """Resolve winner ids to members: cache first, then one gateway query per 100 misses.
+
+    Returns {user_id: member}, with None for winners who are no longer in the guild.
+    """
+    members = {user_id: guild.get_member(user_id) for user_id in user_ids}
+    missing = [user_id for user_id, member in members.items() if member is None]
+    semaphore = asyncio.Semaphore(WINNER_FETCH_CONCURRENCY)
+
+    async def fetch(user_id):
+        async with semaphore:
+            return await _fetch_member_or_none(guild, user_id)
+
+    for start in range(0, len(missing), 100):
+        chunk = missing[start:start + 100]
+        try:
+            found = await guild.query_members(user_ids=chunk, limit=len(chunk), cache=False)
+        except Exception as e:
+            print(f"Member query failed, fetching winners one by one: {e}")
+            found = await asyncio.gather(*(fetch(user_id) for user_id in chunk))
+        for member in found:
+            if member is not None:
+                members[member.id] = member
+                snapshot_member(member)
+    for user_id, member in members.items():
+        if member is None:
+            forget_member(guild.id, user_id)
+    return members
+
+def format_winner_mentions(members):
+    return [member.mention if member else f"<@{user_id}> (left the server)" for user_id, member in members.items()]
+
+async def _send_winner_dm(member, embed):
+    """DM one winner, retrying server errors and rate limits with backoff"""
+    for attempt in range(WINNER_DM_ATTEMPTS):
+        try:
+            await schedule_rest(PRIORITY_DM, f"dm:{member.id}", lambda: member.send(embed=embed))
+            return 'sent'
+        except discord.Forbidden:
+            return 'dm_closed'
+        except (discord.HTTPException, asyncio.TimeoutError) as e:
+            retryable = not isinstance(e, discord.HTTPException) or e.status >= 500 or e.status == 429
+            if not retryable or attempt + 1 == WINNER_DM_ATTEMPTS:
+                print(f"Failed to DM giveaway winner {member.id}: {e}")
+                return 'failed'
+            await asyncio.sleep(WINNER_DM_BACKOFF * 2 ** attempt)
+
+async def _notify_giveaway_winners(guild, giveaway_id, members, reroll):
+    data = get_completed_giveaway(giveaway_id)
+    if data is None:
+        return
+    deliveries = data.setdefault('deliveries', {})
+
+    embed = discord.Embed(
+        title="🎉 You Won a Giveaway!",
+        description=f"Congratulations! You won **{data['prize']}** in **{guild.name}**"
+                    f"{' (reroll)' if reroll else ''}.\n\nContact the host {data['host']} to claim your prize.",
+        color=discord.Color.gold()
+    )
+    embed.add_field(name="Giveaway ID", value=f"`{giveaway_id}`", inline=True)
+    embed.set_footer(text=guild.name)
+
+    semaphore = asyncio.Semaphore(WINNER_DM_CONCURRENCY)
+
+    async def deliver(user_id, member):
+        if member is None:
+            deliveries[user_id] = 'left'
+            return
+        deliveries[user_id] = 'pending'
+        async with semaphore:
+            deliveries[user_id] = await _send_winner_dm(member, embed)
+
+    await asyncio.gather(*(deliver(user_id, member) for user_id, member in members.items()))
+
+    await send_log(
+        guild,
+        "Giveaway Winners Notified",
+        f"Winner DMs for `{giveaway_id}`",
+        color=discord.Color.gold(),
+        additional_fields=[
+            {"name": "Prize", "value": data['prize'], "inline": True},
+            {"name": "Delivery", "value": "\n".join(
+                f"<@{user_id}>: {DELIVERY_LABELS[deliveries[user_id]]}" for user_id in members
+            )[:1024] or "No winners", "inline": False}
+        ]
+    )
+
+def notify_giveaway_winners(guild, giveaway_id, members, reroll=False):
+    """DM the winners in the background, recording each delivery on the completed giveaway"""
+    task = asyncio.create_task(_notify_giveaway_winners(guild, giveaway_id, members, reroll))
+    task.add_done_callback(_report_failure(f"Error notifying winners of giveaway {giveaway_id}"))
+    return task
+
+# Scheduled and recurring giveaways
+import bisect
+
+class CronSchedule:
+    """Five-field cron spec (minute hour day month weekday, in UTC).
+
+    Each field is expanded once into a sorted list of allowed values, so finding
+    the next fire time walks days and bisects into the hour/minute lists.
+    """
+    ALIASES = {'@hourly': '0 * * * *', '@daily': '0 0 * * *', '@weekly': '0 0 * * 0', '@monthly': '0 0 1 * *'}
+    NAMES = {name: i for i, name in enumerate(['sun', 'mon', 'tue', 'wed', 'thu', 'fri', 'sat'])}
+    NAMES.update({name: i + 1 for i, name in enumerate(['jan', 'feb', 'mar', 'apr', 'may', 'jun',
+                                                        'jul', 'aug', 'sep', 'oct', 'nov', 'dec'])})
+
+    def __init__(self, spec):
+        self.spec = spec.strip().lower()
+        fields = self.ALIASES.get(self.spec, self.spec).split()
+        if len(fields) != 5:
+            raise ValueError("Expected 5 fields: minute hour day month weekday")
+        self.minutes = self._expand(fields[0], 0, 59)
+        self.hours = self._expand(fields[1], 0, 23)
+        self.days = set(self._expand(fields[2], 1, 31))
+        self.months = set(self._expand(fields[3], 1, 12))
+        self.weekdays = {day % 7 for day in self._expand(fields[4], 0, 7)}  # 0 and 7 are Sunday
+        self.any_day = fields[2] == '*'
+        self.any_weekday = fields[4] == '*'
+        self.next_after(time.time())  # Rejects specs that never fire, like Feb 30
+
+    @classmethod
+    def _expand(cls, field, low, high):
+        values = set()
+        for part in field.split(','):
+            part, _, step = part.partition('/')
+            if part == '*':
+                start, end = low, high
+            else:
+                start, _, end = part.partition('-')
+                start = cls.NAMES.get(start, start)
+                end = cls.NAMES.get(end, end) if end else (high if step else start)
+                start, end = int(start), int(end)
+            if not low <= start <= end <= high:
+                raise ValueError(f"'{field}' is outside {low}-{high}")
+            values.update(range(start, end + 1, int(step) if step else 1))
+        return sorted(values)
+
+    def _day_matches(self, day):
+        if day.month not in self.months:
+            return False
+        in_month = day.day in self.days
+        in_week = (day.weekday() + 1) % 7 in self.weekdays
+        if self.any_day and self.any_weekday:
+            return True
+        if self.any_day:
+            return in_week
+        if self.any_weekday:
+            return in_month
+        return in_month or in_week  # Both restricted: either matches, like cron
+
+    def next_after(self, timestamp):
+        """First fire time strictly after the timestamp"""
+        start = datetime.fromtimestamp(timestamp, timezone.utc).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        day = start.date()
+        for _ in range(366 * 5):
+            if self._day_matches(day):
+                first_day = day == start.date()
+                for hour in self.hours[bisect.bisect_left(self.hours, start.hour) if first_day else 0:]:
+                    from_minute = start.minute if first_day and hour == start.hour else 0
+                    index = bisect.bisect_left(self.minutes, from_minute)
+                    if index < len(self.minutes):
+                        return datetime(day.year, day.month, day.day, hour, self.minutes[index], tzinfo=timezone.utc).timestamp()
+            day += timedelta(days=1)
+        raise ValueError("Schedule never fires")
+
+DB_SCHEMA += [
+    """CREATE TABLE IF NOT EXISTS giveaway_schedules (
+        schedule_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        guild_id INTEGER NOT NULL,
+        channel_id INTEGER NOT NULL,
+        host_id INTEGER NOT NULL,
+        prize TEXT NOT NULL,
+        duration TEXT NOT NULL,
+        winners INTEGER NOT NULL,
+        cron TEXT,
+        next_run REAL,
+        active INTEGER NOT NULL DEFAULT 1,
+        requirements TEXT
+    )""",
+    # One row per fire time, the primary key stops a run from being claimed twice
+    """CREATE TABLE IF NOT EXISTS giveaway_schedule_runs (
+        schedule_id INTEGER NOT NULL,
+        run_at REAL NOT NULL,
+        giveaway_id TEXT NOT NULL,
+        message_id INTEGER,
+        PRIMARY KEY (schedule_id, run_at)
+    )""",
+]
+
+def _migrate_giveaway_schedule_requirements(db):
+    """Schedules saved before entry requirements existed have no requirements column"""
+    if 'requirements' not in _table_columns(db, 'giveaway_schedules'):
+        db.execute("ALTER TABLE giveaway_schedules ADD COLUMN requirements TEXT")
+
+DB_MIGRATIONS.append(_migrate_giveaway_schedule_requirements)
+
+giveaway_schedules = {}  # schedule_id -> schedule row (dict) of active schedules
+giveaway_cron = {}       # schedule_id -> CronSchedule, parsed once
+giveaway_schedule_heap = []  # (next_run, schedule_id), stale entries are skipped
+giveaway_scheduler_wakeup = asyncio.Event()
+giveaway_scheduler_task = None
+
+def _queue_schedule(schedule):
+    giveaway_schedules[schedule['schedule_id']] = schedule
+    if schedule['cron']:
+        giveaway_cron[schedule['schedule_id']] = CronSchedule(schedule['cron'])
+    heapq.heappush(giveaway_schedule_heap, (schedule['next_run'], schedule['schedule_id']))
+    giveaway_scheduler_wakeup.set()
+
+def add_giveaway_schedule(guild_id, channel_id, host_id, prize, duration, winners, cron=None, start_at=None, requirements=None):
+    """Save a new schedule and queue its first run. Give a cron spec, a start time, or both"""
+    cron_schedule = CronSchedule(cron) if cron else None
+    next_run = start_at or cron_schedule.next_after(time.time())
+    requirements = json.dumps(requirements) if requirements else None  # Stored as in the table
+    with get_db() as db:
+        cursor = db.execute(
+            "INSERT INTO giveaway_schedules (guild_id, channel_id, host_id, prize, duration, winners, cron, next_run, requirements) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (guild_id, channel_id, host_id, prize, duration, winners, cron_schedule.spec if cron_schedule else None, next_run, requirements)
+        )
+    schedule = {
+        'schedule_id': cursor.lastrowid, 'guild_id': guild_id, 'channel_id': channel_id, 'host_id': host_id,
+        'prize': prize, 'duration': duration, 'winners': winners,
+        'cron': cron_schedule.spec if cron_schedule else None, 'next_run': next_run, 'requirements': requirements
+    }
+    _queue_schedule(schedule)
+    return schedule
+
+def remove_giveaway_schedule(schedule_id):
+    with get_db() as db:
+        db.execute("UPDATE giveaway_schedules SET active = 0 WHERE schedule_id = ?", (schedule_id,))
+    giveaway_schedules.pop(schedule_id, None)
+    giveaway_cron.pop(schedule_id, None)
+
+def _claim_giveaway_run(schedule, run_at):
+    """Record the run and move the schedule to its next fire time in one transaction.
+
+    Returns the giveaway id, or None if this run was already claimed.
+    """
+    schedule_id = schedule['schedule_id']
+    cron = giveaway_cron.get(schedule_id)
+    # Runs missed while offline fire once, late, instead of once per missed slot
+    next_run = cron.next_after(max(run_at, time.time())) if cron else None
+    giveaway_id = f"{schedule['guild_id']}_s{schedule_id}_{int(run_at)}"
+    try:
+        with get_db() as db:
+            db.execute(
+                "INSERT INTO giveaway_schedule_runs (schedule_id, run_at, giveaway_id) VALUES (?, ?, ?)",
+                (schedule_id, run_at, giveaway_id)
+            )
+            db.execute(
+                "UPDATE giveaway_schedules SET next_run = ?, active = ? WHERE schedule_id = ?",
+                (next_run, int(next_run is not None), schedule_id)
+            )
+    except sqlite3.IntegrityError:
+        return None
+    schedule['next_run'] = next_run
+    return giveaway_id
+
+async def _run_giveaway(schedule, giveaway_id):
+    """Post the giveaway for a claimed run and remember its message"""
+    channel = bot.get_channel(schedule['channel_id'])
+    if channel is None:
+        print(f"Giveaway schedule {schedule['schedule_id']}: channel {schedule['channel_id']} not found")
+        return
+    guild = channel.guild
+    host = guild.get_member(schedule['host_id']) or await _fetch_member_or_none(guild, schedule['host_id']) or guild.me
+    duration_seconds = parse_duration(schedule['duration'])
+    message = await start_giveaway(
+        guild, channel, host, giveaway_id, schedule['prize'], schedule['duration'], duration_seconds, schedule['winners'],
+        requirements=json.loads(schedule['requirements']) if schedule.get('requirements') else None,
+        footer=f"Click the button below to enter! • Scheduled giveaway {giveaway_id}"
+    )
+    if message is not None:
+        with get_db() as db:
+            db.execute("UPDATE giveaway_schedule_runs SET message_id = ? WHERE giveaway_id = ?", (message.id, giveaway_id))
+
+async def _recover_giveaway_runs():
+    """Finish runs that were claimed but not confirmed posted before a restart"""
+    rows = get_db().execute(
+        """SELECT r.giveaway_id, s.* FROM giveaway_schedule_runs r
+           JOIN giveaway_schedules s ON s.schedule_id = r.schedule_id
+           WHERE r.message_id IS NULL"""
+    ).fetchall()
+    for row in rows:
+        schedule = dict(row)
+        giveaway_id = schedule.pop('giveaway_id')
+        channel = bot.get_channel(schedule['channel_id'])
+        if channel is None:
+            continue
+        # The message may have gone out just before the restart, its footer names the run
+        posted = None
+        async for message in channel.history(limit=50):
+            if message.author.id == bot.user.id and any(
+                embed.footer.text and giveaway_id in embed.footer.text for embed in message.embeds
+            ):
+                posted = message
+                break
+        if posted is not None:
+            with get_db() as db:
+                db.execute("UPDATE giveaway_schedule_runs SET message_id = ? WHERE giveaway_id = ?", (posted.id, giveaway_id))
+        else:
+            await _run_giveaway(schedule, giveaway_id)
+
+async def giveaway_scheduler():
+    """Sleep until the next scheduled giveaway is due, then start it"""
+    try:
+        await _recover_giveaway_runs()
+    except Exception as e:
+        print(f"Failed to recover scheduled giveaways: {e}")
+
+    while True:
+        giveaway_scheduler_wakeup.clear()
+        timeout = max(0, giveaway_schedule_heap[0][0] - time.time()) if giveaway_schedule_heap else None
+        try:
+            await asyncio.wait_for(giveaway_scheduler_wakeup.wait(), timeout)
+            continue  # Schedules changed, recompute the deadline
+        except asyncio.TimeoutError:
+            pass
+
+        now = time.time()
+        while giveaway_schedule_heap and giveaway_schedule_heap[0][0] <= now:
+            run_at, schedule_id = heapq.heappop(giveaway_schedule_heap)
+            schedule = giveaway_schedules.get(schedule_id)
+            if schedule is None or schedule['next_run'] != run_at:
+                continue  # Removed or rescheduled
+            try:
+                giveaway_id = _claim_giveaway_run(schedule, run_at)
+                if schedule['next_run'] is not None:
+                    heapq.heappush(giveaway_schedule_heap, (schedule['next_run'], schedule_id))
+                else:
+                    giveaway_schedules.pop(schedule_id, None)  # One-off schedule is done
+                if giveaway_id:
+                    await _run_giveaway(schedule, giveaway_id)
+            except Exception as e:
+                print(f"Giveaway schedule {schedule_id} error: {e}")
+
+def start_giveaway_scheduler():
+    """Load active schedules and start the scheduler (only once)"""
+    global giveaway_scheduler_task
+    if giveaway_scheduler_task and not giveaway_scheduler_task.done():
+        return
+
+    try:
+        rows = get_db().execute("SELECT * FROM giveaway_schedules WHERE active = 1 AND next_run IS NOT NULL").fetchall()
+    except Exception as e:
+        print(f"Failed to load giveaway schedules: {e}")
+        rows = []
+    for row in rows:
+        if row['schedule_id'] in giveaway_schedules:
+            continue
+        try:
+            _queue_schedule(dict(row))
+        except ValueError as e:
+            print(f"Skipping giveaway schedule {row['schedule_id']}: {e}")
+
+    giveaway_scheduler_task = asyncio.create_task(giveaway_scheduler())
+
+def _parse_start_at(text):
+    """Parse 'YYYY-MM-DD HH:MM' (UTC) into a timestamp"""
+    return datetime.strptime(text.strip(), "%Y-%m-%d %H:%M").replace(tzinfo=timezone.utc).timestamp()
+
+@bot.tree.command(name='gschedule', description='Schedule a one-off or recurring giveaway (Staff only)')
+async def schedule_giveaway_slash(interaction: discord.Interaction, prize: str, duration: str, winners: int = 1,
+                                  cron: str = None, start_at: str = None, required_role: discord.Role = None,
+                                  min_account_age: str = None, min_server_age: str = None):
+    """Schedule a giveaway in this channel: cron like '0 18 * * fri' and/or start_at 'YYYY-MM-DD HH:MM' (UTC)"""
+    if not interaction.user.guild_permissions.manage_messages:
+        await interaction.response.send_message("❌ You don't have permission to schedule giveaways!", ephemeral=True)
+        return
+
+    _, error = validate_giveaway_options(prize, duration, winners)
+    if error:
+        await interaction.response.send_message(error, ephemeral=True)
+        return
+    requirements, error = parse_giveaway_requirements(required_role, min_account_age, min_server_age)
+    if error:
+        await interaction.response.send_message(error, ephemeral=True)
+        return
+    if not cron and not start_at:
+        await interaction.response.send_message("❌ Give a cron schedule (like `0 18 * * fri`), a start time, or both!", ephemeral=True)
+        return
+
+    try:
+        first_run = _parse_start_at(start_at) if start_at else None
+    except ValueError:
+        await interaction.response.send_message("❌ Invalid start time! Use format like: 2025-12-24 18:00 (UTC)", ephemeral=True)
+        return
+    if first_run is not None and first_run <= time.time():
+        await interaction.response.send_message("❌ The start time must be in the future!", ephemeral=True)
+        return
+
+    try:
+        schedule = add_giveaway_schedule(interaction.guild.id, interaction.channel.id, interaction.user.id,
+                                         prize, duration, winners, cron=cron, start_at=first_run, requirements=requirements)
+    except ValueError as e:
+        await interaction.response.send_message(f"❌ Invalid cron schedule: {e}", ephemeral=True)
+        return
+
+    embed = discord.Embed(
+        title="📅 Giveaway Scheduled",
+        description=f"**Prize:** {prize}\n**Duration:** {duration}\n**Winners:** {winners}",
+        color=discord.Color.gold()
+    )
+    embed.add_field(name="Schedule", value=f"`{schedule['cron']}` (UTC)" if schedule['cron'] else "Once", inline=True)
+    embed.add_field(name="Next Run", value=f"<t:{int(schedule['next_run'])}:F>", inline=True)
+    embed.add_field(name="Schedule ID", value=str(schedule['schedule_id']), inline=True)
+    requirement_text = format_giveaway_requirements(requirements)
+    if requirement_text:
+        embed.add_field(name="Requirements", value=requirement_text, inline=False)
+    await interaction.response.send_message(embed=embed)
+
+@bot.tree.command(name='gschedules', description='List scheduled giveaways in this server (Staff only)')
+async def list_giveaway_schedules_slash(interaction: discord.Interaction):
+    """List active giveaway schedules, soonest first"""
+    if not interaction.user.guild_permissions.manage_messages:
+        await interaction.response.send_message("❌ You don't have permission to view scheduled giveaways!", ephemeral=True)
+        return
+
+    schedules = sorted(
+        (schedule for schedule in giveaway_schedules.values() if schedule['guild_id'] == interaction.guild.id),
+        key=lambda schedule: schedule['next_run']
+    )
+    if not schedules:
+        await interaction.response.send_message("❌ No scheduled giveaways in this server!", ephemeral=True)
+        return
+
+    embed = discord.Embed(title="📅 Scheduled Giveaways", color=discord.Color.gold())
+    for schedule in schedules[:25]:
+        embed.add_field(
+            name=f"#{schedule['schedule_id']} {schedule['prize'][:50]}",
+            value=f"**Channel:** <#{schedule['channel_id']}>\n**Schedule:** {'`' + schedule['cron'] + '`' if schedule['cron'] else 'Once'}\n"
+                  f"**Next:** <t:{int(schedule['next_run'])}:R>",
+            inline=False
+        )
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+@bot.tree.command(name='gunschedule', description='Cancel a scheduled giveaway (Staff only)')
+async def unschedule_giveaway_slash(interaction: discord.Interaction, schedule_id: int):
+    """Stop a giveaway schedule, giveaways it already started keep running"""
+    if not interaction.user.guild_permissions.manage_messages:
+        await interaction.response.send_message("❌ You don't have permission to cancel scheduled giveaways!", ephemeral=True)
+        return
+
+    schedule = giveaway_schedules.get(schedule_id)
+    if schedule is None or schedule['guild_id'] != interaction.guild.id:
+        await interaction.response.send_message("❌ Scheduled giveaway not found!", ephemeral=True)
+        return
+
+    remove_giveaway_schedule(schedule_id)
+    await interaction.response.send_message(f"✅ Cancelled scheduled giveaway #{schedule_id} ({schedule['prize']}).", ephemeral=True)
+
+# Role engine
+ROLE_BATCH_CONCURRENCY = 8   # Role edits in flight per batch, halved whenever we get rate limited
+ROLE_PROGRESS_INTERVAL = 5.0  # Seconds between progress message updates
+
+DB_SCHEMA += [
+    """CREATE TABLE IF NOT EXISTS role_settings (
+        guild_id INTEGER NOT NULL,
+        role_id INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        PRIMARY KEY (guild_id, role_id, kind)
+    )""",
+    """CREATE TABLE IF NOT EXISTS sticky_role_members (
+        guild_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        role_ids TEXT NOT NULL,
+        saved_at REAL NOT NULL,
+        PRIMARY KEY (guild_id, user_id)
+    )""",
+    """CREATE TABLE IF NOT EXISTS reaction_roles (
+        message_id INTEGER NOT NULL,
+        emoji TEXT NOT NULL,
+        guild_id INTEGER NOT NULL,
+        role_id INTEGER NOT NULL,
+        PRIMARY KEY (message_id, emoji)
+    )""",
+]
+
+role_settings = {}    # guild_id -> {'auto': set of role ids, 'sticky': set of role ids}
+reaction_roles = None  # message_id -> {emoji: role_id}, loaded on first use
+role_batch_jobs = {}  # guild_id -> running RoleBatchJob
+
+def get_role_settings(guild_id):
+    """Auto and sticky roles of a guild, loaded from the database once"""
+    settings = role_settings.get(guild_id)
+    if settings is None:
+        settings = role_settings[guild_id] = {'auto': set(), 'sticky': set()}
+        try:
+            for row in get_db().execute("SELECT role_id, kind FROM role_settings WHERE guild_id = ?", (guild_id,)):
+                settings[row['kind']].add(row['role_id'])
+        except Exception as e:
+            print(f"Failed to load role settings: {e}")
+    return settings
+
+def set_role_setting(guild_id, role_id, kind, enabled):
+    with get_db() as db:
+        if enabled:
+            db.execute("INSERT OR IGNORE INTO role_settings (guild_id, role_id, kind) VALUES (?, ?, ?)", (guild_id, role_id, kind))
+        else:
+            db.execute("DELETE FROM role_settings WHERE guild_id = ? AND role_id = ? AND kind = ?", (guild_id, role_id, kind))
+    (get_role_settings(guild_id)[kind].add if enabled else get_role_settings(guild_id)[kind].discard)(role_id)
+
+def assignable_role(guild, role):
+    """Why the bot can't hand out a role, or None if it can"""
+    if role.is_default() or role.managed:
+        return "that role is managed by Discord or an integration"
+    if role >= guild.me.top_role:
+        return "that role is above my highest role"
+    return None
+
+async def save_sticky_roles(payload):
+    """Remember sticky roles of a member who left, from the member cache or else the member snapshot"""
+    sticky = get_role_settings(payload.guild_id)['sticky']
+    if not sticky:
+        return
+    user = payload.user
+    if hasattr(user, 'roles'):
+        member_role_ids = {role.id for role in user.roles}
+    else:
+        snapshot = member_snapshots[payload.guild_id].get(user.id)
+        member_role_ids = snapshot.role_ids if snapshot is not None else ()
+    role_ids = [role_id for role_id in member_role_ids if role_id in sticky]
+    if not role_ids:
+        return
+    try:
+        with get_db() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO sticky_role_members (guild_id, user_id, role_ids, saved_at) VALUES (?, ?, ?, ?)",
+                (payload.guild_id, user.id, ",".join(map(str, role_ids)), time.time())
+            )
+    except Exception as e:
+        print(f"Failed to save sticky roles for {user.id}: {e}")
+
+@bot.listen('on_member_join')
+async def apply_join_roles(member):
+    """Give auto roles and restore sticky roles in a single member edit"""
+    guild = member.guild
+    role_ids = set(get_role_settings(guild.id)['auto'])
+    try:
+        with get_db() as db:
+            row = db.execute("SELECT role_ids FROM sticky_role_members WHERE guild_id = ? AND user_id = ?", (guild.id, member.id)).fetchone()
+            if row:
+                db.execute("DELETE FROM sticky_role_members WHERE guild_id = ? AND user_id = ?", (guild.id, member.id))
+                role_ids.update(int(role_id) for role_id in row['role_ids'].split(','))
+    except Exception as e:
+        print(f"Failed to load sticky roles for {member.id}: {e}")
+
+    roles = [role for role in map(guild.get_role, role_ids) if role is not None and assignable_role(guild, role) is None]
+    if not roles:
+        return
+    future = schedule_rest(PRIORITY_PANEL, f"member:{guild.id}:{member.id}",
+                           lambda: member.add_roles(*roles, reason="Auto and sticky roles", atomic=False))
+    future.add_done_callback(_report_failure(f"Failed to give join roles to {member.id}"))
+
+# Self roles: one button per role, the role id lives in the custom id so panels
+# keep working after a restart without registering a view per message
+class SelfRoleButton(discord.ui.DynamicItem[discord.ui.Button], template=r'selfrole:(?P<role_id>[0-9]+)'):
+    def __init__(self, role_id, label=None):
+        super().__init__(discord.ui.Button(label=label or "Role", style=discord.ButtonStyle.blurple, custom_id=f"selfrole:{role_id}"))
+        self.role_id = role_id
+
+    @classmethod
+    async def from_custom_id(cls, interaction, item, match):
+        return cls(int(match['role_id']), item.label)
+
+    @auto_defer('self_role', ephemeral=True)
+    async def callback(self, interaction):
+        role = interaction.guild.get_role(self.role_id)
+        if role is None:
+            await respond(interaction, "❌ This role no longer exists!", ephemeral=True)
+            return
+        member = interaction.user
+        try:
+            if role in member.roles:
+                await member.remove_roles(role, reason="Self role")
+                await respond(interaction, f"✅ Removed {role.mention}.", ephemeral=True)
+            else:
+                await member.add_roles(role, reason="Self role")
+                await respond(interaction, f"✅ You now have {role.mention}.", ephemeral=True)
+        except discord.HTTPException as e:
+            await respond(interaction, f"❌ Failed to update your roles: {e}", ephemeral=True)
+
+bot.add_dynamic_items(SelfRoleButton)
+
+def _load_reaction_roles():
+    global reaction_roles
+    if reaction_roles is None:
+        reaction_roles = defaultdict(dict)
+        try:
+            for row in get_db().execute("SELECT message_id, emoji, role_id FROM reaction_roles"):
+                reaction_roles[row['message_id']][row['emoji']] = row['role_id']
+        except Exception as e:
+            print(f"Failed to load reaction roles: {e}")
+    return reaction_roles
+
+async def _toggle_reaction_role(payload, add):
+    role_id = _load_reaction_roles().get(payload.message_id, {}).get(str(payload.emoji))
+    if role_id is None or payload.guild_id is None:
+        return
+    guild = bot.get_guild(payload.guild_id)
+    role = guild.get_role(role_id) if guild else None
+    if role is None or payload.user_id == bot.user.id:
+        return
+    member = payload.member or guild.get_member(payload.user_id) or await _fetch_member_or_none(guild, payload.user_id)
+    if member is None:
+        return
+    edit = (lambda: member.add_roles(role, reason="Reaction role")) if add else (lambda: member.remove_roles(role, reason="Reaction role"))
+    future = schedule_rest(PRIORITY_PANEL, f"member:{guild.id}:{member.id}", edit)
+    future.add_done_callback(_report_failure(f"Failed to update reaction role for {member.id}"))
+
+@bot.listen('on_raw_reaction_add')
+async def reaction_role_add(payload):
+    await _toggle_reaction_role(payload, True)
+
+@bot.listen('on_raw_reaction_remove')
+async def reaction_role_remove(payload):
+    await _toggle_reaction_role(payload, False)
+
+class RoleBatchJob:
+    """Add or remove one role for many members.
+
+    Edits go through the outbound scheduler at bulk priority, one bucket per member.
+    The number of edits in flight grows by one after every 50 successes and is halved
+    whenever discord.py reports a rate limit sleep.
+    """
+    def __init__(self, guild, role, members, add=True, reason=None):
+        self.guild = guild
+        self.role = role
+        self.members = members
+        self.add = add
+        self.reason = reason or ("Role added to members in bulk" if add else "Role removed from members in bulk")
+        self.total = len(members)
+        self.done = 0
+        self.failed = 0
+        self.concurrency = 2
+        self.started = time.monotonic()
+        self.finished = None
+        self.cancelled = False
+
+    def _edit(self, member):
+        edit = member.add_roles if self.add else member.remove_roles
+        return schedule_rest(PRIORITY_BULK, f"member:{self.guild.id}:{member.id}", lambda: edit(self.role, reason=self.reason))
+
+    @property
+    def rate(self):
+        elapsed = (self.finished or time.monotonic()) - self.started
+        return (self.done + self.failed) / elapsed if elapsed else 0.0
+
+    @property
+    def eta(self):
+        remaining = self.total - self.done - self.failed
+        return remaining / self.rate if self.rate else None
+
+    async def run(self, on_progress=None):
+        pending = set()
+        members = iter(self.members)
+        rate_limits_seen = rate_limit_stats['sleeps']
+        since_increase = 0
+        last_progress = time.monotonic()
+
+        while not self.cancelled:
+            while len(pending) < self.concurrency:
+                member = next(members, None)
+                if member is None:
+                    break
+                pending.add(self._edit(member))
+            if not pending:
+                break
+
+            finished, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in finished:
+                if future.exception() is None:
+                    self.done += 1
+                    since_increase += 1
+                else:
+                    self.failed += 1
+
+            # Back off on rate limits, otherwise slowly open up
+            if rate_limit_stats['sleeps'] > rate_limits_seen:
+                rate_limits_seen = rate_limit_stats['sleeps']
+                self.concurrency = max(1, self.concurrency // 2)
+                since_increase = 0
+            elif since_increase >= 50 and self.concurrency < ROLE_BATCH_CONCURRENCY:
+                self.concurrency += 1
+                since_increase = 0
+
+            if on_progress and time.monotonic() - last_progress >= ROLE_PROGRESS_INTERVAL:
+                last_progress = time.monotonic()
+                on_progress(self)
+
+        if pending:
+            await asyncio.wait(pending)
+        self.finished = time.monotonic()
+        if on_progress:
+            on_progress(self)
+
+def build_role_job_embed(job):
+    verb = "Adding" if job.add else "Removing"
+    if job.finished:
+        title = "✅ Role Update Finished" if not job.cancelled else "⏹️ Role Update Cancelled"
+    else:
+        title = "🛠️ Role Update Running"
+    embed = discord.Embed(
+        title=title,
+        description=f"{verb} {job.role.mention} {'to' if job.add else 'from'} {job.total} members",
+        color=discord.Color.green() if job.finished else discord.Color.blue()
+    )
+    embed.add_field(name="Progress", value=f"{job.done + job.failed}/{job.total} ({(job.done + job.failed) / max(1, job.total):.0%})", inline=True)
+    embed.add_field(name="Failed", value=str(job.failed), inline=True)
+    embed.add_field(name="Rate", value=f"{job.rate:.1f}/s", inline=True)
+    if not job.finished and job.eta is not None:
+        embed.add_field(name="ETA", value=f"<t:{int(time.time() + job.eta)}:R>", inline=True)
+    return embed
+
+async def _role_targets(guild, role, add):
+    """Members the role still needs to be added to or removed from"""
+    if guild.chunked:
+        members = guild.members
+    else:
+        members = [member async for member in guild.fetch_members(limit=None)]
+    if add:
+        return [member for member in members if not member.bot and role not in member.roles]
+    return [member for member in members if role in member.roles]
+
+@bot.tree.command(name='roleall', description='Add or remove a role for every member (Admin only)')
+@discord.app_commands.choices(action=[
+    discord.app_commands.Choice(name='Add', value='add'),
+    discord.app_commands.Choice(name='Remove', value='remove'),
+    discord.app_commands.Choice(name='Cancel running update', value='cancel'),
+])
+@auto_defer('roleall')
+async def role_all_slash(interaction: discord.Interaction, action: discord.app_commands.Choice[str], role: discord.Role = None):
+    """Run a bulk role update with a progress message"""
+    if not interaction.user.guild_permissions.administrator:
+        await respond(interaction, "❌ You need administrator permissions to use this command!", ephemeral=True)
+        return
+
+    guild = interaction.guild
+    running = role_batch_jobs.get(guild.id)
+    if action.value == 'cancel':
+        if running is None:
+            await respond(interaction, "❌ No role update is running!", ephemeral=True)
+            return
+        running.cancelled = True
+        await respond(interaction, "✅ The role update will stop after the edits in flight.", ephemeral=True)
+        return
+    if running is not None:
+        await respond(interaction, "❌ A role update is already running in this server!", ephemeral=True)
+        return
+    if role is None:
+        await respond(interaction, "❌ Pick a role!", ephemeral=True)
+        return
+    problem = assignable_role(guild, role)
+    if problem:
+        await respond(interaction, f"❌ I can't manage {role.mention}: {problem}.", ephemeral=True)
+        return
+
+    members = await _role_targets(guild, role, action.value == 'add')
+    job = role_batch_jobs[guild.id] = RoleBatchJob(guild, role, members, add=action.value == 'add',
+                                                   reason=f"Bulk role update by {interaction.user}")
+    message = await respond(interaction, embed=build_role_job_embed(job), wait=True)
+
+    def report(job):
+        if message is not None:
+            future = schedule_rest(PRIORITY_PANEL, f"channel:{message.channel.id}",
+                                   lambda: message.edit(embed=build_role_job_embed(job)), key=f"edit:{message.id}")
+            future.add_done_callback(_report_failure("Failed to update role progress"))
+
+    async def run():
+        try:
+            await job.run(report)
+            await send_log(
+                guild,
+                "Bulk Role Update",
+                f"{'Added' if job.add else 'Removed'} {role.mention} for {job.done} members",
+                color=discord.Color.blue(),
+                user=interaction.user,
+                additional_fields=[
+                    {"name": "Failed", "value": str(job.failed), "inline": True},
+                    {"name": "Duration", "value": _format_duration(job.finished - job.started), "inline": True}
+                ]
+            )
+        finally:
+            role_batch_jobs.pop(guild.id, None)
+
+    asyncio.create_task(run()).add_done_callback(_report_failure(f"Bulk role update failed in {guild.id}"))
+
+@bot.tree.command(name='autorole', description='Give a role to everyone who joins (Admin only)')
+@discord.app_commands.choices(action=[
+    discord.app_commands.Choice(name='Add', value='add'),
+    discord.app_commands.Choice(name='Remove', value='remove'),
+])
+async def auto_role_slash(interaction: discord.Interaction, action: discord.app_commands.Choice[str], role: discord.Role):
+    await _update_role_setting(interaction, 'auto', action.value == 'add', role)
+
+@bot.tree.command(name='stickyrole', description='Give a role back to members who leave and rejoin (Admin only)')
+@discord.app_commands.choices(action=[
+    discord.app_commands.Choice(name='Add', value='add'),
+    discord.app_commands.Choice(name='Remove', value='remove'),
+])
+async def sticky_role_slash(interaction: discord.Interaction, action: discord.app_commands.Choice[str], role: discord.Role):
+    await _update_role_setting(interaction, 'sticky', action.value == 'add', role)
+
+async def _update_role_setting(interaction, kind, enabled, role):
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("❌ You need administrator permissions to use this command!", ephemeral=True)
+        return
+    problem = assignable_role(interaction.guild, role)
+    if enabled and problem:
+        await interaction.response.send_message(f"❌ I can't manage {role.mention}: {problem}.", ephemeral=True)
+        return
+
+    set_role_setting(interaction.guild.id, role.id, kind, enabled)
+    roles = get_role_settings(interaction.guild.id)[kind]
+    embed = discord.Embed(
+        title="🛠️ Auto Roles Updated" if kind == 'auto' else "🛠️ Sticky Roles Updated",
+        description="\n".join(f"<@&{role_id}>" for role_id in roles) or "None",
+        color=discord.Color.green()
+    )
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+@bot.tree.command(name='selfroles', description='Post buttons members can use to pick roles (Admin only)')
+async def self_roles_slash(interaction: discord.Interaction, title: str, role1: discord.Role, role2: discord.Role = None,
+                           role3: discord.Role = None, role4: discord.Role = None, role5: discord.Role = None):
+    """Post a self role panel"""
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("❌ You need administrator permissions to use this command!", ephemeral=True)
+        return
+
+    roles = [role for role in (role1, role2, role3, role4, role5) if role is not None]
+    for role in roles:
+        problem = assignable_role(interaction.guild, role)
+        if problem:
+            await interaction.response.send_message(f"❌ I can't manage {role.mention}: {problem}.", ephemeral=True)
+            return
+
+    view = discord.ui.View(timeout=None)
+    for role in roles:
+        view.add_item(SelfRoleButton(role.id, role.name[:80]))
+    embed = discord.Embed(
+        title=f"🎭 {title}",
+        description="Click a button to get the role, click it again to remove it.\n\n" + "\n".join(role.mention for role in roles),
+        color=discord.Color.blurple()
+    )
+    await interaction.response.send_message(embed=embed, view=view)
+
+@bot.tree.command(name='reactionrole', description='Give a role to members who react to a message (Admin only)')
+@auto_defer('reactionrole', ephemeral=True)
+async def reaction_role_slash(interaction: discord.Interaction, message_id: str, emoji: str, role: discord.Role):
+    """Bind an emoji on a message in this channel to a role"""
+    if not interaction.user.guild_permissions.administrator:
+        await respond(interaction, "❌ You need administrator permissions to use this command!", ephemeral=True)
+        return
+    problem = assignable_role(interaction.guild, role)
+    if problem:
+        await respond(interaction, f"❌ I can't manage {role.mention}: {problem}.", ephemeral=True)
+        return
+
+    try:
+        message = await interaction.channel.fetch_message(int(message_id))
+        await message.add_reaction(emoji)
+    except (ValueError, discord.HTTPException) as e:
+        await respond(interaction, f"❌ Could not react to that message: {e}", ephemeral=True)
+        return
+
+    emoji_key = str(discord.PartialEmoji.from_str(emoji))
+    with get_db() as db:
+        db.execute(
+            "INSERT OR REPLACE INTO reaction_roles (message_id, emoji, guild_id, role_id) VALUES (?, ?, ?, ?)",
+            (message.id, emoji_key, interaction.guild.id, role.id)
+        )
+    _load_reaction_roles()[message.id][emoji_key] = role.id
+    await respond(interaction, f"✅ Reacting with {emoji} on that message now gives {role.mention}.", ephemeral=True)
+
+# Embed templates
+import string
+
+# Embed definitions in discord's embed dict format. Strings may use {placeholders}, which
+# are filled in when rendering; a field marked optional is left out when its value renders
+# empty. Guilds can override any top-level key with /embedtemplate.
+EMBED_TEMPLATES = {
+    'giveaway_active': {
+        'title': "\x1a GIVEAWAY \x1a",
+        'description': "**Prize:** {prize}\n**Duration:** {duration}\n**Host:** {host}\n**Winners:** {winners}",
+        'color': 0x00ff00,
+        'fields': [
+            {'name': "Participants", 'value': "{participants} entered", 'inline': True},
+            {'name': "Ends", 'value': "<t:{ends}:R>", 'inline': True},
+            {'name': "Requirements", 'value': "{requirements}", 'inline': False, 'optional': True},
+        ],
+        'footer': {'text': "{footer}"},
+    },
+    'giveaway_ended': {
+        'title': "\x1a GIVEAWAY ENDED \x1a",
+        'description': "**Prize:** {prize}\n**Duration:** {duration}\n**Host:** {host}\n**Winners:** {winners}",
+        'color': 0xff0000,
+        'fields': [
+            {'name': "Status", 'value': "\x1a Ended", 'inline': True},
+            {'name': "Final Participants", 'value': "{participants} entered", 'inline': True},
+        ],
+        'footer': {'text': "This giveaway has ended!"},
+    },
+    'giveaway_result': {
+        'title': "\x1a Giveaway Ended!",
+        'description': "**Prize:** {prize}\n**Host:** {host}",
+        'color': 0x00ff00,
+        'fields': [
+            {'name': "\x1a Winners", 'value': "{winners}", 'inline': False, 'optional': True},
+            {'name': "Total Participants", 'value': "{participants}", 'inline': True},
+            {'name': "Giveaway ID", 'value': "`{giveaway_id}`", 'inline': True},
+        ],
+        'footer': {'text': "Congratulations to the winners! - Use /greroll with the Giveaway ID to reroll"},
+    },
+    'giveaway_reroll': {
+        'title': "\x1a Giveaway Rerolled!",
+        'description': "**Prize:** {prize}\n**Original Host:** {host}\n**Rerolled by:** {rerolled_by}",
+        'color': 0x9932cc,
+        'fields': [
+            {'name': "\x1a New Winners", 'value': "{winners}", 'inline': False, 'optional': True},
+            {'name': "Total Participants", 'value': "{participants}", 'inline': True},
+            {'name': "Giveaway ID", 'value': "`{giveaway_id}`", 'inline': True},
+        ],
+        'footer': {'text': "New winners have been selected!"},
+    },
+    'giveaway_no_entries': {
+        'title': "\x1a Giveaway Ended",
+        'description': "**Prize:** {prize}\n\n\x1a No one entered the giveaway!",
+        'color': 0xff0000,
+    },
+    'ticket_created': {
+        'title': "🎫 Support Ticket Created",
+        'description': "Hello {user}! Your ticket has been created.\n\nPlease describe your issue in detail and our staff will assist you shortly.",
+        'color': 0x2ecc71,
+        'fields': [
+            {'name': "Ticket Creator", 'value': "{user}", 'inline': True},
+            {'name': "Created", 'value': "<t:{created}:F>", 'inline': True},
+        ],
+        'footer': {'text': "Staff will be with you shortly!"},
+    },
+    'welcome': {
+        'title': "👋 Welcome!",
+        'description': "Hey {user}, welcome to **{server}**!\nWelcome to the best roblox gambling sites!",
+        'color': 0x2ecc71,
+        'thumbnail': {'url': "{avatar}"},
+        'footer': {'text': "Enjoy your stay with us!"},
+    },
+    'goodbye': {
+        'title': "😢 Goodbye!",
+        'description': "{name} has left the server.",
+        'color': 0xe74c3c,
+        'thumbnail': {'url': "{avatar}"},
+        'footer': {'text': "Hope to see you again!"},
+    },
+    'application_question': {
+        'title': "Question {number}/{total}",
+        'description': "{question}",
+        'color': 0x3498db,
+        'footer': {'text': "Please respond with your answer. You have 10 minutes to respond."},
+    },
+    'application_submitted': {
+        'title': "✅ Application Submitted!",
+        'description': "Thank you for submitting your staff application! Our team will review it and get back to you soon.",
+        'color': 0x2ecc71,
+    },
+    'application_timeout': {
+        'title': "❌ Application Timed Out",
+        'description': "Your staff application has been cancelled due to inactivity. You can start a new application anytime.",
+        'color': 0xe74c3c,
+    },
+}
+# The auto-ended variants only differ in their title
+EMBED_TEMPLATES['giveaway_result_auto'] = dict(EMBED_TEMPLATES['giveaway_result'], title="\x1a Giveaway Ended! (Auto)")
+EMBED_TEMPLATES['giveaway_no_entries_auto'] = dict(EMBED_TEMPLATES['giveaway_no_entries'], title="\x1a Giveaway Ended (Auto)")
+
+EMBED_TEMPLATE_KEYS = ('title', 'description', 'url', 'color', 'fields', 'footer', 'author', 'thumbnail', 'image')
+
+DB_SCHEMA += [
+    """CREATE TABLE IF NOT EXISTS embed_templates (
+        guild_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        definition TEXT NOT NULL,
+        PRIMARY KEY (guild_id, name)
+    )""",
+]
+
+_template_formatter = string.Formatter()
+
+def _template_variables(text):
+    """Placeholder names used in a template string, only plain names are allowed"""
+    names = set()
+    for _, name, _, _ in _template_formatter.parse(text):
+        if name is None:
+            continue
+        if not name.isidentifier():
+            raise ValueError(f"invalid placeholder {{{name}}}")
+        names.add(name)
+    return names
+
+# Nested embed parts, set with their Embed setter, and the keys each setter takes
+EMBED_TEMPLATE_PARTS = {
+    'footer': ('set_footer', ('text', 'icon_url')),
+    'author': ('set_author', ('name', 'url', 'icon_url')),
+    'thumbnail': ('set_thumbnail', ('url',)),
+    'image': ('set_image', ('url',)),
+}
+
+def _template_formatter_for(text):
+    """A function filling in text's placeholders from a dict.
+
+    Plain {name} placeholders become a %-format string, which skips the format string
+    parsing format_map does on every call. Anything fancier keeps using format_map.
+    """
+    parts = []
+    for literal, name, spec, conversion in _template_formatter.parse(text):
+        parts.append(literal.replace('%', '%%'))
+        if name is not None:
+            if spec or conversion:
+                return text.format_map
+            parts.append(f"%({name})s")
+    return "".join(parts).__mod__
+
+class EmbedTemplate:
+    """An embed definition compiled once.
+
+    Strings without placeholders are kept ready-made and the ones with placeholders get a
+    formatter each, rendering fills those in and passes everything straight to the Embed
+    constructor and setters.
+    """
+    def __init__(self, definition):
+        unknown = set(definition) - set(EMBED_TEMPLATE_KEYS)
+        if unknown:
+            raise ValueError(f"unknown embed keys: {', '.join(sorted(unknown))}")
+        self.variables = set()
+        self.static = {}   # Embed constructor arguments without placeholders
+        self.dynamic = []  # (constructor argument, formatter)
+        self.parts = []    # (setter name, static arguments, [(argument, formatter)])
+        self.fields = []   # (name, name formatter, value, value formatter, inline, optional), formatters None if static
+
+        for key, value in definition.items():
+            if key == 'fields':
+                for field in value:
+                    name, text = str(field['name']), str(field['value'])
+                    inline, optional = bool(field.get('inline', True)), bool(field.get('optional'))
+                    format_name, format_text = self._compile(name), self._compile(text)
+                    if format_name or format_text or text.strip() or not optional:
+                        self.fields.append((name.format() if format_name is None else name, format_name,
+                                            text.format() if format_text is None else text, format_text, inline, optional))
+            elif key in EMBED_TEMPLATE_PARTS:
+                setter, allowed = EMBED_TEMPLATE_PARTS[key]
+                if not isinstance(value, dict) or set(value) - set(allowed):
+                    raise ValueError(f"{key} must be an object with only {', '.join(allowed)}")
+                static, dynamic = {}, []
+                for sub_key, sub_value in value.items():
+                    formatter = self._compile(sub_value) if isinstance(sub_value, str) else None
+                    if formatter:
+                        dynamic.append((sub_key, formatter))
+                    else:
+                        static[sub_key] = sub_value.format() if isinstance(sub_value, str) else sub_value
+                self.parts.append((setter, static, dynamic))
+            elif key == 'color':
+                if not isinstance(value, int):
+                    raise ValueError("color must be a number")
+                self.static[key] = value
+            else:
+                formatter = self._compile(value) if isinstance(value, str) else None
+                if formatter:
+                    self.dynamic.append((key, formatter))
+                else:
+                    self.static[key] = value.format() if isinstance(value, str) else value
+
+    def _compile(self, text):
+        """The formatter for a string with placeholders, None for a static one"""
+        names = _template_variables(text)
+        if not names:
+            return None
+        self.variables |= names
+        return _template_formatter_for(text)
+
+    def render(self, values):
+        arguments = self.static
+        if self.dynamic:
+            arguments = arguments.copy()
+            for key, formatter in self.dynamic:
+                arguments[key] = formatter(values)
+        embed = discord.Embed(**arguments)
+        for setter, static, dynamic in self.parts:
+            if dynamic:
+                static = static.copy()
+                for key, formatter in dynamic:
+                    static[key] = formatter(values)
+            getattr(embed, setter)(**static)
+        for name, format_name, value, format_value, inline, optional in self.fields:
+            if format_value is not None:
+                value = format_value(values)
+                if optional and not value.strip():
+                    continue
+            embed.add_field(name=name if format_name is None else format_name(values), value=value, inline=inline)
+        return embed
+
+embed_template_overrides = {}  # guild_id -> {name: definition}, loaded on first use
+compiled_embed_templates = {}  # (guild_id, name) -> EmbedTemplate, guild_id 0 for the defaults
+
+def _guild_template_overrides(guild_id):
+    overrides = embed_template_overrides.get(guild_id)
+    if overrides is None:
+        overrides = embed_template_overrides[guild_id] = {}
+        try:
+            for row in get_db().execute("SELECT name, definition FROM embed_templates WHERE guild_id = ?", (guild_id,)):
+                overrides[row['name']] = json.loads(row['definition'])
+        except Exception as e:
+            print(f"Failed to load embed templates: {e}")
+    return overrides
+
+def get_embed_template(name, guild_id=None):
+    """The compiled template a guild uses for an embed"""
+    key = (guild_id or 0, name)
+    template = compiled_embed_templates.get(key)
+    if template is None:
+        override = _guild_template_overrides(guild_id).get(name) if guild_id else None
+        if override:
+            try:
+                template = EmbedTemplate({**EMBED_TEMPLATES[name], **override})
+            except (ValueError, KeyError, TypeError) as e:
+                print(f"Ignoring broken {name} template for guild {guild_id}: {e}")
+        if template is None:
+            template = get_embed_template(name) if guild_id else EmbedTemplate(EMBED_TEMPLATES[name])
+        compiled_embed_templates[key] = template
+    return template
+
+def render_embed(name, guild=None, **values):
+    """Build an embed from a template, with the guild's customisations if it has any"""
+    return get_embed_template(name, guild.id if guild else None).render(values)
+
+def set_embed_template(guild_id, name, override):
+    """Save (or with None, reset) a guild's override of a template after checking it compiles"""
+    if override is not None:
+        template = EmbedTemplate({**EMBED_TEMPLATES[name], **override})
+        extra = template.variables - EmbedTemplate(EMBED_TEMPLATES[name]).variables
+        if extra:
+            raise ValueError(f"unknown placeholders: {', '.join('{' + name + '}' for name in sorted(extra))}")
+    with get_db() as db:
+        if override is None:
+            db.execute("DELETE FROM embed_templates WHERE guild_id = ? AND name = ?", (guild_id, name))
+        else:
+            db.execute("INSERT OR REPLACE INTO embed_templates (guild_id, name, definition) VALUES (?, ?, ?)",
+                       (guild_id, name, json.dumps(override)))
+    overrides = _guild_template_overrides(guild_id)
+    if override is None:
+        overrides.pop(name, None)
+    else:
+        overrides[name] = override
+    compiled_embed_templates.pop((guild_id, name), None)
+
+@bot.tree.command(name='embedtemplate', description='Customise one of the bot\'s embeds (Admin only)')
+async def embed_template_slash(interaction: discord.Interaction, name: str, definition: str = None, reset: bool = False):
+    """Show, change or reset a template. definition is JSON with the keys to override"""
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("❌ You need administrator permissions to use this command!", ephemeral=True)
+        return
+    if name not in EMBED_TEMPLATES:
+        await interaction.response.send_message("❌ Unknown template!", ephemeral=True)
+        return
+
+    guild_id = interaction.guild.id
+    if reset or definition:
+        try:
+            override = None if reset else json.loads(definition)
+            if override is not None and not isinstance(override, dict):
+                raise ValueError("the definition must be a JSON object")
+            set_embed_template(guild_id, name, override)
+        except (ValueError, KeyError, TypeError) as e:
+            await interaction.response.send_message(f"❌ Invalid template: {e}", ephemeral=True)
+            return
+
+    # Preview with the placeholders left in
+    template = get_embed_template(name, guild_id)
+    preview = template.render({variable: f"{{{variable}}}" for variable in template.variables})
+    current = _guild_template_overrides(guild_id).get(name)
+    content = f"**{name}** ({'customised' if current else 'default'})"
+    if template.variables:
+        content += "\nPlaceholders: " + ", ".join(f"`{{{variable}}}`" for variable in sorted(template.variables))
+    await interaction.response.send_message(content, embed=preview, ephemeral=True)
+
+@embed_template_slash.autocomplete('name')
+async def embed_template_name_autocomplete(interaction: discord.Interaction, current: str):
+    return [
+        discord.app_commands.Choice(name=name, value=name)
+        for name in EMBED_TEMPLATES if current.lower() in name
+    ][:25]
+
+# Guild configuration
+# Channels and roles each guild uses. The module constants are the defaults, so the guild
+# they were written for keeps working unconfigured; lookups are always scoped to the guild,
+# so in any other guild an unconfigured channel is simply missing instead of borrowed.
+GUILD_CONFIG_KEYS = {
+    # key: (kind, default, description)
+    'log_channel': ('channel', LOG_CHANNEL_ID, "Where the bot logs events"),
+    'welcome_channel': ('channel', WELCOME_CHANNEL_ID, "Welcome and goodbye messages"),
+    'review_channel': ('channel', REVIEW_CHANNEL_ID, "Where reviews are posted"),
+    'ticket_channel': ('channel', TICKET_CHANNEL_ID, "Ticket panel, and parent of ticket threads"),
+    'ticket_category': ('category', TICKET_CATEGORY_ID, "Category for ticket channels"),
+    'guess_channel': ('channel', GUESS_CHANNEL_ID, "Number guessing game"),
+    'staff_apply_channel': ('channel', STAFF_APPLY_CHANNEL_ID, "Staff application panel"),
+    'staff_results_channel': ('channel', STAFF_RESULTS_CHANNEL_ID, "Where staff applications are reviewed"),
+    'staff_role': ('role', STAFF_ROLE_ID, "Role given to accepted staff applicants"),
+    'ticket_backend': ('ticket_backend', TICKET_BACKEND, "Tickets as channels or private threads"),
+    'giveaway_weights': ('role_weights', GIVEAWAY_ROLE_WEIGHTS, "Extra giveaway entries per role"),
+}
+
+DB_SCHEMA += [
+    """CREATE TABLE IF NOT EXISTS guild_config (
+        guild_id INTEGER NOT NULL,
+        key TEXT NOT NULL,
+        value TEXT NOT NULL,
+        PRIMARY KEY (guild_id, key)
+    )""",
+]
+
+def _migrate_ticket_settings(db):
+    """Ticket backends used to have their own table, move them into guild_config once"""
+    if not _table_exists(db, 'ticket_settings'):
+        return
+    db.execute("INSERT OR IGNORE INTO guild_config (guild_id, key, value) SELECT guild_id, 'ticket_backend', backend FROM ticket_settings")
+    db.execute("DROP TABLE ticket_settings")
+
+DB_MIGRATIONS.append(_migrate_ticket_settings)
+
+guild_configs = {}    # guild_id -> {key: value}, defaults filled in, loaded on first use
+config_channels = {}  # (guild_id, key) -> channel object, dropped when the channel is deleted
+
+def _parse_config_value(key, value):
+    kind = GUILD_CONFIG_KEYS[key][0]
+    if kind == 'role_weights':
+        # Stored as "role_id:weight,role_id:weight"
+        return {int(role_id): int(weight) for role_id, weight in (item.split(':') for item in value.split(',') if item)}
+    return int(value) if kind in ('channel', 'category', 'role') else value
+
+def _store_config_value(key, value):
+    if GUILD_CONFIG_KEYS[key][0] == 'role_weights':
+        return ",".join(f"{role_id}:{weight}" for role_id, weight in sorted(value.items()))
+    return str(value)
+
+def guild_config(guild_id):
+    """A guild's configuration, read through from the database once"""
+    config = guild_configs.get(guild_id)
+    if config is None:
+        config = {key: default for key, (_, default, _) in GUILD_CONFIG_KEYS.items()}
+        try:
+            for row in get_db().execute("SELECT key, value FROM guild_config WHERE guild_id = ?", (guild_id,)):
+                if row['key'] in GUILD_CONFIG_KEYS:
+                    config[row['key']] = _parse_config_value(row['key'], row['value'])
+        except Exception as e:
+            print(f"Failed to load config for guild {guild_id}: {e}")
+        guild_configs[guild_id] = config
+    return config
+
+def get_config(guild, key):
+    return guild_config(guild.id)[key]
+
+def config_channel(guild, key):
+    """The channel a guild configured for key, or None if it doesn't exist there"""
+    channel = config_channels.get((guild.id, key))
+    if channel is None:
+        channel = guild.get_channel(guild_config(guild.id)[key])
+        if channel is not None:
+            config_channels[(guild.id, key)] = channel
+    return channel
+
+def set_guild_config(guild_id, key, value):
+    """Set a guild's value for key, None resets it to the default"""
+    with get_db() as db:
+        if value is None:
+            db.execute("DELETE FROM guild_config WHERE guild_id = ? AND key = ?", (guild_id, key))
+        else:
+            db.execute("INSERT OR REPLACE INTO guild_config (guild_id, key, value) VALUES (?, ?, ?)", (guild_id, key, _store_config_value(key, value)))
+    guild_config(guild_id)[key] = GUILD_CONFIG_KEYS[key][1] if value is None else _parse_config_value(key, _store_config_value(key, value))
+    config_channels.pop((guild_id, key), None)
+    if key == 'ticket_category':
+        ticket_category_pool.pop(guild_id, None)  # Rebuilt around the new category on next use
+
+def reload_guild_config(guild_id=None):
+    """Drop cached config (of one guild, or all) so the next read sees the database again"""
+    for cache in (guild_configs, ticket_category_pool):
+        if guild_id is None:
+            cache.clear()
+        else:
+            cache.pop(guild_id, None)
+    for cache_key in list(config_channels):
+        if guild_id is None or cache_key[0] == guild_id:
+            del config_channels[cache_key]
+
+@bot.listen('on_guild_channel_delete')
+async def forget_config_channel(channel):
+    for cache_key, cached in list(config_channels.items()):
+        if cached.id == channel.id:
+            del config_channels[cache_key]
+
+def _config_choices(*kinds):
+    return [
+        discord.app_commands.Choice(name=f"{key} - {description}"[:100], value=key)
+        for key, (kind, _, description) in GUILD_CONFIG_KEYS.items() if kind in kinds
+    ]
+
+def _format_config_value(key, value):
+    kind = GUILD_CONFIG_KEYS[key][0]
+    if kind == 'role':
+        return f"<@&{value}>"
+    if kind in ('channel', 'category'):
+        return f"<#{value}>"
+    if kind == 'role_weights':
+        return ", ".join(f"<@&{role_id}> ×{weight}" for role_id, weight in value.items()) or "`none`"
+    return f"`{value}`"
+
+@bot.tree.command(name='setconfig', description='Set the channel or role the bot uses for something (Admin only)')
+@discord.app_commands.choices(key=_config_choices('channel', 'category', 'role'))
+async def set_config_slash(interaction: discord.Interaction, key: discord.app_commands.Choice[str],
+                           channel: discord.abc.GuildChannel = None, role: discord.Role = None, reset: bool = False):
+    """Point a config key at a channel/category/role of this guild, or reset it to the default"""
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("❌ You need administrator permissions to use this command!", ephemeral=True)
+        return
+
+    kind = GUILD_CONFIG_KEYS[key.value][0]
+    if reset:
+        value = None
+    elif kind == 'role':
+        if role is None:
+            await interaction.response.send_message("❌ Pick a role for this setting!", ephemeral=True)
+            return
+        value = role.id
+    else:
+        is_category = isinstance(channel, discord.CategoryChannel)
+        if channel is None or is_category != (kind == 'category'):
+            await interaction.response.send_message(f"❌ Pick a {'category' if kind == 'category' else 'channel'} for this setting!", ephemeral=True)
+            return
+        value = channel.id
+
+    set_guild_config(interaction.guild.id, key.value, value)
+    current = get_config(interaction.guild, key.value)
+    await interaction.response.send_message(f"✅ **{key.value}** is now {_format_config_value(key.value, current)}.", ephemeral=True)
+    await send_log(
+        interaction.guild,
+        "Configuration Changed",
+        f"**{key.value}** set to {_format_config_value(key.value, current)}",
+        color=discord.Color.blue(),
+        user=interaction.user
+    )
+
+@bot.tree.command(name='config', description='Show the channels and roles the bot uses here (Admin only)')
+async def show_config_slash(interaction: discord.Interaction, reload: bool = False):
+    """Show this guild's config, optionally re-reading it from the database first"""
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("❌ You need administrator permissions to use this command!", ephemeral=True)
+        return
+    if reload:
+        reload_guild_config(interaction.guild.id)
+
+    guild = interaction.guild
+    config = guild_config(guild.id)
+    embed = discord.Embed(title="⚙️ Server Configuration", color=discord.Color.blue())
+    for key, (kind, default, description) in GUILD_CONFIG_KEYS.items():
+        value = config[key]
+        missing = kind in ('channel', 'category') and config_channel(guild, key) is None or \
+            kind == 'role' and guild.get_role(value) is None
+        status = " ⚠️ not found" if missing else (" (default)" if value == default else "")
+        embed.add_field(name=key, value=f"{_format_config_value(key, value)}{status}\n{description}", inline=True)
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+@bot.tree.command(name='giveawayweight', description='Give members with a role extra giveaway entries (Admin only)')
+async def giveaway_weight_slash(interaction: discord.Interaction, role: discord.Role, entries: discord.app_commands.Range[int, 1, 100]):
+    """Set how many entries members with a role get in giveaway draws, 1 removes the bonus"""
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("❌ You need administrator permissions to use this command!", ephemeral=True)
+        return
+
+    weights = dict(get_config(interaction.guild, 'giveaway_weights'))
+    if entries == 1:
+        weights.pop(role.id, None)
+    else:
+        weights[role.id] = entries
+    set_guild_config(interaction.guild.id, 'giveaway_weights', weights or None)
+
+    current = _format_config_value('giveaway_weights', get_config(interaction.guild, 'giveaway_weights'))
+    embed = discord.Embed(
+        title="🎉 Giveaway Entries Updated",
+        description=f"Members with {role.mention} now get **{entries}** {'entry' if entries == 1 else 'entries'} per giveaway.",
+        color=discord.Color.green()
+    )
+    embed.add_field(name="Bonus Roles", value=current, inline=False)
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+    await send_log(
+        interaction.guild,
+        "Configuration Changed",
+        f"**giveaway_weights** set to {current}",
+        color=discord.Color.blue(),
+        user=interaction.user
+    )
+
+# Asset cache
+import aiohttp
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+ASSET_MEMORY_BYTES = int(os.getenv('ASSET_MEMORY_MB', '64')) * 1024 * 1024   # In-memory cache size
+ASSET_DISK_BYTES = int(os.getenv('ASSET_DISK_MB', '1024')) * 1024 * 1024     # On-disk store size
+ASSET_MAX_BYTES = 25 * 1024 * 1024  # Larger downloads are refused (Discord's upload limit)
+ASSET_FRESH_SECONDS = 24 * 3600     # Cached copies are used as-is for this long, then revalidated
+ASSET_CONNECTIONS = 16              # Pooled connections shared by every download
+ASSET_TIMEOUT = 15.0
+ASSET_PRUNE_EVERY = 100             # Downloads between disk size checks
+ASSET_DIR = os.path.join(DATA_DIR, 'assets')
+# Attachment links carry an expiring signature, the file behind them doesn't change
+ASSET_SIGNATURE_PARAMS = {'ex', 'is', 'hm'}
+
+DB_SCHEMA += [
+    '''CREATE TABLE IF NOT EXISTS asset_index (
+        key TEXT PRIMARY KEY,
+        digest TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        etag TEXT,
+        last_modified TEXT,
+        checked_at REAL NOT NULL,
+        used_at REAL NOT NULL
+    )''',
+    'CREATE INDEX IF NOT EXISTS asset_index_digest ON asset_index (digest)',
+    'CREATE INDEX IF NOT EXISTS asset_index_used ON asset_index (used_at)',
+]
+
+def asset_key(url):
+    """Cache key for a CDN url, without the signature parameters"""
+    parts = urlsplit(url)
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k not in ASSET_SIGNATURE_PARAMS)
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ''))
+
+class AssetEntry:
+    __slots__ = ('data', 'digest', 'etag', 'last_modified', 'checked_at')
+
+    def __init__(self, data, digest, etag, last_modified, checked_at):
+        self.data = data
+        self.digest = digest
+        self.etag = etag
+        self.last_modified = last_modified
+        self.checked_at = checked_at
+
+    def fresh(self, now):
+        return now - self.checked_at < ASSET_FRESH_SECONDS
+
+class AssetCache:
+    """Downloads CDN assets once: a memory LRU bounded by bytes, then content-addressed files on disk"""
+
+    def __init__(self, memory_bytes=ASSET_MEMORY_BYTES, disk_bytes=ASSET_DISK_BYTES, directory=ASSET_DIR):
+        self.memory = OrderedDict()  # key -> AssetEntry, least recently used first
+        self.memory_bytes = 0
+        self.memory_limit = memory_bytes
+        self.disk_limit = disk_bytes
+        self.directory = directory
+        self.inflight = {}  # key -> download task shared by everyone asking for it
+        self.session = None
+        self.stored = 0
+        self.stats = defaultdict(int)  # result -> requests
+        self.bytes = defaultdict(int)  # 'fetched' from the network, 'saved' by not fetching
+
+    def _session(self):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=ASSET_CONNECTIONS, ttl_dns_cache=300),
+                timeout=aiohttp.ClientTimeout(total=ASSET_TIMEOUT)
+            )
+        return self.session
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def hit_ratio(self):
+        served = sum(self.stats[result] for result in ('memory_hit', 'disk_hit', 'revalidated', 'deduplicated'))
+        return served / self.stats['requests'] if self.stats['requests'] else 0.0
+
+    async def fetch(self, url):
+        """The asset's bytes, None if it can't be downloaded and isn't cached"""
+        key = asset_key(url)
+        self.stats['requests'] += 1
+        entry = self.memory.get(key)
+        if entry is not None and entry.fresh(time.time()):
+            self.memory.move_to_end(key)
+            self.stats['memory_hit'] += 1
+            self.bytes['saved'] += len(entry.data)
+            return entry.data
+
+        task = self.inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._load(url, key, entry))
+            self.inflight[key] = task
+            task.add_done_callback(lambda _: self.inflight.pop(key, None))
+            return await asyncio.shield(task)
+
+        self.stats['deduplicated'] += 1
+        data = await asyncio.shield(task)
+        if data is not None:
+            self.bytes['saved'] += len(data)
+        return data
+
+    async def _load(self, url, key, entry):
+        now = time.time()
+        if entry is None:
+            entry = await self._read_disk(key, now)
+            if entry is not None and entry.fresh(now):
+                self.stats['disk_hit'] += 1
+                self.bytes['saved'] += len(entry.data)
+                self._remember(key, entry)
+                return entry.data
+
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                headers['If-Modified-Since'] = entry.last_modified
+        try:
+            async with self._session().get(url, headers=headers) as response:
+                if response.status == 304 and entry is not None:
+                    self.stats['revalidated'] += 1
+                    self.bytes['saved'] += len(entry.data)
+                    entry.checked_at = now
+                    self._index(key, entry, len(entry.data), now)
+                    self._remember(key, entry)
+                    return entry.data
+                response.raise_for_status()
+                if (response.content_length or 0) > ASSET_MAX_BYTES:
+                    raise ValueError(f"{response.content_length} bytes is over the limit")
+                chunks, size = [], 0
+                async for chunk in response.content.iter_chunked(64 * 1024):
+                    size += len(chunk)
+                    if size > ASSET_MAX_BYTES:
+                        raise ValueError(f"over {ASSET_MAX_BYTES} bytes")
+                    chunks.append(chunk)
+                data = b''.join(chunks)
+                etag = response.headers.get('ETag')
+                last_modified = response.headers.get('Last-Modified')
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            print(f"Failed to fetch asset {key}: {e}")
+            if entry is not None:
+                # A stale copy beats no copy while the CDN is unreachable
+                self.stats['stale'] += 1
+                return entry.data
+            self.stats['error'] += 1
+            return None
+
+        self.stats['fetched'] += 1
+        self.bytes['fetched'] += len(data)
+        entry = AssetEntry(data, hashlib.sha256(data).hexdigest(), etag, last_modified, now)
+        self._remember(key, entry)
+        await self._write_disk(key, entry, now)
+        return data
+
+    def _remember(self, key, entry):
+        old = self.memory.pop(key, None)
+        if old is not None:
+            self.memory_bytes -= len(old.data)
+        if len(entry.data) > self.memory_limit // 8:
+            return  # Big files would push out everything else, they are served from disk
+        self.memory[key] = entry
+        self.memory_bytes += len(entry.data)
+        while self.memory_bytes > self.memory_limit:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_bytes -= len(evicted.data)
+
+    def _path(self, digest):
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def _index(self, key, entry, size, now):
+        db = get_db()
+        db.execute(
+            '''INSERT INTO asset_index (key, digest, size, etag, last_modified, checked_at, used_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT(key) DO UPDATE SET digest = excluded.digest, size = excluded.size, etag = excluded.etag,
+                   last_modified = excluded.last_modified, checked_at = excluded.checked_at, used_at = excluded.used_at''',
+            (key, entry.digest, size, entry.etag, entry.last_modified, entry.checked_at, now)
+        )
+        db.commit()
+
+    async def _read_disk(self, key, now):
+        db = get_db()
+        row = db.execute('SELECT * FROM asset_index WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        try:
+            data = await asyncio.to_thread(_read_file, self._path(row['digest']))
+        except OSError:
+            db.execute('DELETE FROM asset_index WHERE key = ?', (key,))
+            db.commit()
+            return None
+        db.execute('UPDATE asset_index SET used_at = ? WHERE key = ?', (now, key))
+        db.commit()
+        return AssetEntry(data, row['digest'], row['etag'], row['last_modified'], row['checked_at'])
+
+    async def _write_disk(self, key, entry, now):
+        try:
+            await asyncio.to_thread(_write_file, self._path(entry.digest), entry.data)
+        except OSError as e:
+            print(f"Failed to store asset {key}: {e}")
+            return
+        self._index(key, entry, len(entry.data), now)
+        self.stored += 1
+        if self.stored % ASSET_PRUNE_EVERY == 0:
+            await self.prune()
+
+    async def prune(self):
+        """Delete the least recently used files until the store is back under its size"""
+        db = get_db()
+        total = db.execute('SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT digest, size FROM asset_index)').fetchone()[0]
+        if total <= self.disk_limit:
+            return
+        unused = []
+        for row in db.execute('SELECT key, digest, size FROM asset_index ORDER BY used_at').fetchall():
+            db.execute('DELETE FROM asset_index WHERE key = ?', (row['key'],))
+            # Files are shared by identical content under different urls
+            if not db.execute('SELECT 1 FROM asset_index WHERE digest = ?', (row['digest'],)).fetchone():
+                unused.append(self._path(row['digest']))
+                total -= row['size']
+            if total <= self.disk_limit * 0.9:
+                break
+        db.commit()
+        await asyncio.to_thread(_remove_files, unused)
+
+def _read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+def _write_file(path, data):
+    if os.path.exists(path):
+        return  # Same digest, same content
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp = f"{path}.{os.getpid()}.tmp"
+    with open(temp, 'wb') as f:
+        f.write(data)
+    os.replace(temp, path)
+
+def _remove_files(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+asset_cache = AssetCache()
+
+async def fetch_asset(url):
+    """Download an avatar, attachment or other CDN file through the shared cache"""
+    return await asset_cache.fetch(url)
+
+# Welcome cards
+import io
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+    from PIL import Image, ImageDraw, ImageFont
+except ImportError:
+    Image = None  # Optional, welcomes fall back to the text embed without Pillow
+
+WELCOME_CARD_WORKERS = 2        # Render processes
+WELCOME_CARD_BACKLOG = 16       # Cards being fetched or rendered at once, more joins get the text embed
+WELCOME_CARD_TIMEOUT = 10.0     # Seconds before a render is abandoned
+WELCOME_CARD_SIZE = (1000, 300)
+WELCOME_CARD_AVATAR = 200
+WELCOME_CARD_BACKGROUND = os.path.join(DATA_DIR, 'welcome_background.png')  # Used if present
+WELCOME_CARD_FONT = os.getenv('WELCOME_CARD_FONT')  # TrueType font, Pillow's default font otherwise
+
+welcome_card_pool = None
+welcome_cards_pending = 0
+welcome_card_stats = defaultdict(int)
+
+# Worker process side: background, fonts and the avatar mask are loaded once per process
+_card_assets = None
+
+def _init_card_worker(background_path, font_path):
+    global _card_assets
+    width, height = WELCOME_CARD_SIZE
+    if background_path and os.path.exists(background_path):
+        background = Image.open(background_path).convert('RGBA').resize(WELCOME_CARD_SIZE)
+    else:
+        background = Image.new('RGBA', WELCOME_CARD_SIZE, (35, 39, 42, 255))
+
+    def font(size):
+        return ImageFont.truetype(font_path, size) if font_path else ImageFont.load_default(size)
+
+    mask = Image.new('L', (WELCOME_CARD_AVATAR, WELCOME_CARD_AVATAR), 0)
+    ImageDraw.Draw(mask).ellipse((0, 0, WELCOME_CARD_AVATAR, WELCOME_CARD_AVATAR), fill=255)
+    _card_assets = {'background': background, 'title': font(56), 'text': font(32), 'mask': mask}
+
+def _render_welcome_card(avatar, name, guild_name, member_count):
+    """Draw a welcome card and return it as PNG bytes (runs in a worker process)"""
+    if _card_assets is None:
+        _init_card_worker(WELCOME_CARD_BACKGROUND, WELCOME_CARD_FONT)
+    card = _card_assets['background'].copy()
+    size = WELCOME_CARD_AVATAR
+    top = (WELCOME_CARD_SIZE[1] - size) // 2
+    if avatar:
+        image = Image.open(io.BytesIO(avatar)).convert('RGBA').resize((size, size))
+        card.paste(image, (top, top), _card_assets['mask'])
+
+    draw = ImageDraw.Draw(card)
+    left = top * 2 + size
+    draw.text((left, top + 30), f"Welcome, {name}!", font=_card_assets['title'], fill=(255, 255, 255))
+    draw.text((left, top + 110), f"Member #{member_count} of {guild_name}", font=_card_assets['text'], fill=(185, 187, 190))
+
+    output = io.BytesIO()
+    card.convert('RGB').save(output, 'PNG')
+    return output.getvalue()
+
+def _warm_card_worker():
+    return _card_assets is not None
+
+def _welcome_card_pool():
+    global welcome_card_pool
+    if welcome_card_pool is None:
+        # Spawned, not forked: forking a process with a running event loop and threads is unsafe
+        welcome_card_pool = ProcessPoolExecutor(
+            max_workers=WELCOME_CARD_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_card_worker,
+            initargs=(WELCOME_CARD_BACKGROUND, WELCOME_CARD_FONT)
+        )
+    return welcome_card_pool
+
+def start_welcome_cards():
+    """Start the render processes ahead of the first join"""
+    if Image is None:
+        return
+    pool = _welcome_card_pool()
+    for _ in range(WELCOME_CARD_WORKERS):
+        pool.submit(_warm_card_worker)
+
+def stop_welcome_cards():
+    """Stop the render processes, dropping cards that haven't started rendering"""
+    global welcome_card_pool
+    if welcome_card_pool is not None:
+        welcome_card_pool.shutdown(wait=False, cancel_futures=True)
+        welcome_card_pool = None
+
+def _release_welcome_card():
+    global welcome_cards_pending
+    welcome_cards_pending -= 1
+
+async def _welcome_avatar(member):
+    """The member's avatar as PNG bytes, through the shared asset cache"""
+    return await fetch_asset(member.display_avatar.with_size(256).with_static_format('png').url)
+
+async def render_welcome_card(member):
+    """Render a member's welcome card off the event loop, None if it can't be done right now"""
+    global welcome_cards_pending
+    if Image is None:
+        return None
+    if welcome_cards_pending >= WELCOME_CARD_BACKLOG:
+        welcome_card_stats['degraded'] += 1
+        return None
+
+    loop = asyncio.get_running_loop()
+    welcome_cards_pending += 1
+    job = None
+    try:
+        avatar = await _welcome_avatar(member)
+        job = _welcome_card_pool().submit(
+            _render_welcome_card,
+            avatar, member.display_name[:32], member.guild.name[:40], member.guild.member_count
+        )
+        # A timed out render keeps its worker busy, so the slot is only freed once the worker is done with it
+        job.add_done_callback(lambda _: loop.is_closed() or loop.call_soon_threadsafe(_release_welcome_card))
+        card = await asyncio.wait_for(asyncio.wrap_future(job), WELCOME_CARD_TIMEOUT)
+        welcome_card_stats['rendered'] += 1
+        return card
+    except BrokenProcessPool as e:
+        print(f"Welcome card workers died, restarting them: {e}")
+        stop_welcome_cards()
+        welcome_card_stats['failed'] += 1
+    except Exception as e:
+        print(f"Failed to render welcome card for {member.id}: {e}")
+        welcome_card_stats['failed'] += 1
+    finally:
+        if job is None:
+            welcome_cards_pending -= 1
+    return None
+
+async def send_welcome(member, channel):
+    """Post the welcome embed, with the member's card as its image when one could be rendered"""
+    embed = render_embed(
+        'welcome', member.guild,
+        user=member.mention, server=member.guild.name,
+        avatar=member.avatar.url if member.avatar else member.default_avatar.url
+    )
+    card = await render_welcome_card(member)
+    if card is None:
+        send = lambda: channel.send(embed=embed)
+    else:
+        embed.set_thumbnail(url=None)
+        embed.set_image(url="attachment://welcome.png")
+        send = lambda: channel.send(embed=embed, file=discord.File(io.BytesIO(card), filename="welcome.png"))
+    # Queued, a raid must not hold every join handler until the channel's rate limit lets it through
+    future = schedule_rest(PRIORITY_PANEL, f"channel:{channel.id}", send)
+    future.add_done_callback(_report_failure(f"Failed to welcome {member.id}"))
+
+# The join handler near the top was registered on the first bot instance, listen with it
+# on this one too so new members are welcomed
+bot.add_listener(on_member_join)
+
+# Audit log correlation
+AUDIT_LOG_TTL = 300.0           # Seconds an entry can be matched to an event
+AUDIT_LOG_WAIT = 2.0            # Seconds an event waits for its entry to be pushed before polling
+AUDIT_LOG_POLL_INTERVAL = 1.0   # Minimum seconds between polls of one guild and action
+
+class AuditLogIndex:
+    """Recent audit log entries by (guild, action, target), fed by on_audit_log_entry_create.
+
+    Ban, kick, role and channel logs look up who did it here instead of fetching the audit
+    log per event. Entries the gateway didn't push are fetched by a poll shared by every
+    event waiting on the same guild and action.
+    """
+
+    def __init__(self):
+        self.entries = OrderedDict()  # (guild id, action, target id) -> (indexed at, entry), oldest first
+        self.waiters = defaultdict(list)  # key -> futures of events waiting for the entry
+        self.polls = {}  # (guild id, action) -> poll task
+        self.polled_at = {}  # (guild id, action) -> monotonic time of the last poll
+        self.newest = {}  # (guild id, action) -> newest entry id seen, polls start after it
+        self.stats = defaultdict(int)
+
+    def add(self, entry):
+        target_id = getattr(entry.target, 'id', None)
+        if target_id is None or discord.utils.utcnow() - entry.created_at > timedelta(seconds=AUDIT_LOG_TTL):
+            return
+        source = (entry.guild.id, entry.action)
+        self.newest[source] = max(self.newest.get(source, 0), entry.id)
+        key = (entry.guild.id, entry.action, target_id)
+        current = self.entries.get(key)
+        if current is not None and current[1].id >= entry.id:
+            return
+        now = time.monotonic()
+        self.entries.pop(key, None)
+        self.entries[key] = (now, entry)
+        self.stats['indexed'] += 1
+        for waiter in self.waiters.pop(key, ()):
+            if not waiter.done():
+                waiter.set_result(entry)
+        while self.entries:
+            oldest, (indexed_at, _) = next(iter(self.entries.items()))
+            if now - indexed_at < AUDIT_LOG_TTL:
+                break
+            del self.entries[oldest]
+
+    def get(self, guild, action, target_id):
+        item = self.entries.get((guild.id, action, target_id))
+        if item is None or time.monotonic() - item[0] >= AUDIT_LOG_TTL:
+            return None
+        return item[1]
+
+    async def find(self, guild, action, target_id, poll=True):
+        """The entry for an action on target_id, None if the audit log doesn't have one"""
+        entry = self.get(guild, action, target_id)
+        if entry is None:
+            key = (guild.id, action, target_id)
+            waiter = asyncio.get_running_loop().create_future()
+            self.waiters[key].append(waiter)
+            try:
+                entry = await asyncio.wait_for(waiter, AUDIT_LOG_WAIT)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                waiting = self.waiters.get(key)
+                if waiting and waiter in waiting:
+                    waiting.remove(waiter)
+                    if not waiting:
+                        del self.waiters[key]
+            if entry is None and poll:
+                await self.poll(guild, action)
+                entry = self.get(guild, action, target_id)
+        self.stats['matched' if entry is not None else 'unmatched'] += 1
+        return entry
+
+    async def poll(self, guild, action):
+        """Fetch new entries of one action, shared by every event waiting on it"""
+        source = (guild.id, action)
+        task = self.polls.get(source)
+        if task is None:
+            task = asyncio.create_task(self._poll(guild, action))
+            self.polls[source] = task
+            task.add_done_callback(lambda _: self.polls.pop(source, None))
+        await asyncio.shield(task)
+
+    async def _poll(self, guild, action):
+        source = (guild.id, action)
+        delay = self.polled_at.get(source, 0) + AUDIT_LOG_POLL_INTERVAL - time.monotonic()
+        if delay > 0:
+            # Let more events pile up behind this poll instead of polling again right away
+            await asyncio.sleep(delay)
+        oldest = discord.utils.time_snowflake(discord.utils.utcnow() - timedelta(seconds=AUDIT_LOG_TTL))
+        after = discord.Object(id=max(self.newest.get(source, 0), oldest))
+        self.stats['polls'] += 1
+        try:
+            async for entry in guild.audit_logs(action=action, limit=None, after=after):
+                self.add(entry)
+        except discord.HTTPException as e:
+            print(f"Failed to read the audit log of {guild.name}: {e}")
+        self.polled_at[source] = time.monotonic()
+
+audit_log_index = AuditLogIndex()
+
+def audit_moderator(entry):
+    """Who made an audit log entry, for log fields"""
+    if entry is None:
+        return "Unknown"
+    return f"{entry.user or f'<@{entry.user_id}>'} ({entry.user_id})"
+
+@bot.listen('on_audit_log_entry_create')
+async def index_audit_log_entry(entry):
+    audit_log_index.add(entry)
+
+async def log_member_kick(payload):
+    """Log kicks, which only differ from a leave by their audit log entry"""
+    guild = bot.get_guild(payload.guild_id)
+    if guild is None:
+        return
+    member = payload.user  # A plain user when the member wasn't cached
+    # Every leave would cost a poll, so only pushed entries are used here
+    entry = await audit_log_index.find(guild, discord.AuditLogAction.kick, member.id, poll=False)
+    if entry is None:
+        return
+    await send_log(
+        guild,
+        "Member Kicked",
+        f"{member.name} was kicked",
+        color=discord.Color.orange(),
+        user=member,
+        additional_fields=[
+            {"name": "Kicked By", "value": audit_moderator(entry), "inline": True},
+            {"name": "Reason", "value": entry.reason or "No reason given", "inline": False}
+        ]
+    )
+
+# The moderation log handlers near the top were registered on the first bot instance
+for listener in (on_member_ban, on_guild_channel_create, on_guild_channel_delete, on_guild_role_create, on_guild_role_delete):
+    bot.add_listener(listener)
+bot.add_listener(log_member_kick, 'on_raw_member_remove')
+
+#start
+if __name__ == "__main__":
+    # Get token from environment variable or user input
+    bot_token = os.getenv('DISCORD_BOT_TOKEN')
+    
+    if not bot_token:
+        bot_token = input("Enter your Discord bot token: ").strip()
+        
+        if not bot_token:
+            print("No token provided. Exiting...")
+            exit(1)
+    
+    try:
+        warn_uncached_listeners(bot)
+        
+        # Wrap handlers for metrics before connecting
+        instrument_bot(bot)
+        
+        # Warm member data from the last run instead of chunking every guild
+        if MEMBER_SNAPSHOT:
+            load_member_snapshots()
+        
         # Run the bot
         bot.run(bot_token)
     except discord.LoginFailure:
@@ -2320,4 +6666,6 @@ if __name__ == "__main__":
     except Exception as e:
         print(f"An error occurred: {e}")
     finally:
+        if MEMBER_SNAPSHOT:
+            flush_member_snapshots()
         print("Bot has been shut down.")
\ No newline at end of file